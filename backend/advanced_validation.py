@@ -2,9 +2,11 @@
 Advanced Validation Rules and Custom Validators
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple
 from datetime import datetime, date
 from decimal import Decimal
+from expressions import CompiledExpression, ExpressionError, ExpressionBudgetExceeded, compile_expression
+from safe_regex import RegexError, UnsafePatternError, pattern_problems, safe_match
 import re
 import logging
 
@@ -43,16 +45,20 @@ class StringValidationRule(ValidationRule):
                 result['valid'] = False
                 result['errors'].append(f"Maximum length is {self.config['max_length']} characters")
         
-        # Pattern validation (regex)
+        # Pattern validation (regex, vetted and bounded)
         if 'pattern' in self.config:
             try:
-                if not re.match(self.config['pattern'], str_value):
+                if not safe_match(self.config['pattern'], str_value):
                     error_msg = self.config.get('pattern_error', 'Value does not match required pattern')
                     result['valid'] = False
                     result['errors'].append(error_msg)
-            except re.error:
+            except UnsafePatternError as e:
+                logger.warning(str(e))
                 result['valid'] = False
                 result['errors'].append('Invalid pattern configuration')
+            except RegexError as e:
+                result['valid'] = False
+                result['errors'].append(f'Value could not be checked against the pattern: {e}')
         
         # Email validation
         if self.config.get('format') == 'email':
@@ -218,14 +224,62 @@ class FileValidationRule(ValidationRule):
         return result
 
 class CustomValidationRule(ValidationRule):
-    """Custom validation using JavaScript-like expressions"""
+    """Custom validation using safe expressions (see expressions.py)"""
     
-    def validate(self, value: Any) -> Dict[str, Any]:
+    def rules(self) -> List[Dict[str, Any]]:
+        """Configured rules as a list of {'expression', 'message'} objects"""
+        if not self.config:
+            return []
+        if isinstance(self.config, dict):
+            return [self.config]
+        return list(self.config)
+    
+    def compile(self) -> List[Tuple[CompiledExpression, str]]:
+        """
+        Compile the configured expressions (cached by expression text)
+        
+        Returns:
+            List of (compiled expression, error message); raises ExpressionError
+            for malformed rules
+        """
+        compiled = []
+        for rule in self.rules():
+            if not isinstance(rule, dict) or not isinstance(rule.get('expression'), str):
+                raise ExpressionError("Custom rules need an 'expression' string")
+            message = rule.get('message') or f"Condition not met: {rule['expression']}"
+            compiled.append((compile_expression(rule['expression']), message))
+        return compiled
+    
+    def validate(self, value: Any, values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         result = {'valid': True, 'errors': []}
         
-        # This would implement custom validation logic
-        # For now, return valid
-        # In production, this could evaluate custom expressions safely
+        try:
+            compiled = self.compile()
+        except ExpressionError as e:
+            result['valid'] = False
+            result['errors'].append(f"Invalid custom rule: {e}")
+            return result
+        
+        for expression, message in compiled:
+            missing = [reference for reference in expression.references if reference not in (values or {})]
+            if missing:
+                # The other fields' values are not known (e.g. /api/validate-field), not checked
+                logger.debug(f"Custom rule {expression.source!r} not checked, missing values of {missing}")
+                continue
+            try:
+                passed = bool(expression.evaluate(values, value))
+            except ExpressionBudgetExceeded:
+                logger.warning(f"Custom rule exceeded its evaluation budget: {expression.source}")
+                result['valid'] = False
+                result['errors'].append('Custom rule could not be evaluated')
+                continue
+            except ExpressionError as e:
+                # Values of the wrong type (e.g. text where a date is expected)
+                passed = False
+                logger.debug(f"Custom rule {expression.source!r} failed: {e}")
+            if not passed:
+                result['valid'] = False
+                result['errors'].append(message)
         
         return result
 
@@ -249,13 +303,15 @@ class AdvancedValidator:
             logger.warning(f"Unknown validation rule type: {rule_type}")
             return None
     
-    def validate_value(self, value: Any, validation_config: Dict[str, Any]) -> Dict[str, Any]:
+    def validate_value(self, value: Any, validation_config: Dict[str, Any],
+                       values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Validate a value against multiple validation rules
         
         Args:
             value: The value to validate
             validation_config: Dictionary containing validation rules
+            values: All values of the submission by field ID, for custom rules
             
         Returns:
             Validation result with overall validity and all errors
@@ -270,13 +326,53 @@ class AdvancedValidator:
             if rule_name in self.rule_types:
                 rule = self.create_rule(rule_name, rule_config)
                 if rule:
-                    rule_result = rule.validate(value)
+                    if isinstance(rule, CustomValidationRule):
+                        rule_result = rule.validate(value, values)
+                    else:
+                        rule_result = rule.validate(value)
                     if not rule_result['valid']:
                         result['valid'] = False
                         result['errors'].extend(rule_result['errors'])
         
         return result
     
+    def custom_rule_references(self, validation_config: Optional[Dict[str, Any]]) -> Set[str]:
+        """Field IDs the custom rules of a validation config refer to; raises ExpressionError"""
+        if not validation_config or not validation_config.get('custom'):
+            return set()
+        references = set()
+        for expression, _ in CustomValidationRule('custom', validation_config['custom']).compile():
+            references |= expression.references
+        return references
+    
+    def check_custom_rules(self, validation_config: Optional[Dict[str, Any]],
+                           known_field_ids: Optional[Set[str]] = None) -> None:
+        """
+        Raise ExpressionError if the custom rules of a validation config do not compile
+        
+        Args:
+            validation_config: The field's validation config
+            known_field_ids: Existing field IDs; if given, the rules may only refer to these
+        """
+        references = self.custom_rule_references(validation_config)
+        if known_field_ids is not None:
+            unknown = sorted(references - set(known_field_ids))
+            if unknown:
+                raise ExpressionError(f"Unknown field {', '.join(unknown)} (refer to other fields as {{field-id}})")
+    
+    def pattern_problems(self, validation_config: Optional[Dict[str, Any]]) -> List[str]:
+        """Problems of the regex patterns of a validation config (empty if they are safe)"""
+        if not validation_config:
+            return []
+        patterns = [validation_config.get('pattern')]
+        if isinstance(validation_config.get('string'), dict):
+            patterns.append(validation_config['string'].get('pattern'))
+        problems = []
+        for pattern in patterns:
+            if pattern:
+                problems.extend(pattern_problems(pattern))
+        return problems
+    
     def get_validation_schema(self, field_type: str) -> Dict[str, Any]:
         """
         Get available validation options for a field type
@@ -296,6 +392,10 @@ class AdvancedValidator:
                     'pattern_error': 'Custom error message for pattern mismatch',
                     'format': 'Predefined format (email, phone, url)'
                 },
+                'custom': {
+                    'expression': 'Expression over value and other fields, e.g. date({end}) > date({start})',
+                    'message': 'Error message when the expression is false'
+                },
                 'number': {
                     'min_value': 'Minimum numeric value',
                     'max_value': 'Maximum numeric value',
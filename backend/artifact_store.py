@@ -0,0 +1,193 @@
+"""
+Memory-Mapped Render Artifact Store
+Immutable render outputs (published versions and their compressed variants)
+are appended to a local data file and located through an append-only offset
+index. Workers read them through a shared read-only memory map and hand out
+memoryview slices, so the bytes live once in the OS page cache instead of
+on every worker's heap, and survive restarts.
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from pathlib import Path
+from compression import PrecompressedPayload, compress
+from database import ROOT_DIR
+import json
+import mmap
+import os
+import threading
+import logging
+
+try:  # Serialises appends across worker processes; not available on Windows
+    import fcntl
+except ImportError:  # pragma: no cover - depends on the platform
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = Path(os.environ.get('RENDER_ARTIFACT_DIR', str(ROOT_DIR / 'render_artifacts')))
+
+DATA_FILE = 'artifacts.bin'
+INDEX_FILE = 'artifacts.idx'
+LOCK_FILE = '.lock'
+
+class ArtifactStore:
+    """Append-only blob file with an offset index, read through a memory map"""
+
+    name = 'render_artifacts'
+
+    def __init__(self, directory: Path = ARTIFACT_DIR):
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+        # key -> (offset, length), or key -> key it is an alias of
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._aliases: Dict[str, str] = {}
+        self._index_position = 0
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    @property
+    def data_path(self) -> Path:
+        return self.directory / DATA_FILE
+
+    @property
+    def index_path(self) -> Path:
+        return self.directory / INDEX_FILE
+
+    def _refresh(self) -> None:
+        # Picks up entries appended since the last call, by this or other processes
+        try:
+            with open(self.index_path, 'rb') as handle:
+                handle.seek(self._index_position)
+                data = handle.read()
+        except FileNotFoundError:
+            return
+        # A line without newline is still being written (or was torn by a crash)
+        end = data.rfind(b'\n')
+        if end < 0:
+            return
+        for line in data[:end].split(b'\n'):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping corrupt line in {self.index_path}")
+                continue
+            if len(record) == 3:
+                self._offsets[record[0]] = (record[1], record[2])
+            else:
+                self._aliases[record[0]] = record[1]
+        self._index_position += end + 1
+
+    def _view(self, offset: int, length: int) -> memoryview:
+        if self._map is None or len(self._map) < offset + length:
+            # The previous map is not closed: views handed out earlier keep it
+            # alive until they are released
+            with open(self.data_path, 'rb') as handle:
+                self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._map)[offset:offset + length]
+
+    def resolve(self, key: str) -> Optional[str]:
+        """Key holding the data of key (itself or its alias target); None if unknown"""
+        with self._lock:
+            if key not in self._offsets and key not in self._aliases:
+                self._refresh()
+            return self._aliases.get(key, key if key in self._offsets else None)
+
+    def get(self, key: str) -> Optional[memoryview]:
+        """Zero-copy view of the stored bytes, or None"""
+        resolved = self.resolve(key)
+        with self._lock:
+            if resolved is None or resolved not in self._offsets:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._view(*self._offsets[resolved])
+
+    @contextmanager
+    def _append_lock(self) -> Iterator[None]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / LOCK_FILE, 'w') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _append_index(self, records: List[list]) -> None:
+        lines = b''.join(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n' for record in records)
+        with open(self.index_path, 'ab+') as handle:
+            size = handle.seek(0, os.SEEK_END)
+            if size:
+                handle.seek(size - 1)
+                if handle.read(1) != b'\n':
+                    # Drop the torn line of an interrupted append
+                    handle.seek(0)
+                    handle.truncate(handle.read().rfind(b'\n') + 1)
+            handle.write(lines)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def put(self, key: str, body: bytes) -> memoryview:
+        """
+        Append body under key, unless key is already stored
+
+        The data is synced before its index line is written, so an indexed
+        entry is always complete.
+
+        Returns:
+            View of the stored bytes
+        """
+        with self._append_lock():
+            with self._lock:
+                self._refresh()
+                stored = key in self._offsets
+            if not stored:
+                with open(self.data_path, 'ab') as handle:
+                    offset = handle.seek(0, os.SEEK_END)
+                    handle.write(body)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                self._append_index([[key, offset, len(body)]])
+        with self._lock:
+            self._refresh()
+            return self._view(*self._offsets[key])
+
+    def alias(self, key: str, target: str) -> None:
+        """Make key resolve to the data of the stored key target"""
+        with self._append_lock():
+            with self._lock:
+                self._refresh()
+                known = key in self._aliases or key in self._offsets
+            if not known:
+                self._append_index([[key, target]])
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"name": self.name, "hits": self.hits, "misses": self.misses,
+                    "entries": len(self._offsets) + len(self._aliases)}
+
+class StoredPayload(PrecompressedPayload):
+    """Payload served from the artifact store, whose compressed variants are stored alongside it"""
+
+    def __init__(self, store: ArtifactStore, key: str, body: memoryview, media_type: str = 'application/json'):
+        super().__init__(body, media_type)
+        self.store = store
+        self.key = key
+
+    def encoded(self, encoding: str) -> memoryview:
+        variant = f"{self.key}#{encoding}"
+        body = self.store.get(variant)
+        if body is None:
+            body = put_artifact(self.store, variant, compress(self.body, encoding))
+        return body
+
+def put_artifact(store: ArtifactStore, key: str, body: bytes):
+    """Store body; on I/O errors (e.g. a full disk) log and return body itself"""
+    try:
+        return store.put(key, body)
+    except OSError as e:
+        logger.error(f"Cannot write render artifact {key} to {store.directory}: {e}")
+        return body
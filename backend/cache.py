@@ -0,0 +1,183 @@
+"""
+In-process caches with cross-process invalidation
+Every worker keeps its own cache and watches a generation counter stored in
+the shared database, so no external cache service is required
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import CacheGeneration
+import asyncio
+import os
+import threading
+import time
+import weakref
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Scope bumped by every catalogue write (templates, fields, texts)
+CATALOGUE = 'catalogue'
+
+# Upper bound in seconds for how long a worker may serve entries after
+# another worker committed a write
+POLL_INTERVAL_SECONDS = float(os.environ.get('CACHE_POLL_INTERVAL_SECONDS', '1.0'))
+
+# Weak, so caches of discarded app instances (e.g. in tests) are not kept alive
+_caches: 'weakref.WeakSet[GenerationCache]' = weakref.WeakSet()
+
+def read_generation(db: Session, name: str = CATALOGUE) -> int:
+    """Read the current generation of a cache scope (0 if never bumped)"""
+    generation = db.query(CacheGeneration.generation).filter(CacheGeneration.name == name).scalar()
+    return generation or 0
+
+def bump_generation(db: Session, name: str = CATALOGUE) -> None:
+    """
+    Increment the generation of a cache scope and drop local entries
+    
+    Args:
+        db: Database session, committed by this call
+        name: Cache scope to invalidate
+    """
+    updated = db.query(CacheGeneration).filter(CacheGeneration.name == name).update(
+        {
+            CacheGeneration.generation: CacheGeneration.generation + 1,
+            CacheGeneration.updated_at: datetime.utcnow()
+        },
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(CacheGeneration(name=name, generation=1))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker created the row concurrently, increment theirs
+        db.rollback()
+        bump_generation(db, name)
+        return
+    
+    for cache in list(_caches):
+        if cache.scope == name:
+            cache.invalidate()
+
+class GenerationCache:
+    """LRU cache whose entries are only served while the scope's generation is unchanged"""
+    
+    def __init__(self, name: str, scope: str = CATALOGUE, max_entries: int = 256,
+                 poll_interval: Optional[float] = None):
+        self.name = name
+        self.scope = scope
+        self.max_entries = max_entries
+        self.poll_interval = POLL_INTERVAL_SECONDS if poll_interval is None else poll_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[int, Any]]' = OrderedDict()
+        self._generation: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # Computations in progress for get_or_compute_async by (key, generation);
+        # only touched from the event loop
+        self._inflight: Dict[Tuple[Hashable, int], 'asyncio.Future[Any]'] = {}
+        _caches.add(self)
+    
+    def current_generation(self, db: Session) -> int:
+        """
+        Return the scope's generation, re-reading it from the database at
+        most once per poll interval
+        """
+        now = time.monotonic()
+        if self._generation is not None and now - self._checked_at < self.poll_interval:
+            return self._generation
+        
+        generation = read_generation(db, self.scope)
+        with self._lock:
+            if generation != self._generation:
+                if self._entries:
+                    logger.debug(f"Cache {self.name}: generation {self._generation} -> {generation}, dropping entries")
+                self._entries.clear()
+                self._generation = generation
+            self._checked_at = now
+        return generation
+    
+    def get(self, db: Session, key: Hashable) -> Tuple[bool, Any]:
+        """Return (hit, value) for a key"""
+        generation = self.current_generation(db)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+    
+    def set(self, key: Hashable, value: Any, generation: int) -> None:
+        """Store a value computed from data of the given generation"""
+        with self._lock:
+            if generation != self._generation:
+                # A write happened while the value was computed
+                return
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def get_or_compute(self, db: Session, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for key, computing and storing it on a miss"""
+        generation = self.current_generation(db)
+        hit, value = self.get(db, key)
+        if hit:
+            return value
+        value = compute()
+        self.set(key, value, generation)
+        return value
+    
+    async def get_or_compute_async(self, db: Session, key: Hashable,
+                                   compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        get_or_compute for computations awaited elsewhere, e.g. on the offload executor
+        
+        Concurrent misses for the same key and generation share one
+        computation; it runs to completion even if the caller that started
+        it goes away, so compute must not use that caller's resources (e.g.
+        its database session).
+        """
+        generation = self.current_generation(db)
+        hit, value = self.get(db, key)
+        if hit:
+            return value
+        flight = (key, generation)
+        task = self._inflight.get(flight)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._inflight[flight] = task
+            
+            def finished(task: 'asyncio.Future[Any]') -> None:
+                self._inflight.pop(flight, None)
+                if not task.cancelled() and task.exception() is None:
+                    self.set(key, task.result(), generation)
+            
+            task.add_done_callback(finished)
+        return await asyncio.shield(task)
+    
+    def invalidate(self) -> None:
+        """Drop all entries and force a generation re-read on next access"""
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+def all_caches() -> List[GenerationCache]:
+    """Return every cache created in this process"""
+    return list(_caches)
@@ -0,0 +1,283 @@
+"""
+Diff-based Change Log
+Creates store a snapshot of the entity, updates only a JSON Patch of the
+changed attributes (with the previous values, so diffs can be reversed).
+Full states are reconstructed by replaying an entity's history.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime
+from enum import Enum
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import (Field, Template, ChangeLogEntry, EntityCheckpoint, get_multilanguage_text,
+                      get_template_field_ids)
+from json_patch import JsonPatchError, apply_patch
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marks entries written in the diff format; entries without it are legacy
+# request payloads and are returned as stored
+CHANGES_FORMAT = 'diff'
+
+# A full-state checkpoint is written after this many change-log entries of an entity
+CHECKPOINT_INTERVAL = int(os.environ.get('CHANGELOG_CHECKPOINT_INTERVAL', '50'))
+
+FIELD_ATTRIBUTES = ('type', 'visibility', 'requirement', 'validation', 'select_type', 'options', 'document_mode',
+                    'document_constraints', 'role_config', 'customer_specific', 'dependencies')
+TEMPLATE_ATTRIBUTES = ('role_config', 'customer_specific')
+
+def _plain(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+def snapshot_field(db: Session, field: Field) -> Dict[str, Any]:
+    """Full, JSON-serialisable state of a field as tracked by the change log"""
+    state = {attribute: _plain(getattr(field, attribute)) for attribute in FIELD_ATTRIBUTES}
+    state['name'] = get_multilanguage_text(db, "field_name", field.id)
+    state['visible_for_customers'] = sorted(field.visible_for_customers)
+    return state
+
+def snapshot_template(db: Session, template: Template) -> Dict[str, Any]:
+    """Full, JSON-serialisable state of a template as tracked by the change log"""
+    state = {attribute: getattr(template, attribute) for attribute in TEMPLATE_ATTRIBUTES}
+    state['name'] = get_multilanguage_text(db, "template_name", template.id)
+    state['description'] = get_multilanguage_text(db, "template_description", template.id)
+    # Template fields are unordered; sorting keeps reorderings out of the diff
+    state['fields'] = sorted(get_template_field_ids(db, template.id))
+    state['visible_for_customers'] = sorted(template.visible_for_customers)
+    return state
+
+def _escape(token: str) -> str:
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+def diff_values(old: Any, new: Any, path: str = '') -> List[Dict[str, Any]]:
+    """
+    Compute a JSON Patch turning old into new
+
+    Objects are compared key by key and lists element by element after
+    stripping their common prefix and suffix, so inserting or removing one
+    option of a long list yields a single operation. Replace and remove
+    operations carry the previous value under 'old'.
+
+    Args:
+        old: Previous value
+        new: New value
+        path: JSON Pointer of the compared values
+
+    Returns:
+        List of patch operations (empty if the values are equal)
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = []
+        for key, value in old.items():
+            if key not in new:
+                operations.append({'op': 'remove', 'path': f"{path}/{_escape(key)}", 'old': value})
+            else:
+                operations.extend(diff_values(value, new[key], f"{path}/{_escape(key)}"))
+        for key, value in new.items():
+            if key not in old:
+                operations.append({'op': 'add', 'path': f"{path}/{_escape(key)}", 'value': value})
+        return operations
+    if isinstance(old, list) and isinstance(new, list):
+        prefix = 0
+        limit = min(len(old), len(new))
+        while prefix < limit and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+        old_middle = old[prefix:len(old) - suffix]
+        new_middle = new[prefix:len(new) - suffix]
+        operations = []
+        common = min(len(old_middle), len(new_middle))
+        for offset in range(common):
+            operations.extend(diff_values(old_middle[offset], new_middle[offset], f"{path}/{prefix + offset}"))
+        # Removals from the back keep the remaining indexes valid
+        for offset in reversed(range(common, len(old_middle))):
+            operations.append({'op': 'remove', 'path': f"{path}/{prefix + offset}", 'old': old_middle[offset]})
+        for offset in range(common, len(new_middle)):
+            operations.append({'op': 'add', 'path': f"{path}/{prefix + offset}", 'value': new_middle[offset]})
+        return operations
+    return [{'op': 'replace', 'path': path, 'value': new, 'old': old}]
+
+def snapshot_changes(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Change log payload of a created (or otherwise fully recorded) entity"""
+    return {'format': CHANGES_FORMAT, 'snapshot': state}
+
+def diff_changes(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """Change log payload of an update: only the changed attributes"""
+    return {'format': CHANGES_FORMAT, 'diff': diff_values(before, after)}
+
+def apply_changes(state: Optional[Dict[str, Any]], action: str, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Advance an entity state by one change log entry
+
+    Args:
+        state: State before the entry (None if unknown or not yet created)
+        action: 'created', 'updated' or 'deleted'
+        changes: The entry's stored changes
+
+    Returns:
+        State after the entry (None once deleted)
+    """
+    changes = changes or {}
+    if action == 'deleted':
+        return None
+    if changes.get('format') == CHANGES_FORMAT:
+        if 'snapshot' in changes:
+            return changes['snapshot']
+        if state is None:
+            return None
+        try:
+            return apply_patch(state, changes.get('diff', []))
+        except JsonPatchError as e:
+            logger.warning(f"Change log diff does not apply to the reconstructed state: {e}")
+            return None
+    # Legacy entries stored the request payload: the full payload on create,
+    # the changed attributes (and possibly partial name translations) on update
+    if action == 'created':
+        return dict(changes)
+    if state is None:
+        return None
+    merged = dict(state)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict) and key in ('name', 'description'):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+def reconstruct(entries: Iterable[ChangeLogEntry]) -> Optional[Dict[str, Any]]:
+    """Replay one entity's entries (oldest first) and return the resulting state"""
+    state = None
+    for entry in entries:
+        state = apply_changes(state, entry.action, entry.changes)
+    return state
+
+def expand_entries(db: Session, entries: List[ChangeLogEntry], archive=None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Reconstruct the full entity state after each of the given entries
+
+    Like state_as_of, each entity's replay starts from its latest checkpoint
+    not after the earliest given entry.
+    
+    Args:
+        db: Database session
+        entries: Entries to expand
+        archive: ChangeLogArchive holding the entities' older history, if compaction is used
+
+    Returns:
+        Dictionary entry ID -> state after the entry (None after deletes or
+        when the history is incomplete)
+    """
+    # Earliest and latest wanted timestamp per entity
+    bounds: Dict[str, List[datetime]] = {}
+    for entry in entries:
+        if entry.entity_id not in bounds:
+            bounds[entry.entity_id] = [entry.timestamp, entry.timestamp]
+        else:
+            bounds[entry.entity_id][0] = min(bounds[entry.entity_id][0], entry.timestamp)
+            bounds[entry.entity_id][1] = max(bounds[entry.entity_id][1], entry.timestamp)
+
+    wanted = {entry.id for entry in entries}
+    states: Dict[str, Optional[Dict[str, Any]]] = {}
+    for entity_id, (earliest, until) in bounds.items():
+        checkpoint = latest_checkpoint(db, entity_id, earliest)
+        query = db.query(ChangeLogEntry).filter(
+            ChangeLogEntry.entity_id == entity_id,
+            ChangeLogEntry.timestamp <= until
+        )
+        if checkpoint is not None:
+            query = query.filter(ChangeLogEntry.timestamp > checkpoint.timestamp)
+            # The checkpoint holds the state after the entry it was taken at
+            for entry in entries:
+                if entry.entity_id == entity_id and entry.timestamp == checkpoint.timestamp:
+                    states[entry.id] = checkpoint.state
+        history = query.order_by(ChangeLogEntry.timestamp.asc()).all()
+        if archive is not None:
+            in_table = {entry.id for entry in history}
+            history = [entry for entry in archive.entity_history(entity_id, until)
+                       if entry.id not in in_table
+                       and (checkpoint is None or entry.timestamp > checkpoint.timestamp)] + history
+        state = checkpoint.state if checkpoint is not None else None
+        for entry in history:
+            state = apply_changes(state, entry.action, entry.changes)
+            if entry.id in wanted:
+                states[entry.id] = state
+    return states
+
+def latest_checkpoint(db: Session, entity_id: str, at: Optional[datetime] = None) -> Optional[EntityCheckpoint]:
+    """Most recent checkpoint of an entity, optionally not later than at"""
+    query = db.query(EntityCheckpoint).filter(EntityCheckpoint.entity_id == entity_id)
+    if at is not None:
+        query = query.filter(EntityCheckpoint.timestamp <= at)
+    return query.order_by(EntityCheckpoint.timestamp.desc()).first()
+
+def maybe_checkpoint(db: Session, entity_type: str, entity_id: str, timestamp: datetime,
+                     state: Optional[Dict[str, Any]], interval: Optional[int] = None) -> bool:
+    """
+    Add a checkpoint with state if interval entries were logged since the last one
+
+    The entry at timestamp must already be flushed. The caller commits.
+
+    Returns:
+        True if a checkpoint was added
+    """
+    if interval is None:
+        interval = CHECKPOINT_INTERVAL
+    checkpoint = latest_checkpoint(db, entity_id)
+    query = db.query(func.count(ChangeLogEntry.id)).filter(ChangeLogEntry.entity_id == entity_id)
+    if checkpoint is not None:
+        query = query.filter(ChangeLogEntry.timestamp > checkpoint.timestamp)
+    if query.scalar() < interval:
+        return False
+    db.add(EntityCheckpoint(entity_type=entity_type, entity_id=entity_id, timestamp=timestamp, state=state))
+    return True
+
+def state_as_of(db: Session, entity_type: str, entity_id: str, at: datetime, archive=None) -> Dict[str, Any]:
+    """
+    Reconstruct an entity as it was at a point in time
+
+    Starts from the latest checkpoint not after at and replays only the
+    entries logged since, so at most CHECKPOINT_INTERVAL entries are read
+    for entities with checkpoints.
+
+    Args:
+        db: Database session
+        entity_type: 'field' or 'template'
+        entity_id: Entity ID
+        at: Point in time (naive UTC, like the change-log timestamps)
+        archive: ChangeLogArchive with history moved out of the table
+
+    Returns:
+        Dictionary with 'state' (None if the entity did not exist), 'checkpoint'
+        (timestamp of the starting checkpoint or None) and 'replayed_entries'
+    """
+    checkpoint = latest_checkpoint(db, entity_id, at)
+    query = db.query(ChangeLogEntry).filter(
+        ChangeLogEntry.entity_type == entity_type,
+        ChangeLogEntry.entity_id == entity_id,
+        ChangeLogEntry.timestamp <= at
+    )
+    if checkpoint is not None:
+        query = query.filter(ChangeLogEntry.timestamp > checkpoint.timestamp)
+    entries = query.order_by(ChangeLogEntry.timestamp.asc()).all()
+    if archive is not None:
+        in_table = {entry.id for entry in entries}
+        archived = [entry for entry in archive.entity_history(entity_id, at)
+                    if entry.id not in in_table and entry.entity_type == entity_type
+                    and (checkpoint is None or entry.timestamp > checkpoint.timestamp)]
+        entries = archived + entries
+
+    state = checkpoint.state if checkpoint is not None else None
+    for entry in entries:
+        state = apply_changes(state, entry.action, entry.changes)
+    return {
+        "state": state,
+        "checkpoint": checkpoint.timestamp if checkpoint is not None else None,
+        "replayed_entries": len(entries)
+    }
@@ -0,0 +1,332 @@
+"""
+Change-Log Retention and Archival
+Moves change-log entries older than the retention period out of the
+change_logs table into monthly gzip JSONL segments on local disk. A JSON
+index records each segment's time range and entity types, and a sidecar
+file per segment its entity IDs, so archived history stays queryable
+without scanning unrelated segments.
+"""
+
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy.orm import Session
+from database import ROOT_DIR, ChangeLogEntry, EntityCheckpoint
+from changelog import latest_checkpoint, state_as_of
+import asyncio
+import gzip
+import json
+import os
+import logging
+
+try:  # Serialises compaction across worker processes; not available on Windows
+    import fcntl
+except ImportError:  # pragma: no cover - depends on the platform
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Entries older than this many days are archived; 0 keeps everything in the table
+RETENTION_DAYS = int(os.environ.get('CHANGELOG_RETENTION_DAYS', '0'))
+ARCHIVE_DIR = Path(os.environ.get('CHANGELOG_ARCHIVE_DIR', str(ROOT_DIR / 'changelog_archive')))
+COMPACTION_INTERVAL_SECONDS = float(os.environ.get('CHANGELOG_COMPACTION_INTERVAL_SECONDS', '3600'))
+COMPACTION_BATCH_SIZE = int(os.environ.get('CHANGELOG_COMPACTION_BATCH_SIZE', '5000'))
+
+DELETE_CHUNK_SIZE = 1000
+
+INDEX_FILE = 'index.json'
+IDS_SUFFIX = '.ids'
+LOCK_FILE = '.lock'
+
+def _file_key(path: Path) -> Optional[Tuple[int, int, int]]:
+    # Changes with every rewrite (files are replaced, not modified in place)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def _replace_file(path: Path, text: str) -> None:
+    # Replaced atomically, so readers never see a partial file
+    temporary = path.with_name(f"{path.name}.tmp")
+    temporary.write_text(text)
+    os.replace(temporary, path)
+
+def _iso(timestamp: datetime) -> str:
+    # Fixed precision keeps the strings comparable in timestamp order
+    return timestamp.isoformat(timespec='microseconds')
+
+def _entry_record(entry: ChangeLogEntry) -> Dict[str, Any]:
+    return {
+        "id": entry.id,
+        "entity_type": entry.entity_type,
+        "entity_id": entry.entity_id,
+        "action": entry.action,
+        "changes": entry.changes,
+        "user_id": entry.user_id,
+        "user_name": entry.user_name,
+        "timestamp": _iso(entry.timestamp)
+    }
+
+def _record_entry(record: Dict[str, Any]) -> ChangeLogEntry:
+    # Transient instance: never added to a session
+    return ChangeLogEntry(**{**record, "timestamp": datetime.fromisoformat(record["timestamp"])})
+
+class ChangeLogArchive:
+    """Monthly gzip JSONL segments of archived change-log entries plus their index"""
+
+    def __init__(self, directory: Path = ARCHIVE_DIR):
+        self.directory = Path(directory)
+        # Parsed index and segment entity IDs, reused while their files are unchanged
+        self._index_cache: Optional[Tuple[Tuple[int, int, int], Dict[str, Any]]] = None
+        self._ids_cache: Dict[str, Tuple[Tuple[int, int, int], FrozenSet[str]]] = {}
+
+    @property
+    def index_path(self) -> Path:
+        return self.directory / INDEX_FILE
+
+    def _read_index(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.index_path.read_text())
+        except FileNotFoundError:
+            return {"segments": {}}
+
+    def load_index(self) -> Dict[str, Any]:
+        """
+        Return the index ({'segments': {month: {...}}}); empty if nothing was archived
+
+        The parsed index is cached while the file is unchanged and must not
+        be modified.
+        """
+        key = _file_key(self.index_path)
+        if key is None:
+            return {"segments": {}}
+        cached = self._index_cache
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        index = self._read_index()
+        self._index_cache = (key, index)
+        return index
+
+    def segment_entity_ids(self, segment: Dict[str, Any]) -> Optional[FrozenSet[str]]:
+        """IDs of the entities archived in a segment (cached); None if unknown"""
+        if "entity_ids" in segment:
+            # Index written before the sidecar files, converted by the next append
+            return frozenset(segment["entity_ids"])
+        if "ids_file" not in segment:
+            return None
+        path = self.directory / segment["ids_file"]
+        key = _file_key(path)
+        if key is None:
+            logger.warning(f"Change-log archive file {path} is missing, segment is not filtered by entity")
+            return None
+        cached = self._ids_cache.get(segment["ids_file"])
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        ids = frozenset(path.read_text().splitlines())
+        self._ids_cache[segment["ids_file"]] = (key, ids)
+        return ids
+
+    @contextmanager
+    def lock(self) -> Iterator[bool]:
+        """Exclusive, non-blocking archive lock; yields False if another process holds it"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / LOCK_FILE, 'w') as handle:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def append(self, entries: List[ChangeLogEntry]) -> None:
+        """
+        Append entries to their monthly segments
+
+        Each call adds one gzip member per touched segment. Bytes beyond the
+        size recorded in the index (left by an interrupted append) are
+        truncated first. Must be called while holding lock().
+        """
+        # Read afresh, the cached index is shared with readers
+        index = self._read_index()
+        by_month: Dict[str, List[ChangeLogEntry]] = {}
+        for entry in entries:
+            by_month.setdefault(entry.timestamp.strftime('%Y-%m'), []).append(entry)
+
+        for month, month_entries in sorted(by_month.items()):
+            segment = index["segments"].setdefault(month, {
+                "file": f"{month}.jsonl.gz", "ids_file": f"{month}{IDS_SUFFIX}", "bytes": 0, "count": 0,
+                "first": None, "last": None, "entity_types": {}
+            })
+            path = self.directory / segment["file"]
+            lines = ''.join(json.dumps(_entry_record(entry), separators=(',', ':')) + '\n' for entry in month_entries)
+            with open(path, 'ab') as handle:
+                handle.truncate(segment["bytes"])
+                handle.write(gzip.compress(lines.encode('utf-8')))
+                handle.flush()
+                os.fsync(handle.fileno())
+                segment["bytes"] = handle.tell()
+
+            timestamps = [_iso(entry.timestamp) for entry in month_entries]
+            segment["count"] += len(month_entries)
+            segment["first"] = min([segment["first"]] + timestamps if segment["first"] else timestamps)
+            segment["last"] = max([segment["last"]] + timestamps if segment["last"] else timestamps)
+            legacy = segment.pop("entity_ids", None)
+            ids_path = self.directory / segment.setdefault("ids_file", f"{month}{IDS_SUFFIX}")
+            if legacy is not None:
+                entity_ids = set(legacy)
+            elif ids_path.exists():
+                entity_ids = set(ids_path.read_text().splitlines())
+            elif segment["count"] > len(month_entries):
+                # Lost sidecar of an existing segment: recover the IDs from its entries
+                entity_ids = {record["entity_id"] for record in self._read_segment(segment)}
+            else:
+                entity_ids = set()
+            entity_ids |= {entry.entity_id for entry in month_entries}
+            # Written before the index: extra IDs after a crash only cost a segment read
+            _replace_file(ids_path, ''.join(f"{entity_id}\n" for entity_id in sorted(entity_ids)))
+            for entry in month_entries:
+                segment["entity_types"][entry.entity_type] = segment["entity_types"].get(entry.entity_type, 0) + 1
+
+        _replace_file(self.index_path, json.dumps(index, sort_keys=True))
+
+    def _read_segment(self, segment: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        path = self.directory / segment["file"]
+        try:
+            with open(path, 'rb') as raw:
+                data = raw.read(segment["bytes"])
+            for line in gzip.decompress(data).decode('utf-8').splitlines():
+                yield json.loads(line)
+        except (OSError, EOFError, ValueError) as e:
+            logger.error(f"Cannot read change-log archive segment {path}: {e}")
+
+    def read(self, entity_type: Optional[str] = None, entity_id: Optional[str] = None,
+             limit: Optional[int] = None, until: Optional[datetime] = None) -> List[ChangeLogEntry]:
+        """
+        Read archived entries, newest first
+
+        Segments are visited newest first and skipped via the index when they
+        cannot contain matching entries, so reading stops as soon as limit
+        entries were found.
+        """
+        segments = self.load_index()["segments"]
+        result: List[ChangeLogEntry] = []
+        # An interrupted compaction can archive an entry twice
+        seen = set()
+        for month in sorted(segments, reverse=True):
+            segment = segments[month]
+            if entity_id is not None:
+                entity_ids = self.segment_entity_ids(segment)
+                if entity_ids is not None and entity_id not in entity_ids:
+                    continue
+            if entity_type is not None and entity_type not in segment["entity_types"]:
+                continue
+            if until is not None and segment["first"] > _iso(until):
+                continue
+            matches = [
+                record for record in self._read_segment(segment)
+                if record["id"] not in seen
+                and (entity_id is None or record["entity_id"] == entity_id)
+                and (entity_type is None or record["entity_type"] == entity_type)
+                and (until is None or record["timestamp"] <= _iso(until))
+            ]
+            matches = list({record["id"]: record for record in matches}.values())
+            seen.update(record["id"] for record in matches)
+            matches.sort(key=lambda record: record["timestamp"], reverse=True)
+            result.extend(_record_entry(record) for record in matches)
+            if limit is not None and len(result) >= limit:
+                return result[:limit]
+        return result
+
+    def entity_history(self, entity_id: str, until: Optional[datetime] = None) -> List[ChangeLogEntry]:
+        """Archived entries of one entity, oldest first"""
+        return list(reversed(self.read(entity_id=entity_id, until=until)))
+
+def write_boundary_checkpoints(db: Session, batch: List[ChangeLogEntry]) -> None:
+    """
+    Checkpoint every entity of a batch at its last entry before the batch is archived
+
+    The history left in the table then starts at a checkpoint, so current and
+    recent states are reconstructed without reading the archive.
+    """
+    last: Dict[str, ChangeLogEntry] = {}
+    for entry in batch:
+        if entry.entity_id not in last or entry.timestamp >= last[entry.entity_id].timestamp:
+            last[entry.entity_id] = entry
+    for entity_id, entry in last.items():
+        checkpoint = latest_checkpoint(db, entity_id, entry.timestamp)
+        if checkpoint is not None and checkpoint.timestamp == entry.timestamp:
+            continue
+        state = state_as_of(db, entry.entity_type, entity_id, entry.timestamp)["state"]
+        if state is None and entry.action != 'deleted':
+            # Incomplete (legacy) history: no state worth recording
+            continue
+        db.add(EntityCheckpoint(entity_type=entry.entity_type, entity_id=entity_id,
+                                timestamp=entry.timestamp, state=state))
+    db.flush()
+
+def compact_changelog(db: Session, archive: ChangeLogArchive, retention_days: int = RETENTION_DAYS,
+                      batch_size: int = COMPACTION_BATCH_SIZE, now: Optional[datetime] = None) -> int:
+    """
+    Move entries older than retention_days from the table into the archive
+
+    Runs in batches; each batch is written to disk before its rows are
+    deleted, so an interrupted run at worst archives some entries twice
+    (readers drop the duplicates).
+
+    Returns:
+        Number of entries moved, or -1 if another process is compacting
+    """
+    if retention_days <= 0:
+        return 0
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    moved = 0
+    with archive.lock() as acquired:
+        if not acquired:
+            return -1
+        while True:
+            batch = db.query(ChangeLogEntry).filter(ChangeLogEntry.timestamp < cutoff).order_by(
+                ChangeLogEntry.timestamp.asc()
+            ).limit(batch_size).all()
+            if not batch:
+                break
+            write_boundary_checkpoints(db, batch)
+            archive.append(batch)
+            ids = [entry.id for entry in batch]
+            # Chunked to stay below SQL Server's parameter limit
+            for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+                db.query(ChangeLogEntry).filter(
+                    ChangeLogEntry.id.in_(ids[start:start + DELETE_CHUNK_SIZE])
+                ).delete(synchronize_session=False)
+            db.commit()
+            db.expunge_all()
+            moved += len(batch)
+
+    if moved:
+        logger.info(f"Archived {moved} change-log entries older than {_iso(cutoff)}")
+    return moved
+
+async def run_compaction_loop(session_factory, archive: ChangeLogArchive,
+                              interval: float = COMPACTION_INTERVAL_SECONDS) -> None:
+    """Background task compacting the change log every interval seconds"""
+
+    def compact_once() -> int:
+        db = session_factory()
+        try:
+            return compact_changelog(db, archive)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, compact_once)
+        except Exception as e:
+            logger.error(f"Change-log compaction failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,156 @@
+"""
+HTTP Response Compression
+gzip (and brotli, when installed) compression with content negotiation and a
+size threshold, plus precompressed payloads for cached responses
+"""
+
+from typing import Dict, Optional, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+import gzip
+import os
+import logging
+
+try:  # Optional: better ratios than gzip for repetitive JSON
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies below this size are sent uncompressed
+MINIMUM_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Encodings this process can produce, in order of preference"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the response encoding for an Accept-Encoding header
+
+    Args:
+        accept_encoding: Header value, e.g. "gzip, br;q=0.9"
+
+    Returns:
+        Best supported encoding the client accepts, or None for identity
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress body with gzip or br"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 keeps the output deterministic, so equal bodies give equal bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+def _is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+class BufferResponse(Response):
+    """Response accepting a memoryview body (e.g. a slice of a memory map), which is sent without copying"""
+
+    def render(self, content) -> bytes:
+        if isinstance(content, memoryview):
+            return content
+        return super().render(content)
+
+class PrecompressedPayload:
+    """Serialised response body that keeps its compressed variants, so each is computed once"""
+
+    def __init__(self, body: bytes, media_type: str = 'application/json', minimum_size: Optional[int] = None):
+        self.body = body
+        self.media_type = media_type
+        self.minimum_size = MINIMUM_SIZE if minimum_size is None else minimum_size
+        self._encoded: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        # Concurrent first requests may both compress; the results are identical
+        if encoding not in self._encoded:
+            self._encoded[encoding] = compress(self.body, encoding)
+        return self._encoded[encoding]
+
+    def response(self, accept_encoding: Optional[str]) -> Response:
+        """Response with the best variant the client accepts"""
+        encoding = choose_encoding(accept_encoding) if len(self.body) >= self.minimum_size else None
+        if encoding is None:
+            return BufferResponse(content=self.body, media_type=self.media_type)
+        return BufferResponse(content=self.encoded(encoding), media_type=self.media_type,
+                        headers={'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON and text responses
+
+    Responses that are streamed (more than one body message), already
+    encoded or smaller than minimum_size are passed through unchanged.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = MINIMUM_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        pending = {'start': None}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                # Held back until the first body message shows whether to compress
+                pending['start'] = message
+                return
+            start = pending['start']
+            if message['type'] != 'http.response.body' or start is None:
+                await send(message)
+                return
+            pending['start'] = None
+
+            headers = MutableHeaders(scope=start)
+            body = message.get('body', b'')
+            if (message.get('more_body', False) or 'content-encoding' in headers
+                    or len(body) < self.minimum_size or not _is_compressible(headers.get('content-type'))):
+                await send(start)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(compressed))
+            headers.add_vary_header('Accept-Encoding')
+            await send(start)
+            await send({'type': 'http.response.body', 'body': compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,211 @@
+"""
+Dependency Conditions
+Compiles Field.dependencies into short-circuiting predicates. A dependency
+list is an implicit AND of its items; an item is either a condition
+{"field_id", "operator", "condition_value"} or a group {"all": [...]},
+{"any": [...]} or {"not": item}. Conditions and groups are normalised to a
+canonical key, so within one render (one memo dict) every distinct
+sub-expression is evaluated once, however many fields share it.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from functools import lru_cache
+from safe_regex import RegexError, safe_match
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = ('equals', 'not_equals', 'in', 'not_in', 'contains', 'greater_than', 'less_than', 'regex_match',
+             'is_empty', 'is_not_empty')
+GROUP_KEYS = ('all', 'any', 'not')
+
+class ConditionError(ValueError):
+    """Malformed dependency structure"""
+
+def evaluate_condition(condition: Dict[str, Any], field_values: Dict[str, Any]) -> bool:
+    """
+    Evaluate a single dependency condition
+
+    Args:
+        condition: Dictionary containing field_id, operator, and condition_value
+        field_values: Current values of all fields
+
+    Returns:
+        Boolean result of condition evaluation (False if the field has no value)
+    """
+    field_id = condition.get('field_id')
+    operator = condition.get('operator', 'equals')
+    condition_value = condition.get('condition_value')
+
+    if field_id not in field_values:
+        return False
+
+    current_value = field_values[field_id]
+
+    try:
+        if operator == 'equals':
+            return current_value == condition_value
+        elif operator == 'not_equals':
+            return current_value != condition_value
+        elif operator == 'in':
+            if isinstance(condition_value, list):
+                return current_value in condition_value
+            return False
+        elif operator == 'not_in':
+            if isinstance(condition_value, list):
+                return current_value not in condition_value
+            return True
+        elif operator == 'contains':
+            return str(condition_value).lower() in str(current_value).lower()
+        elif operator == 'greater_than':
+            return float(current_value) > float(condition_value)
+        elif operator == 'less_than':
+            return float(current_value) < float(condition_value)
+        elif operator == 'regex_match':
+            try:
+                return safe_match(str(condition_value), str(current_value))
+            except RegexError as e:
+                logger.warning(f"regex_match on field {field_id} not evaluated: {e}")
+                return False
+        elif operator == 'is_empty':
+            return not current_value or current_value == ''
+        elif operator == 'is_not_empty':
+            return bool(current_value) and current_value != ''
+        else:
+            logger.warning(f"Unknown operator: {operator}")
+            return False
+
+    except (ValueError, TypeError) as e:
+        logger.error(f"Error evaluating condition: {e}")
+        return False
+
+# Canonical form: ('cond', field_id, operator, condition_value), ('all', children),
+# ('any', children), ('not', child) or ('const', bool)
+def normalise(item: Any) -> Tuple:
+    """
+    Canonical form of a dependency list or item
+
+    Nested groups of the same kind are flattened, single-child groups
+    collapse to their child, double negation cancels and empty groups become
+    constants (an empty "all" is true, an empty "any" is false).
+    """
+    if isinstance(item, list):
+        return make_group('all', [normalise(child) for child in item])
+    if not isinstance(item, dict):
+        raise ConditionError(f"Dependency items must be objects, got {type(item).__name__}")
+    groups = [key for key in GROUP_KEYS if key in item]
+    if len(groups) > 1 or groups and 'field_id' in item:
+        raise ConditionError("A dependency item is either a condition or one group (all, any, not)")
+    if groups:
+        kind = groups[0]
+        children = item[kind]
+        if kind == 'not':
+            return negate(normalise(children))
+        if not isinstance(children, list):
+            raise ConditionError(f"'{kind}' must be a list of dependency items")
+        return make_group(kind, [normalise(child) for child in children])
+    if not isinstance(item.get('field_id'), str) or not item['field_id']:
+        raise ConditionError("A condition needs a field_id")
+    operator = item.get('operator', 'equals')
+    if not isinstance(operator, str):
+        raise ConditionError("The operator of a condition must be a string")
+    return ('cond', item['field_id'], operator, item.get('condition_value'))
+
+def negate(node: Tuple) -> Tuple:
+    """Canonical form of the negation of a canonical form"""
+    if node[0] == 'not':
+        return node[1]
+    if node[0] == 'const':
+        return ('const', not node[1])
+    return ('not', node)
+
+def make_group(kind: str, children: List[Tuple]) -> Tuple:
+    """Canonical form of an 'all' or 'any' group of canonical forms"""
+    identity, absorbing = (True, False) if kind == 'all' else (False, True)
+    flat = []
+    for child in children:
+        if child[0] == kind:
+            flat.extend(child[1])
+        elif child[0] == 'const':
+            if child[1] == absorbing:
+                return ('const', absorbing)
+        elif child not in flat:
+            flat.append(child)
+    if not flat:
+        return ('const', identity)
+    if len(flat) == 1:
+        return flat[0]
+    return (kind, tuple(flat))
+
+def denormalise(node: Tuple) -> Any:
+    """Dependency item of a canonical form (inverse of normalise up to normalisation)"""
+    kind = node[0]
+    if kind == 'cond':
+        return {'field_id': node[1], 'operator': node[2], 'condition_value': node[3]}
+    if kind == 'const':
+        return {'all': []} if node[1] else {'any': []}
+    if kind == 'not':
+        return {'not': denormalise(node[1])}
+    return {kind: [denormalise(child) for child in node[1]]}
+
+# Predicates take the field values and the render's memo dict
+Predicate = Callable[[Dict[str, Any], Dict[str, bool]], bool]
+
+def always(field_values: Dict[str, Any], memo: Dict[str, bool]) -> bool:
+    return True
+
+def never(field_values: Dict[str, Any], memo: Dict[str, bool]) -> bool:
+    return False
+
+def _key(node: Tuple) -> str:
+    return json.dumps(node, separators=(',', ':'), sort_keys=True, default=str)
+
+def _memoised(key: str, compute: Predicate) -> Predicate:
+    def predicate(field_values, memo):
+        result = memo.get(key)
+        if result is None:
+            result = memo[key] = compute(field_values, memo)
+        return result
+    return predicate
+
+def compile_node(node: Tuple) -> Predicate:
+    """Short-circuiting predicate of a canonical form"""
+    kind = node[0]
+    if kind == 'const':
+        return always if node[1] else never
+    if kind == 'cond':
+        condition = denormalise(node)
+        return _memoised(_key(node), lambda field_values, memo: evaluate_condition(condition, field_values))
+    if kind == 'not':
+        child = compile_node(node[1])
+        return _memoised(_key(node), lambda field_values, memo: not child(field_values, memo))
+
+    children = [compile_node(child) for child in node[1]]
+    if kind == 'all':
+        def compute(field_values, memo):
+            for child in children:
+                if not child(field_values, memo):
+                    return False
+            return True
+    else:
+        def compute(field_values, memo):
+            for child in children:
+                if child(field_values, memo):
+                    return True
+            return False
+    return _memoised(_key(node), compute)
+
+@lru_cache(maxsize=4096)
+def _compile_source(source: str) -> Predicate:
+    return compile_node(normalise(json.loads(source)))
+
+def compile_dependencies(dependencies: Optional[Any]) -> Predicate:
+    """
+    Predicate of a field's dependencies (cached by their JSON form)
+
+    Raises ConditionError if the dependencies are malformed.
+    """
+    if not dependencies:
+        return always
+    return _compile_source(json.dumps(dependencies, separators=(',', ':'), sort_keys=True, default=str))
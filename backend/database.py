@@ -1,36 +1,137 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Text, Boolean, Integer, Float, ForeignKey, Table, JSON
+from sqlalchemy import create_engine, Column, String, DateTime, Text, Boolean, Integer, Float, ForeignKey, Table, JSON, Index, LargeBinary, or_, select, false, text, inspect, event, update
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import sessionmaker, Session, relationship, deferred, undefer_group, load_only, lazyload
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.types import TypeDecorator, TEXT
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 import uuid
 from datetime import datetime
+from typing import Any, Callable
 import json
+import logging
+
+try:  # Optional, several times faster than the standard library for large option lists
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# SQL Server / SQLite Connection (configurable)
-database_url = os.environ.get('DATABASE_URL') or os.environ.get('SQL_SERVER_CONNECTION_STRING')
-engine = create_engine(database_url, echo=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# SQL Server / SQLite Connection (configurable). The default engine is
+# created on first use, so importing this module needs no configured database.
+_engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+def configured_database_url():
+    return os.environ.get('DATABASE_URL') or os.environ.get('SQL_SERVER_CONNECTION_STRING')
+
+def make_engine(url: str, **kwargs):
+    """
+    Create an engine for a database URL
+    
+    In-memory SQLite databases get a single shared connection, so every
+    session (and thread) sees the same database.
+    """
+    kwargs.setdefault('echo', os.environ.get('SQL_ECHO', 'false').lower() == 'true')
+    if url.startswith('sqlite') and (url.rstrip('/') in ('sqlite:', 'sqlite:/') or ':memory:' in url):
+        kwargs.setdefault('poolclass', StaticPool)
+        kwargs.setdefault('connect_args', {'check_same_thread': False})
+    elif not url.startswith('sqlite'):
+        kwargs.setdefault('pool_size', int(os.environ.get('DB_POOL_SIZE', '5')))
+        kwargs.setdefault('max_overflow', int(os.environ.get('DB_MAX_OVERFLOW', '10')))
+    return create_engine(url, **kwargs)
+
+def configure_engine(new_engine) -> None:
+    """Use new_engine as the default engine (and bind SessionLocal to it)"""
+    global _engine
+    _engine = new_engine
+    SessionLocal.configure(bind=new_engine)
+
+def get_engine():
+    """Return the default engine, creating it from DATABASE_URL on first use"""
+    if _engine is None:
+        url = configured_database_url()
+        if not url:
+            raise RuntimeError("DATABASE_URL is not configured")
+        configure_engine(make_engine(url))
+    return _engine
+
+def __getattr__(name):
+    # Keep `database.engine` working for scripts while creating it lazily
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# JSON codecs for JSONType: name -> (dumps returning str, loads accepting str)
+_json_codecs = {
+    'json': (lambda value: json.dumps(value, separators=(',', ':')), json.loads)
+}
+
+def _orjson_dumps(value) -> str:
+    try:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        # e.g. integers beyond 64 bit, which the standard library still handles
+        return _json_codecs['json'][0](value)
+
+if orjson is not None:
+    _json_codecs['orjson'] = (_orjson_dumps, orjson.loads)
+
+def register_json_codec(name: str, dumps: Callable[[Any], str], loads: Callable[[str], Any]) -> None:
+    """Make a JSON codec available to set_json_codec() / JSON_CODEC"""
+    _json_codecs[name] = (dumps, loads)
+
+def set_json_codec(name: str) -> None:
+    """
+    Select the codec used by every JSONType column
+    
+    Args:
+        name: Registered codec name, or 'auto' for orjson when installed
+    """
+    global _json_dumps, _json_loads, json_codec_name
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in _json_codecs else 'json'
+    if name not in _json_codecs:
+        raise ValueError(f"Unknown JSON codec '{name}'. Available: {', '.join(sorted(_json_codecs))}")
+    _json_dumps, _json_loads = _json_codecs[name]
+    json_codec_name = name
+
+set_json_codec(os.environ.get('JSON_CODEC', 'auto'))
+
+# Most JSON columns hold one of these; they are answered without running the codec.
+# Factories, because callers may mutate the decoded value
+_EMPTY_JSON_VALUES = {'{}': dict, '[]': list, 'null': lambda: None}
+
 # Custom JSON type for SQLite compatibility
 class JSONType(TypeDecorator):
     impl = TEXT
+    cache_ok = True
 
     def process_bind_param(self, value, dialect):
-        if value is not None:
-            return json.dumps(value)
-        return value
+        if value is None:
+            return value
+        if not value and isinstance(value, (dict, list)):
+            return '{}' if isinstance(value, dict) else '[]'
+        return _json_dumps(value)
 
     def process_result_value(self, value, dialect):
-        if value is not None:
-            return json.loads(value)
-        return value
+        if value is None:
+            return value
+        empty = _EMPTY_JSON_VALUES.get(value)
+        if empty is not None:
+            return empty()
+        return _json_loads(value)
+
+# Deferred Field columns only needed to serialise a field
+FIELD_PAYLOAD = 'field_payload'
 
 # Use JSONType for both SQLite and SQL Server compatibility
 # Association table for template-field many-to-many relationship
@@ -41,6 +142,23 @@ template_fields = Table(
     Column('field_id', String(36), ForeignKey('fields.id'), primary_key=True)
 )
 
+# Customer visibility association tables. The composite primary key serves
+# lookups by entity, the (customer_id, entity) index serves "what can
+# customer X see" lookups without scanning every row.
+class FieldCustomer(Base):
+    __tablename__ = 'field_customers'
+    __table_args__ = (Index('ix_field_customers_customer', 'customer_id', 'field_id'),)
+
+    field_id = Column(String(36), ForeignKey('fields.id', ondelete='CASCADE'), primary_key=True)
+    customer_id = Column(String(100), primary_key=True)
+
+class TemplateCustomer(Base):
+    __tablename__ = 'template_customers'
+    __table_args__ = (Index('ix_template_customers_customer', 'customer_id', 'template_id'),)
+
+    template_id = Column(String(36), ForeignKey('templates.id', ondelete='CASCADE'), primary_key=True)
+    customer_id = Column(String(100), primary_key=True)
+
 class MultiLanguageText(Base):
     __tablename__ = 'multilanguage_texts'
     
@@ -50,6 +168,7 @@ class MultiLanguageText(Base):
     language_code = Column(String(2), nullable=False)  # 'de', 'fr', 'it'
     text_value = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    row_version = Column(Integer, index=True)
 
 class Template(Base):
     __tablename__ = 'templates'
@@ -61,12 +180,19 @@ class Template(Base):
     
     # Customer-specific configuration
     customer_specific = Column(Boolean, default=False)
-    visible_for_customers = Column(JSONType, default=list)  # List of customer IDs
+    # Legacy JSON list of customer IDs, moved to the association table by migration 0002
+    legacy_visible_for_customers = deferred(Column('visible_for_customers', JSONType))
+    customer_links = relationship("TemplateCustomer", cascade="all, delete-orphan", lazy="selectin")
+    visible_for_customers = association_proxy(
+        'customer_links', 'customer_id', creator=lambda customer_id: TemplateCustomer(customer_id=customer_id)
+    )
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
     created_by = Column(String(100))
     updated_by = Column(String(100))
+    # Assigned on every insert and update, see assign_row_versions()
+    row_version = Column(Integer, index=True)
     
     # Relationships
     fields = relationship("Field", secondary=template_fields, back_populates="templates")
@@ -81,35 +207,52 @@ class Field(Base):
     visibility = Column(String(20), default='editable')  # 'visible', 'editable'
     requirement = Column(String(20), default='optional')  # 'optional', 'required'
     
-    # Validation rules stored as JSON
-    validation = Column(JSONType, default=dict)
+    # Validation rules stored as JSON. Like options and document_constraints it is
+    # only needed for fields that end up in a response, so the three columns are
+    # deferred as the FIELD_PAYLOAD group and not decoded while filtering
+    validation = deferred(Column(JSONType, default=dict), group=FIELD_PAYLOAD)
     
     # Select field properties
     select_type = Column(String(20))  # 'radio', 'multiple'
-    options = Column(JSONType, default=list)  # List of select options with multilang labels
+    options = deferred(Column(JSONType, default=list), group=FIELD_PAYLOAD)  # List of select options with multilang labels
     
     # Document field properties
     document_mode = Column(String(50))  # 'download', 'download_upload', etc.
-    document_constraints = Column(JSONType, default=dict)
+    document_constraints = deferred(Column(JSONType, default=dict), group=FIELD_PAYLOAD)
     
     # Role-based configuration
     role_config = Column(JSONType, default=dict)
     
     # Customer-specific visibility
     customer_specific = Column(Boolean, default=False)
-    visible_for_customers = Column(JSONType, default=list)
+    # Legacy JSON list of customer IDs, moved to the association table by migration 0002
+    legacy_visible_for_customers = deferred(Column('visible_for_customers', JSONType))
+    customer_links = relationship("FieldCustomer", cascade="all, delete-orphan", lazy="selectin")
+    visible_for_customers = association_proxy(
+        'customer_links', 'customer_id', creator=lambda customer_id: FieldCustomer(customer_id=customer_id)
+    )
     
     # Dependencies stored as JSON
     dependencies = Column(JSONType, default=list)
+    # Dependencies as evaluated by renders: statically decided conditions folded
+    # (dependency_analysis.plan_dependencies); NULL until analysed
+    dependency_plan = Column(JSONType)
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
+    row_version = Column(Integer, index=True)
     
     # Relationships
     templates = relationship("Template", secondary=template_fields, back_populates="fields")
 
+def with_field_payload():
+    """Loader option undeferring the FIELD_PAYLOAD columns, for queries serialising fields"""
+    return undefer_group(FIELD_PAYLOAD)
+
 class ChangeLogEntry(Base):
     __tablename__ = 'change_logs'
+    # Per-entity reads: checkpoint counts, point-in-time states, replays
+    __table_args__ = (Index('ix_change_logs_entity_timestamp', 'entity_id', 'timestamp'),)
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     entity_type = Column(String(20), nullable=False)  # 'template' or 'field'
@@ -120,17 +263,217 @@ class ChangeLogEntry(Base):
     user_name = Column(String(200), nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
-# Database dependency for FastAPI
+class EntityCheckpoint(Base):
+    __tablename__ = 'entity_checkpoints'
+    __table_args__ = (Index('ix_entity_checkpoints_entity_timestamp', 'entity_id', 'timestamp'),)
+    
+    # Full entity state after the change-log entry at `timestamp`, written every
+    # CHECKPOINT_INTERVAL changes and at archive boundaries, so that historical
+    # states are rebuilt from a bounded number of entries
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    entity_type = Column(String(20), nullable=False)
+    entity_id = Column(String(36), nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    state = Column(JSONType)  # None: the entity was deleted
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TemplateVersion(Base):
+    __tablename__ = 'template_versions'
+    
+    # Immutable snapshot of a template and its fields taken by publishing. No
+    # foreign key: published versions outlive edits and deletion of the template
+    template_id = Column(String(36), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    snapshot = Column(JSONType, nullable=False)  # {'template': {...}, 'fields': {field_id: {...}}}
+    customers = Column(JSONType, default=list)  # Customers with an own render artifact
+    published_at = Column(DateTime, default=datetime.utcnow)
+    published_by = Column(String(100))
+
+class RenderArtifact(Base):
+    __tablename__ = 'render_artifacts'
+    
+    # Serialised render response of a published version, precomputed per
+    # role, customer and language. '' stands for "no customer" and "all
+    # languages", so the whole key is the primary key
+    template_id = Column(String(36), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    role = Column(String(20), primary_key=True)
+    customer_id = Column(String(100), primary_key=True)
+    language = Column(String(2), primary_key=True)
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CacheGeneration(Base):
+    __tablename__ = 'cache_generations'
+    
+    # One counter per cache scope (e.g. 'catalogue'), bumped by every write so
+    # that all worker processes can detect stale in-process caches
+    name = Column(String(50), primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class SyncTombstone(Base):
+    __tablename__ = 'sync_tombstones'
+    
+    # Deleted template, field or text, so that delta syncs can drop it from
+    # client-side mirrors
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    entity_type = Column(String(20), nullable=False)  # 'template', 'field', 'text'
+    entity_id = Column(String(36), nullable=False)
+    row_version = Column(Integer, nullable=False, index=True)
+
+# Row versions: one counter (in cache_generations) shared by all synced
+# tables. It is incremented inside the writing transaction, so concurrent
+# writers are serialised on its row and versions become visible in order.
+ROW_VERSION_COUNTER = 'row_version'
+SYNC_ENTITY_TYPES = {'Template': 'template', 'Field': 'field', 'MultiLanguageText': 'text'}
+
+def current_row_version(db: Session) -> int:
+    """Highest row version assigned so far (0 if nothing was written)"""
+    version = db.query(CacheGeneration.generation).filter(CacheGeneration.name == ROW_VERSION_COUNTER).scalar()
+    return version or 0
+
+def next_row_version(session: Session) -> int:
+    """Increment the row version counter in the session's transaction and return the new version"""
+    connection = session.connection()
+    updated = connection.execute(
+        update(CacheGeneration.__table__).where(CacheGeneration.name == ROW_VERSION_COUNTER).values(
+            generation=CacheGeneration.generation + 1, updated_at=datetime.utcnow()
+        )
+    ).rowcount
+    if not updated:
+        connection.execute(CacheGeneration.__table__.insert().values(
+            name=ROW_VERSION_COUNTER, generation=1, updated_at=datetime.utcnow()
+        ))
+    return connection.execute(
+        select(CacheGeneration.generation).where(CacheGeneration.name == ROW_VERSION_COUNTER)
+    ).scalar()
+
+@event.listens_for(Session, 'before_flush')
+def assign_row_versions(session: Session, flush_context, instances) -> None:
+    """Stamp inserted and updated synced rows with the next row version and record tombstones for deletes"""
+    changed = [obj for obj in list(session.new) + list(session.dirty)
+               if type(obj).__name__ in SYNC_ENTITY_TYPES and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if type(obj).__name__ in SYNC_ENTITY_TYPES]
+    if not changed and not deleted:
+        return
+    version = next_row_version(session)
+    for obj in changed:
+        obj.row_version = version
+    with session.no_autoflush:
+        for obj in deleted:
+            session.add(SyncTombstone(entity_type=SYNC_ENTITY_TYPES[type(obj).__name__], entity_id=obj.id,
+                                      row_version=version))
+            if isinstance(obj, Field):
+                # Removing a field changes the field list of its templates
+                for template in obj.templates:
+                    if template not in session.deleted:
+                        template.row_version = version
+
+# Database dependency for FastAPI (apps with an injected engine override it)
 def get_db():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-# Create all tables
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+# Create all tables directly from the models (tests and scratch databases;
+# deployed databases are managed by the Alembic migrations in migrations/)
+def create_tables(bind=None):
+    Base.metadata.create_all(bind=bind or get_engine())
+
+# Alembic head revision; bump together with every new file in migrations/versions
+SCHEMA_REVISION = '0008'
+
+# Newest table (or 'table.column' / 'table.index') of each revision, used to stamp databases
+# created by create_all() before migrations existed
+_REVISION_MARKER_TABLES = [('0008', 'change_logs.ix_change_logs_entity_timestamp'), ('0007', 'fields.dependency_plan'), ('0006', 'sync_tombstones'), ('0005', 'render_artifacts'), ('0004', 'entity_checkpoints'), ('0003', 'cache_generations'), ('0002', 'field_customers'), ('0001', 'templates')]
+
+def current_schema_revision(bind=None):
+    """Return the revision recorded in alembic_version (None if not under migration control)"""
+    with (bind or get_engine()).connect() as conn:
+        try:
+            return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+        except (OperationalError, ProgrammingError):
+            return None
+
+def run_migrations(bind=None, revision: str = 'head'):
+    """Upgrade the database to the given revision (default: latest) with Alembic"""
+    # Alembic is only needed when the schema is outdated, keep it off the startup path
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(ROOT_DIR / 'alembic.ini'))
+    config.set_main_option('script_location', str(ROOT_DIR / 'migrations'))
+    with (bind or get_engine()).begin() as conn:
+        config.attributes['connection'] = conn
+        tables = set(inspect(conn).get_table_names())
+        if 'alembic_version' not in tables:
+            for stamp_revision, marker in _REVISION_MARKER_TABLES:
+                table, _, name = marker.partition('.')
+                if table in tables and (not name or name in {c['name'] for c in inspect(conn).get_columns(table)}
+                                        | {i['name'] for i in inspect(conn).get_indexes(table)}):
+                    logger.info(f"Stamping pre-migration database as revision {stamp_revision}")
+                    command.stamp(config, stamp_revision)
+                    break
+        command.upgrade(config, revision)
+
+def ensure_schema(bind=None) -> bool:
+    """
+    Make sure the schema is at SCHEMA_REVISION
+    
+    A single SELECT when the database is current; migrations only run otherwise.
+    Returns True if migrations were applied.
+    """
+    if current_schema_revision(bind) == SCHEMA_REVISION:
+        return False
+    run_migrations(bind)
+    return True
+
+def get_visible_field_ids(db: Session, customer_id: str, field_ids: list) -> set:
+    """Return the subset of field_ids explicitly visible for a customer (index lookup)"""
+    if not field_ids:
+        return set()
+    rows = db.execute(
+        select(FieldCustomer.field_id).where(
+            FieldCustomer.customer_id == customer_id,
+            FieldCustomer.field_id.in_(field_ids)
+        )
+    )
+    return {row[0] for row in rows}
+
+def query_fields_for_customer(db: Session, customer_id: str):
+    """Query for all fields a customer can see: shared fields plus the customer's own"""
+    linked = select(FieldCustomer.field_id).where(FieldCustomer.customer_id == customer_id)
+    return db.query(Field).filter(or_(
+        Field.customer_specific == false(),
+        Field.customer_specific.is_(None),
+        Field.id.in_(linked)
+    ))
+
+def query_templates_for_customer(db: Session, customer_id: str):
+    """Query for all templates a customer can see: shared templates plus the customer's own"""
+    linked = select(TemplateCustomer.template_id).where(TemplateCustomer.customer_id == customer_id)
+    return db.query(Template).filter(or_(
+        Template.customer_specific == false(),
+        Template.customer_specific.is_(None),
+        Template.id.in_(linked)
+    ))
+
+def load_field_payload(db: Session, fields: list) -> None:
+    """Load the deferred FIELD_PAYLOAD columns of already loaded fields with one query"""
+    missing = [f.id for f in fields if 'options' in inspect(f).unloaded]
+    if missing:
+        db.query(Field).filter(Field.id.in_(missing)).options(
+            load_only(Field.validation, Field.options, Field.document_constraints), lazyload(Field.customer_links)
+        ).all()
+
+def get_template_field_ids(db: Session, template_id: str) -> list:
+    """Return the IDs of a template's fields without loading the Field rows"""
+    rows = db.execute(select(template_fields.c.field_id).where(template_fields.c.template_id == template_id))
+    return [row[0] for row in rows]
 
 # Helper functions for multilanguage text management
 def get_multilanguage_text(db: Session, entity_type: str, entity_id: str) -> dict:
@@ -146,13 +489,64 @@ def get_multilanguage_text(db: Session, entity_type: str, entity_id: str) -> dic
     
     return result
 
+def get_multilanguage_texts(db: Session, entity_type: str, entity_ids: list) -> dict:
+    """Get all language variants of many entities with one query, keyed by entity ID"""
+    result = {entity_id: {} for entity_id in entity_ids}
+    if not entity_ids:
+        return result
+    rows = db.execute(
+        select(MultiLanguageText.entity_id, MultiLanguageText.language_code, MultiLanguageText.text_value).where(
+            MultiLanguageText.entity_type == entity_type,
+            MultiLanguageText.entity_id.in_(entity_ids)
+        )
+    )
+    for entity_id, language_code, text_value in rows:
+        result[entity_id][language_code] = text_value
+    return result
+
+def resolve_multilanguage_texts(db: Session, entity_type: str, entity_ids: list, languages: list) -> dict:
+    """
+    Get one text per entity in the first of languages that has a non-empty value
+    
+    Only the preferred language is queried for all entities; each fallback
+    language is queried for the entities still missing a text.
+    
+    Returns:
+        Dictionary entity ID -> text ('' if no language has one)
+    """
+    result = {}
+    missing = list(dict.fromkeys(entity_ids))
+    for language_code in languages:
+        if not missing:
+            break
+        rows = db.execute(
+            select(MultiLanguageText.entity_id, MultiLanguageText.text_value).where(
+                MultiLanguageText.entity_type == entity_type,
+                MultiLanguageText.language_code == language_code,
+                MultiLanguageText.entity_id.in_(missing),
+                MultiLanguageText.text_value != ''
+            )
+        )
+        for entity_id, text_value in rows:
+            result[entity_id] = text_value
+        missing = [entity_id for entity_id in missing if entity_id not in result]
+    for entity_id in missing:
+        result[entity_id] = ''
+    return result
+
+def delete_multilanguage_texts(db: Session, entity_types: list, entity_id: str) -> None:
+    """Delete an entity's texts (ORM deletes, so that they leave sync tombstones)"""
+    for ml_text in db.query(MultiLanguageText).filter(
+        MultiLanguageText.entity_type.in_(entity_types),
+        MultiLanguageText.entity_id == entity_id
+    ).all():
+        db.delete(ml_text)
+
 def set_multilanguage_text(db: Session, entity_type: str, entity_id: str, texts: dict):
     """Set multilanguage texts for an entity"""
     # Delete existing texts
-    db.query(MultiLanguageText).filter(
-        MultiLanguageText.entity_type == entity_type,
-        MultiLanguageText.entity_id == entity_id
-    ).delete()
+    delete_multilanguage_texts(db, [entity_type], entity_id)
+    db.flush()
     
     # Insert new texts
     for lang_code, text_value in texts.items():
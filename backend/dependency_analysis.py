@@ -0,0 +1,219 @@
+"""
+Dependency Rule Analysis
+Static checks of Field.dependencies, run when fields and templates are
+saved. Conditions that can never hold (a value that is not among the
+controlling select field's options, an unknown operator or field, an invalid
+pattern, contradicting conditions) are reported and folded to false,
+tautologies to true. The folded rules are stored as Field.dependency_plan,
+which is what renders evaluate.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import Text, select, type_coerce
+from sqlalchemy.orm import Session, lazyload, undefer
+from database import Field, template_fields
+from conditions import OPERATORS, GROUP_KEYS, ConditionError, normalise, negate, make_group, denormalise
+from safe_regex import pattern_problems
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Severities: 'error' conditions were folded to a constant, 'warning' ones are kept
+ERROR = 'error'
+WARNING = 'warning'
+
+def referenced_field_ids(dependencies: Any) -> Set[str]:
+    """IDs of the fields a dependency list refers to (malformed items are skipped)"""
+    found = set()
+    pending = [dependencies]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, list):
+            pending.extend(item)
+        elif isinstance(item, dict):
+            if isinstance(item.get('field_id'), str):
+                found.add(item['field_id'])
+            pending.extend(item[key] for key in GROUP_KEYS if key in item)
+    return found
+
+def _issue(path: str, code: str, message: str, severity: str = ERROR) -> Dict[str, str]:
+    return {'path': path, 'code': code, 'severity': severity, 'message': message}
+
+def _option_values(field: Field) -> Optional[List[Any]]:
+    # Only single-choice select fields hold exactly one of their option values
+    if field.type != 'select' or field.select_type == 'multiple' or not field.options:
+        return None
+    return [option.get('value') for option in field.options if isinstance(option, dict)]
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _check_condition(node: Tuple, path: str, fields: Dict[str, Field], template_field_ids: Optional[Set[str]],
+                     issues: List[Dict[str, str]]) -> Tuple:
+    _, field_id, operator, value = node
+    if operator not in OPERATORS:
+        issues.append(_issue(path, 'unknown_operator', f"Unknown operator {operator!r}, the condition is never met"))
+        return ('const', False)
+    field = fields.get(field_id)
+    if field is None:
+        issues.append(_issue(path, 'unknown_field', f"Field {field_id} does not exist, the condition is never met"))
+        return ('const', False)
+    if template_field_ids is not None and field_id not in template_field_ids:
+        issues.append(_issue(path, 'outside_template', f"Field {field_id} is not part of the template",
+                             WARNING))
+    if operator == 'regex_match':
+        problems = pattern_problems(str(value))
+        if problems:
+            # Not run at render time either, see safe_regex.safe_match
+            issues.append(_issue(path, 'invalid_pattern', f"Pattern rejected: {'; '.join(problems)}"))
+            return ('const', False)
+    if operator in ('greater_than', 'less_than') and _number(value) is None:
+        issues.append(_issue(path, 'not_a_number', f"{value!r} is not a number, the condition is never met"))
+        return ('const', False)
+    if operator == 'in' and not isinstance(value, list):
+        issues.append(_issue(path, 'not_a_list', "'in' needs a list of values, the condition is never met"))
+        return ('const', False)
+
+    options = _option_values(field)
+    if options is not None:
+        if operator == 'equals' and value not in options:
+            issues.append(_issue(path, 'not_an_option', f"{value!r} is not an option of field {field_id}"))
+            return ('const', False)
+        if operator == 'in' and not any(item in options for item in value):
+            issues.append(_issue(path, 'not_an_option', f"None of {value!r} is an option of field {field_id}"))
+            return ('const', False)
+    return node
+
+def _contradiction(first: Tuple, second: Tuple) -> bool:
+    """True if two conditions can never hold at the same time"""
+    if first == negate(second):
+        return True
+    if first[0] != 'cond' or second[0] != 'cond' or first[1] != second[1]:
+        return False
+    for (_, _, operator, value), (_, _, other, other_value) in ((first, second), (second, first)):
+        if operator == 'equals':
+            if other == 'equals' and value != other_value:
+                return True
+            if other == 'not_equals' and value == other_value:
+                return True
+            if other == 'in' and isinstance(other_value, list) and value not in other_value:
+                return True
+            if other == 'not_in' and isinstance(other_value, list) and value in other_value:
+                return True
+        if operator == 'is_empty' and other == 'is_not_empty':
+            return True
+        if operator == 'greater_than' and other == 'less_than':
+            lower, upper = _number(value), _number(other_value)
+            if lower is not None and upper is not None and lower >= upper:
+                return True
+    return False
+
+def _analyse(item: Any, path: str, fields: Dict[str, Field], template_field_ids: Optional[Set[str]],
+             issues: List[Dict[str, str]]) -> Tuple:
+    if isinstance(item, list):
+        kind, children, child_paths = 'all', item, [f"{path}/{index}" for index in range(len(item))]
+    elif isinstance(item, dict) and 'not' in item:
+        return negate(_analyse(item['not'], f"{path}/not", fields, template_field_ids, issues))
+    elif isinstance(item, dict) and ('all' in item or 'any' in item):
+        kind = 'all' if 'all' in item else 'any'
+        children = item[kind]
+        child_paths = [f"{path}/{kind}/{index}" for index in range(len(children))]
+    else:
+        return _check_condition(normalise(item), path, fields, template_field_ids, issues)
+
+    nodes = [_analyse(child, child_path, fields, template_field_ids, issues)
+             for child, child_path in zip(children, child_paths)]
+    group = make_group(kind, nodes)
+    if group[0] != kind:
+        return group
+    members = group[1]
+    for index, first in enumerate(members):
+        for second in members[index + 1:]:
+            if kind == 'all' and _contradiction(first, second):
+                issues.append(_issue(path, 'contradiction', "Contradicting conditions, never met"))
+                return ('const', False)
+            if kind == 'any' and first == negate(second):
+                issues.append(_issue(path, 'tautology', "A condition or its negation, always met"))
+                return ('const', True)
+    return group
+
+def analyse_dependencies(dependencies: Any, fields: Dict[str, Field],
+                         template_field_ids: Optional[Iterable[str]] = None
+                         ) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+    """
+    Check a field's dependencies and fold what can be decided statically
+
+    Args:
+        dependencies: The field's dependency list
+        fields: The referenced fields by ID, with their options loaded
+        template_field_ids: Fields of the template the field is checked in;
+            references outside of it are reported as warnings
+
+    Returns:
+        Tuple (plan, issues): the folded dependency list to evaluate and the
+        findings as {'path', 'code', 'severity', 'message'} with JSON
+        pointer paths into the field. Raises ConditionError for malformed
+        dependencies.
+    """
+    issues: List[Dict[str, str]] = []
+    if not dependencies:
+        return [], issues
+    # Raises ConditionError for malformed items, the analysis below relies on a valid structure
+    normalise(dependencies)
+    scope = set(template_field_ids) if template_field_ids is not None else None
+    node = _analyse(dependencies, '/dependencies', fields, scope, issues)
+    if node == ('const', True):
+        issues.append(_issue('/dependencies', 'always_met', "The dependencies are always met", WARNING))
+        return [], issues
+    if node == ('const', False):
+        issues.append(_issue('/dependencies', 'never_met', "The dependencies are never met, the field is never shown"))
+    return [denormalise(node)], issues
+
+def load_referenced_fields(db: Session, fields: Iterable[Field]) -> Dict[str, Field]:
+    """The fields referenced by the dependencies of fields, with their options"""
+    ids = set()
+    for field in fields:
+        ids |= referenced_field_ids(field.dependencies)
+    if not ids:
+        return {}
+    return {field.id: field for field in db.query(Field).options(undefer(Field.options)).filter(Field.id.in_(ids))}
+
+def plan_dependencies(db: Session, fields: List[Field],
+                      template_field_ids: Optional[Iterable[str]] = None) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Analyse fields and store their dependency plans (not committed)
+
+    Returns:
+        Issues by field ID, for fields with issues
+    """
+    referenced = load_referenced_fields(db, fields)
+    found = {}
+    for field in fields:
+        try:
+            plan, issues = analyse_dependencies(field.dependencies, referenced, template_field_ids)
+        except ConditionError as e:
+            # Stored before groups were checked on save; renders keep hiding the field
+            plan, issues = None, [_issue('/dependencies', 'malformed', str(e))]
+        if field.dependency_plan != plan:
+            field.dependency_plan = plan
+        if issues:
+            found[field.id] = issues
+    return found
+
+def dependant_fields(db: Session, field_id: str) -> List[Field]:
+    """Fields whose dependencies refer to field_id"""
+    # Textual prefilter on the stored JSON, confirmed on the decoded dependencies
+    candidates = db.query(Field).options(lazyload(Field.customer_links)).filter(
+        type_coerce(Field.dependencies, Text).like(f'%{field_id}%')
+    ).all()
+    return [field for field in candidates if field_id in referenced_field_ids(field.dependencies)]
+
+def template_scope(db: Session, field_id: str) -> Optional[Set[str]]:
+    """Fields sharing a template with field_id (None if the field is in no template)"""
+    templates = select(template_fields.c.template_id).where(template_fields.c.field_id == field_id)
+    rows = db.execute(select(template_fields.c.field_id).where(template_fields.c.template_id.in_(templates)))
+    scope = {row[0] for row in rows}
+    return scope or None
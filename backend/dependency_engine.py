@@ -5,12 +5,35 @@ Handles complex field dependencies and conditional rendering
 
 from typing import Dict, List, Any, Optional, Union
 from sqlalchemy.orm import Session
-from database import Field, Template, get_multilanguage_text
-import re
+from database import (Field, Template, get_visible_field_ids, load_field_payload, get_multilanguage_texts,
+                      resolve_multilanguage_texts)
+from conditions import ConditionError, compile_dependencies, evaluate_condition
+from safe_regex import RegexError, safe_match
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Languages tried in order when a text is missing in the requested language
+LANGUAGE_FALLBACK = [code.strip() for code in os.environ.get('RENDER_LANGUAGE_FALLBACK', 'de,fr,it').split(',')
+                     if code.strip()]
+
+def language_chain(language: str) -> List[str]:
+    """Requested language followed by the configured fallback languages"""
+    return [language] + [code for code in LANGUAGE_FALLBACK if code != language]
+
+def _project_label(label: Any, chain: List[str]) -> Any:
+    if not isinstance(label, dict):
+        return label
+    return next((label[code] for code in chain if label.get(code)), '')
+
+def _project_options(options: Optional[List[Dict[str, Any]]], chain: List[str]) -> Optional[List[Dict[str, Any]]]:
+    # New dicts: the options belong to the (possibly cached) Field instance
+    if not options:
+        return options
+    return [{**option, 'label': _project_label(option.get('label'), chain)} if isinstance(option, dict) else option
+            for option in options]
+
 class DependencyEngine:
     """Engine to process field dependencies and conditional logic"""
     
@@ -28,68 +51,34 @@ class DependencyEngine:
         Returns:
             Boolean result of condition evaluation
         """
-        field_id = condition.get('field_id')
-        operator = condition.get('operator', 'equals')
-        condition_value = condition.get('condition_value')
-        
-        if field_id not in field_values:
-            return False
-            
-        current_value = field_values[field_id]
-        
-        try:
-            if operator == 'equals':
-                return current_value == condition_value
-            elif operator == 'not_equals':
-                return current_value != condition_value
-            elif operator == 'in':
-                if isinstance(condition_value, list):
-                    return current_value in condition_value
-                return False
-            elif operator == 'not_in':
-                if isinstance(condition_value, list):
-                    return current_value not in condition_value
-                return True
-            elif operator == 'contains':
-                return str(condition_value).lower() in str(current_value).lower()
-            elif operator == 'greater_than':
-                return float(current_value) > float(condition_value)
-            elif operator == 'less_than':
-                return float(current_value) < float(condition_value)
-            elif operator == 'regex_match':
-                return bool(re.match(str(condition_value), str(current_value)))
-            elif operator == 'is_empty':
-                return not current_value or current_value == ''
-            elif operator == 'is_not_empty':
-                return current_value and current_value != ''
-            else:
-                logger.warning(f"Unknown operator: {operator}")
-                return False
-                
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error evaluating condition: {e}")
-            return False
+        return evaluate_condition(condition, field_values)
     
-    def should_show_field(self, field: Field, field_values: Dict[str, Any]) -> bool:
+    def should_show_field(self, field: Field, field_values: Dict[str, Any],
+                          memo: Optional[Dict[str, bool]] = None) -> bool:
         """
         Determine if a field should be shown based on its dependencies
         
         Args:
             field: The field to evaluate
             field_values: Current values of all fields
+            memo: Results of conditions and groups already evaluated for the
+                same field values (shared by the fields of one render)
             
         Returns:
             Boolean indicating if field should be visible
         """
-        if not field.dependencies:
+        # The analysed plan has statically decided conditions folded away
+        dependencies = field.dependency_plan if field.dependency_plan is not None else field.dependencies
+        if not dependencies:
             return True
-            
-        # If field has dependencies, all must be satisfied (AND logic)
-        for dependency in field.dependencies:
-            if not self.evaluate_condition(dependency, field_values):
-                return False
-                
-        return True
+        
+        # Top-level items must all be satisfied (AND logic), each may be an all/any/not group
+        try:
+            predicate = compile_dependencies(dependencies)
+        except ConditionError as e:
+            logger.error(f"Malformed dependencies of field {field.id}: {e}")
+            return False
+        return predicate(field_values, {} if memo is None else memo)
     
     def filter_fields_by_dependencies(self, fields: List[Field], field_values: Dict[str, Any]) -> List[Field]:
         """
@@ -103,9 +92,11 @@ class DependencyEngine:
             Filtered list of fields that should be visible
         """
         visible_fields = []
+        # Conditions shared by several fields are evaluated once
+        memo: Dict[str, bool] = {}
         
         for field in fields:
-            if self.should_show_field(field, field_values):
+            if self.should_show_field(field, field_values, memo):
                 visible_fields.append(field)
                 
         return visible_fields
@@ -162,13 +153,18 @@ class DependencyEngine:
             # Show all non-customer-specific fields
             return [f for f in fields if not f.customer_specific]
             
+        # Resolve customer visibility of all customer-specific fields with one
+        # indexed lookup instead of checking every field's customer list
+        specific_ids = [f.id for f in fields if f.customer_specific]
+        visible_ids = get_visible_field_ids(self.db, customer_id, specific_ids)
+        
         visible_fields = []
         
         for field in fields:
             if not field.customer_specific:
                 # Non-customer-specific fields are visible to all
                 visible_fields.append(field)
-            elif field.visible_for_customers and customer_id in field.visible_for_customers:
+            elif field.id in visible_ids:
                 # Customer-specific field visible to this customer
                 visible_fields.append(field)
                 
@@ -216,9 +212,14 @@ class DependencyEngine:
                     result['errors'].append(f"Maximum length is {validation['max_length']}")
                     
                 if validation.get('pattern'):
-                    if not re.match(validation['pattern'], str_value):
+                    try:
+                        if not safe_match(validation['pattern'], str_value):
+                            result['valid'] = False
+                            result['errors'].append("Value does not match required pattern")
+                    except RegexError as e:
+                        logger.warning(f"Pattern of field {field.id} not evaluated: {e}")
                         result['valid'] = False
-                        result['errors'].append("Value does not match required pattern")
+                        result['errors'].append("Value could not be checked against the pattern")
             
             # Document validation
             elif field.type == 'document' and field.document_constraints:
@@ -265,7 +266,8 @@ class DependencyEngine:
     
     def render_template_for_role(self, template: Template, role: str, 
                                 customer_id: Optional[str] = None, 
-                                field_values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                                field_values: Optional[Dict[str, Any]] = None,
+                                language: Optional[str] = None) -> Dict[str, Any]:
         """
         Render a template with all filtering and dependency logic applied
         
@@ -274,6 +276,8 @@ class DependencyEngine:
             role: User role
             customer_id: Optional customer ID
             field_values: Current field values for dependency evaluation
+            language: Render texts and option labels only in this language, falling
+                back along RENDER_LANGUAGE_FALLBACK; None renders all languages
             
         Returns:
             Rendered template with filtered fields
@@ -293,18 +297,33 @@ class DependencyEngine:
         # Apply dependency-based filtering
         fields = self.filter_fields_by_dependencies(fields, field_values)
         
+        # Only the remaining fields are serialised, decode their JSON payload in one query
+        load_field_payload(self.db, fields)
+        
+        # Texts of all fields at once: one query per language instead of one per field
+        field_ids = [field.id for field in fields]
+        if language:
+            chain = language_chain(language)
+            names = resolve_multilanguage_texts(self.db, "field_name", field_ids, chain)
+            template_name = resolve_multilanguage_texts(self.db, "template_name", [template.id], chain)[template.id]
+            description = resolve_multilanguage_texts(self.db, "template_description", [template.id], chain)[template.id]
+        else:
+            names = get_multilanguage_texts(self.db, "field_name", field_ids)
+            template_name = get_multilanguage_texts(self.db, "template_name", [template.id])[template.id]
+            description = get_multilanguage_texts(self.db, "template_description", [template.id])[template.id]
+        
         # Convert to response format with multilanguage texts
         field_responses = []
         for field in fields:
             field_dict = {
                 "id": field.id,
-                "name": get_multilanguage_text(self.db, "field_name", field.id),
+                "name": names[field.id],
                 "type": field.type,
                 "visibility": field.visibility,
                 "requirement": field.requirement,
                 "validation": field.validation,
                 "select_type": field.select_type,
-                "options": field.options,
+                "options": _project_options(field.options, chain) if language else field.options,
                 "document_mode": field.document_mode,
                 "document_constraints": field.document_constraints,
                 "dependencies": field.dependencies
@@ -313,9 +332,11 @@ class DependencyEngine:
         
         template_dict = {
             "id": template.id,
-            "name": get_multilanguage_text(self.db, "template_name", template.id),
-            "description": get_multilanguage_text(self.db, "template_description", template.id),
+            "name": template_name,
+            "description": description,
             "fields": field_responses
         }
+        if language:
+            template_dict["language"] = language
         
-        return template_dict
\ No newline at end of file
+        return template_dict
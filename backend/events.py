@@ -0,0 +1,210 @@
+"""
+Catalogue Change Events
+Server-sent events announcing committed template and field changes. While
+it has subscribers, every worker polls the row versions (see
+database.assign_row_versions), so changes committed by any worker are
+pushed; writes handled by this worker wake its poller right away. Each
+subscriber has a bounded queue: a consumer that falls behind gets a single
+'resync' event instead of an ever growing backlog.
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from database import Template, Field, MultiLanguageText, SyncTombstone, current_row_version
+import asyncio
+import json
+import os
+import weakref
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', '500'))
+QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', '100'))
+# Upper bound for how long changes committed by other workers take to be pushed
+POLL_INTERVAL_SECONDS = float(os.environ.get('EVENTS_POLL_INTERVAL_SECONDS', '1.0'))
+HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+
+# More changes than this in one poll are announced as a single resync
+POLL_BATCH_SIZE = 1000
+
+# Texts are announced as changes of the entity they belong to
+TEXT_OWNERS = {'field_name': 'field', 'template_name': 'template', 'template_description': 'template'}
+
+RESYNC = 'resync'
+
+_brokers: 'weakref.WeakSet[EventBroker]' = weakref.WeakSet()
+
+def notify_committed() -> None:
+    """Wake the pollers of this process after a committed write"""
+    for broker in list(_brokers):
+        broker.wake()
+
+class TooManySubscribers(Exception):
+    """Raised when a broker already serves its maximum number of subscribers"""
+
+def read_changes(db: Session, since: int, limit: int = POLL_BATCH_SIZE) -> Tuple[int, List[Dict[str, Any]], bool]:
+    """
+    Change events after row version since
+
+    Returns:
+        Tuple (current row version, events ordered by version with one event
+        per entity, True if more than limit rows changed)
+    """
+    version = current_row_version(db)
+    if version <= since:
+        return version, [], False
+
+    rows = []
+    truncated = False
+    queries = (
+        db.query(Template.id, Template.row_version).filter(Template.row_version > since),
+        db.query(Field.id, Field.row_version).filter(Field.row_version > since),
+        db.query(MultiLanguageText.entity_type, MultiLanguageText.entity_id, MultiLanguageText.row_version).filter(
+            MultiLanguageText.row_version > since),
+        # Deleted texts are covered by the update or deletion of their entity
+        db.query(SyncTombstone.entity_type, SyncTombstone.entity_id, SyncTombstone.row_version).filter(
+            SyncTombstone.row_version > since, SyncTombstone.entity_type != 'text'),
+    )
+    for index, query in enumerate(queries):
+        result = query.limit(limit + 1).all()
+        truncated = truncated or len(result) > limit
+        for row in result:
+            if index == 0:
+                rows.append(('template', row[0], row[1], 'updated'))
+            elif index == 1:
+                rows.append(('field', row[0], row[1], 'updated'))
+            elif index == 2:
+                if row[0] in TEXT_OWNERS:
+                    rows.append((TEXT_OWNERS[row[0]], row[1], row[2], 'updated'))
+            else:
+                rows.append((row[0], row[1], row[2], 'deleted'))
+
+    events: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for entity_type, entity_id, row_version, action in rows:
+        if row_version > version:
+            # Committed after the version was read, announced by the next poll
+            continue
+        key = (entity_type, entity_id)
+        if key not in events or events[key]['version'] < row_version:
+            events[key] = {'type': entity_type, 'id': entity_id, 'version': row_version, 'action': action}
+    return version, sorted(events.values(), key=lambda event: event['version']), truncated
+
+class EventBroker:
+    """Fans change events out to the subscribers of one worker"""
+
+    def __init__(self, session_factory: Callable[[], Session], max_subscribers: Optional[int] = None,
+                 queue_size: Optional[int] = None, poll_interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.max_subscribers = MAX_SUBSCRIBERS if max_subscribers is None else max_subscribers
+        self.queue_size = QUEUE_SIZE if queue_size is None else queue_size
+        self.poll_interval = POLL_INTERVAL_SECONDS if poll_interval is None else poll_interval
+        self.subscribers: Set[asyncio.Queue] = set()
+        # Row version up to which events were published
+        self.version = 0
+        self.published = 0
+        self.overflows = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        _brokers.add(self)
+
+    async def _run(self, function: Callable, *args):
+        # Database work happens off the event loop, in a session of its own
+        def call():
+            db = self.session_factory()
+            try:
+                return function(db, *args)
+            finally:
+                db.close()
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    async def subscribe(self) -> asyncio.Queue:
+        """Register a subscriber; raises TooManySubscribers when full"""
+        if len(self.subscribers) >= self.max_subscribers:
+            raise TooManySubscribers()
+        if self._task is None:
+            self.version = await self._run(current_row_version)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Queue event for every subscriber without waiting for any of them"""
+        self.published += 1
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: its backlog is replaced by one resync marker,
+                # upon which the client catches up through /api/sync
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({'type': RESYNC, 'version': event['version']})
+                self.overflows += 1
+
+    def wake(self) -> None:
+        """Poll now instead of after the poll interval (callable from any thread)"""
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # The loop of the last subscription is closed
+            pass
+
+    async def _poll(self) -> None:
+        try:
+            while self.subscribers:
+                self._wakeup.clear()
+                try:
+                    version, events, truncated = await self._run(read_changes, self.version)
+                    if truncated:
+                        self.publish({'type': RESYNC, 'version': version})
+                    else:
+                        for event in events:
+                            self.publish(event)
+                    self.version = max(self.version, version)
+                except Exception as e:
+                    logger.error(f"Reading catalogue changes failed: {e}")
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._task = None
+
+    def close(self) -> None:
+        """Stop polling (application shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+        self.subscribers.clear()
+
+def format_event(event: Dict[str, Any]) -> bytes:
+    """Encode an event in the text/event-stream format"""
+    name = RESYNC if event['type'] == RESYNC else 'change'
+    data = json.dumps(event, separators=(',', ':'))
+    return f"id: {event['version']}\nevent: {name}\ndata: {data}\n\n".encode('utf-8')
+
+async def event_stream(broker: EventBroker, queue: asyncio.Queue,
+                       heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[bytes]:
+    """Body of one subscriber's event stream; unsubscribes when the client disconnects"""
+    try:
+        yield f"event: ready\ndata: {json.dumps({'version': broker.version})}\n\n".encode('utf-8')
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing idle connections
+                yield b": keep-alive\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(queue)
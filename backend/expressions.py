@@ -0,0 +1,436 @@
+"""
+Safe Expression Engine
+A small expression language for cross-field validation rules such as
+"date(value) > date({start-field-id})" or "sum([{share-a-id}, {share-b-id}]) == 100".
+Expressions are parsed once (Pratt parser) into nested Python closures; no
+eval, no attribute access and only whitelisted functions. Every evaluation
+runs against a step budget, so a pathological expression cannot stall a
+worker.
+
+Syntax:
+    literals     1  2.5  'text'  "text"  true  false  null  [1, 2]
+    references   value (the validated field), {any-field-id}, or field-id for
+                 IDs that are plain identifiers
+    operators    or  and  not  ==  !=  <  <=  >  >=  in  not in  +  -  *  /  %
+                 (|| && ! are accepted as well), x[index], f(arguments)
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from datetime import date, datetime
+from functools import lru_cache
+import os
+import re
+
+MAX_STEPS = int(os.environ.get('EXPRESSION_MAX_STEPS', '10000'))
+MAX_LENGTH = 2000
+MAX_DEPTH = 50
+
+class ExpressionError(ValueError):
+    """Base class of expression errors"""
+
+class ExpressionSyntaxError(ExpressionError):
+    """The expression cannot be parsed"""
+
+class ExpressionEvaluationError(ExpressionError):
+    """The expression failed on the given values (e.g. comparing a number with text)"""
+
+class ExpressionBudgetExceeded(ExpressionEvaluationError):
+    """The evaluation needed more steps than allowed"""
+
+class _Context:
+    __slots__ = ('values', 'value', 'steps')
+
+    def __init__(self, values: Dict[str, Any], value: Any, steps: int):
+        self.values = values
+        self.value = value
+        self.steps = steps
+
+    def charge(self, steps: int = 1) -> None:
+        self.steps -= steps
+        if self.steps < 0:
+            raise ExpressionBudgetExceeded("Expression exceeded its evaluation budget")
+
+Evaluator = Callable[[_Context], Any]
+
+# Tokenizer
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<ref>\{[^{}]+\})
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>==|!=|<=|>=|&&|\|\||[<>!+\-*/%()\[\],])
+""", re.VERBOSE)
+
+_ESCAPES = {'n': '\n', 't': '\t', '\\': '\\', "'": "'", '"': '"'}
+_KEYWORDS = {'and', 'or', 'not', 'in', 'true', 'false', 'null'}
+_ALIASES = {'&&': 'and', '||': 'or', '!': 'not'}
+
+def _unescape(literal: str) -> str:
+    return re.sub(r'\\(.)', lambda match: _ESCAPES.get(match.group(1), match.group(1)), literal[1:-1])
+
+def tokenize(source: str) -> List[Tuple[str, Any, int]]:
+    """Split source into (kind, value, position) tokens, ending with ('end', None, len)"""
+    tokens = []
+    position = 0
+    while position < len(source):
+        match = _TOKEN.match(source, position)
+        if match is None:
+            raise ExpressionSyntaxError(f"Unexpected character {source[position]!r} at position {position}")
+        kind, text = match.lastgroup, match.group()
+        if kind == 'number':
+            tokens.append(('literal', float(text) if '.' in text else int(text), position))
+        elif kind == 'string':
+            tokens.append(('literal', _unescape(text), position))
+        elif kind == 'ref':
+            tokens.append(('ref', text[1:-1].strip(), position))
+        elif kind == 'name':
+            if text in _KEYWORDS:
+                tokens.append(('op', text, position))
+            else:
+                tokens.append(('name', text, position))
+        elif kind == 'op':
+            tokens.append(('op', _ALIASES.get(text, text), position))
+        position = match.end()
+    tokens.append(('end', None, len(source)))
+    return tokens
+
+# Value helpers
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _type_name(value: Any) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    if _is_number(value):
+        return 'number'
+    if isinstance(value, str):
+        return 'text'
+    if isinstance(value, list):
+        return 'list'
+    if isinstance(value, date):
+        return 'date'
+    return type(value).__name__
+
+def _size(value: Any) -> int:
+    return len(value) if isinstance(value, (str, list)) else 1
+
+def _compare(operator: str, left: Any, right: Any) -> bool:
+    comparable = ((_is_number(left) and _is_number(right)) or (isinstance(left, str) and isinstance(right, str))
+                  or (isinstance(left, date) and isinstance(right, date)))
+    if not comparable:
+        raise ExpressionEvaluationError(f"Cannot compare {_type_name(left)} {operator} {_type_name(right)}")
+    if operator == '<':
+        return left < right
+    if operator == '<=':
+        return left <= right
+    if operator == '>':
+        return left > right
+    return left >= right
+
+def _arithmetic(operator: str, left: Any, right: Any, context: _Context) -> Any:
+    if operator == '+':
+        if isinstance(left, str) and isinstance(right, str) or isinstance(left, list) and isinstance(right, list):
+            context.charge(_size(left) + _size(right))
+            return left + right
+    if operator == '-' and isinstance(left, date) and isinstance(right, date):
+        # Difference of two dates in days
+        return (left - right).days
+    if not (_is_number(left) and _is_number(right)):
+        raise ExpressionEvaluationError(f"Cannot compute {_type_name(left)} {operator} {_type_name(right)}")
+    if operator == '+':
+        return left + right
+    if operator == '-':
+        return left - right
+    if operator == '*':
+        return left * right
+    if right == 0:
+        raise ExpressionEvaluationError("Division by zero")
+    if operator == '/':
+        return left / right
+    return left % right
+
+# Whitelisted functions: name -> (minimum, maximum number of arguments, implementation)
+def _numbers(values: Any, name: str) -> List[Any]:
+    if not isinstance(values, list) or not all(_is_number(value) for value in values):
+        raise ExpressionEvaluationError(f"{name}() expects a list of numbers")
+    return values
+
+def _to_number(value: Any) -> Any:
+    if _is_number(value):
+        return value
+    try:
+        text = str(value).strip()
+        return float(text) if any(c in text for c in '.eE') else int(text)
+    except ValueError:
+        raise ExpressionEvaluationError(f"Not a number: {value!r}")
+
+def _to_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        raise ExpressionEvaluationError(f"Not a date (YYYY-MM-DD): {value!r}")
+
+def _length(value: Any) -> int:
+    if not isinstance(value, (str, list)):
+        raise ExpressionEvaluationError(f"len() expects text or a list, not {_type_name(value)}")
+    return len(value)
+
+def _extreme(name: str, pick: Callable) -> Callable:
+    def function(*arguments):
+        values = arguments[0] if len(arguments) == 1 and isinstance(arguments[0], list) else list(arguments)
+        if not values:
+            raise ExpressionEvaluationError(f"{name}() of an empty list")
+        if not (all(_is_number(v) for v in values) or all(isinstance(v, date) for v in values)):
+            raise ExpressionEvaluationError(f"{name}() expects numbers or dates")
+        return pick(values)
+    return function
+
+def _text(name: str, transform: Callable[[str], str]) -> Callable:
+    def function(value):
+        if not isinstance(value, str):
+            raise ExpressionEvaluationError(f"{name}() expects text, not {_type_name(value)}")
+        return transform(value)
+    return function
+
+def _round(value, digits=0):
+    if not _is_number(value) or not isinstance(digits, int) or not 0 <= digits <= 10:
+        raise ExpressionEvaluationError("round() expects a number and 0 to 10 digits")
+    return round(value, digits)
+
+def _contains(container, item):
+    if isinstance(container, str) and isinstance(item, str) or isinstance(container, list):
+        return item in container
+    raise ExpressionEvaluationError(f"contains() expects text or a list, not {_type_name(container)}")
+
+FUNCTIONS: Dict[str, Tuple[int, int, Callable]] = {
+    'len': (1, 1, _length),
+    'sum': (1, 1, lambda values: sum(_numbers(values, 'sum'))),
+    'min': (1, 20, _extreme('min', min)),
+    'max': (1, 20, _extreme('max', max)),
+    'abs': (1, 1, lambda value: abs(_to_number(value))),
+    'round': (1, 2, _round),
+    'number': (1, 1, _to_number),
+    'date': (1, 1, _to_date),
+    'today': (0, 0, date.today),
+    'empty': (1, 1, lambda value: value is None or value == '' or value == []),
+    'lower': (1, 1, _text('lower', str.lower)),
+    'upper': (1, 1, _text('upper', str.upper)),
+    'trim': (1, 1, _text('trim', str.strip)),
+    'contains': (2, 2, _contains),
+}
+
+# Binding powers of infix operators
+_INFIX = {'or': 10, 'and': 20, '==': 40, '!=': 40, '<': 40, '<=': 40, '>': 40, '>=': 40, 'in': 40, 'not': 40,
+          '+': 50, '-': 50, '*': 60, '/': 60, '%': 60, '(': 80, '[': 80}
+_PREFIX_NOT = 30
+_PREFIX_MINUS = 70
+
+class _Parser:
+    """Pratt parser emitting closures instead of a syntax tree"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = tokenize(source)
+        self.index = 0
+        self.depth = 0
+        self.references: Set[str] = set()
+
+    def peek(self) -> Tuple[str, Any, int]:
+        return self.tokens[self.index]
+
+    def advance(self) -> Tuple[str, Any, int]:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, value: str) -> None:
+        kind, token_value, position = self.advance()
+        if kind != 'op' or token_value != value:
+            found = 'end of expression' if kind == 'end' else repr(token_value)
+            raise ExpressionSyntaxError(f"Expected {value!r} at position {position}, found {found}")
+
+    def parse(self) -> Evaluator:
+        evaluator = self.expression(0)
+        kind, value, position = self.peek()
+        if kind != 'end':
+            raise ExpressionSyntaxError(f"Unexpected {value!r} at position {position}")
+        return evaluator
+
+    def expression(self, binding_power: int) -> Evaluator:
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise ExpressionSyntaxError(f"Expression nested deeper than {MAX_DEPTH} levels")
+        left = self.prefix()
+        while True:
+            kind, value, position = self.peek()
+            if kind != 'op' or _INFIX.get(value, 0) <= binding_power:
+                break
+            self.advance()
+            left = self.infix(value, left, position)
+        self.depth -= 1
+        return left
+
+    def arguments(self, closing: str) -> List[Evaluator]:
+        items = []
+        if self.peek()[:2] == ('op', closing):
+            self.advance()
+            return items
+        while True:
+            items.append(self.expression(0))
+            if self.peek()[:2] == ('op', ','):
+                self.advance()
+                continue
+            self.expect(closing)
+            return items
+
+    def prefix(self) -> Evaluator:
+        kind, value, position = self.advance()
+        if kind == 'literal':
+            return lambda context: (context.charge(), value)[1]
+        if kind == 'ref':
+            self.references.add(value)
+            return lambda context: (context.charge(), context.values.get(value))[1]
+        if kind == 'name':
+            if self.peek()[:2] == ('op', '('):
+                return self.call(value, position)
+            if value == 'value':
+                return lambda context: (context.charge(), context.value)[1]
+            self.references.add(value)
+            return lambda context: (context.charge(), context.values.get(value))[1]
+        if kind == 'op':
+            if value in ('true', 'false', 'null'):
+                constant = {'true': True, 'false': False, 'null': None}[value]
+                return lambda context: (context.charge(), constant)[1]
+            if value == '(':
+                inner = self.expression(0)
+                self.expect(')')
+                return inner
+            if value == '[':
+                items = self.arguments(']')
+                return lambda context: (context.charge(len(items)), [item(context) for item in items])[1]
+            if value == 'not':
+                operand = self.expression(_PREFIX_NOT)
+                return lambda context: (context.charge(), not operand(context))[1]
+            if value == '-':
+                operand = self.expression(_PREFIX_MINUS)
+
+                def negate(context):
+                    context.charge()
+                    result = operand(context)
+                    if not _is_number(result):
+                        raise ExpressionEvaluationError(f"Cannot negate {_type_name(result)}")
+                    return -result
+                return negate
+        found = 'end of expression' if kind == 'end' else repr(value)
+        raise ExpressionSyntaxError(f"Unexpected {found} at position {position}")
+
+    def call(self, name: str, position: int) -> Evaluator:
+        if name not in FUNCTIONS:
+            raise ExpressionSyntaxError(f"Unknown function {name}() at position {position}")
+        minimum, maximum, function = FUNCTIONS[name]
+        self.advance()
+        arguments = self.arguments(')')
+        if not minimum <= len(arguments) <= maximum:
+            raise ExpressionSyntaxError(f"{name}() takes {minimum} to {maximum} arguments, got {len(arguments)}")
+
+        def evaluate(context):
+            values = [argument(context) for argument in arguments]
+            # Work proportional to the size of text and list arguments
+            context.charge(1 + sum(_size(value) for value in values))
+            return function(*values)
+        return evaluate
+
+    def infix(self, operator: str, left: Evaluator, position: int) -> Evaluator:
+        if operator == 'or':
+            right = self.expression(_INFIX['or'])
+            return lambda context: (context.charge(), bool(left(context)) or bool(right(context)))[1]
+        if operator == 'and':
+            right = self.expression(_INFIX['and'])
+            return lambda context: (context.charge(), bool(left(context)) and bool(right(context)))[1]
+        if operator == '(':
+            raise ExpressionSyntaxError(f"Only functions can be called (position {position})")
+        if operator == '[':
+            index = self.expression(0)
+            self.expect(']')
+
+            def subscript(context):
+                context.charge()
+                container, key = left(context), index(context)
+                if not isinstance(container, (list, str)) or not isinstance(key, int) or isinstance(key, bool):
+                    raise ExpressionEvaluationError(f"Cannot index {_type_name(container)} with {_type_name(key)}")
+                if not -len(container) <= key < len(container):
+                    raise ExpressionEvaluationError(f"Index {key} out of range")
+                return container[key]
+            return subscript
+        if operator == 'not':
+            # "not in"
+            self.expect('in')
+            negated = True
+            operator = 'in'
+        else:
+            negated = False
+        right = self.expression(_INFIX[operator])
+
+        if operator == 'in':
+            def membership(context):
+                item, container = left(context), right(context)
+                if not isinstance(container, (list, str)) or isinstance(container, str) and not isinstance(item, str):
+                    raise ExpressionEvaluationError(f"Cannot test membership in {_type_name(container)}")
+                context.charge(1 + len(container))
+                return (item in container) != negated
+            return membership
+        if operator == '==':
+            return lambda context: (context.charge(), left(context) == right(context))[1]
+        if operator == '!=':
+            return lambda context: (context.charge(), left(context) != right(context))[1]
+        if operator in ('<', '<=', '>', '>='):
+            return lambda context: (context.charge(), _compare(operator, left(context), right(context)))[1]
+        return lambda context: (context.charge(), _arithmetic(operator, left(context), right(context), context))[1]
+
+class CompiledExpression:
+    """Parsed expression, ready to be evaluated many times"""
+
+    def __init__(self, source: str, evaluator: Evaluator, references: Set[str]):
+        self.source = source
+        self.references = frozenset(references)
+        self._evaluator = evaluator
+
+    def evaluate(self, values: Optional[Dict[str, Any]] = None, value: Any = None,
+                 max_steps: Optional[int] = None) -> Any:
+        """
+        Evaluate against submitted values
+
+        Args:
+            values: Field values by field ID, referenced as {id} (or bare if the ID is an identifier)
+            value: Value of the validated field, referenced as value
+            max_steps: Step budget (default EXPRESSION_MAX_STEPS)
+
+        Returns:
+            The expression's result; raises ExpressionEvaluationError on type
+            errors and ExpressionBudgetExceeded when the budget runs out
+        """
+        context = _Context(values or {}, value, MAX_STEPS if max_steps is None else max_steps)
+        try:
+            return self._evaluator(context)
+        except ExpressionEvaluationError:
+            raise
+        except (TypeError, ValueError, OverflowError, RecursionError) as e:
+            raise ExpressionEvaluationError(str(e))
+
+@lru_cache(maxsize=1024)
+def compile_expression(source: str) -> CompiledExpression:
+    """Parse and compile an expression (cached by source text); raises ExpressionSyntaxError"""
+    if not isinstance(source, str) or not source.strip():
+        raise ExpressionSyntaxError("Expression is empty")
+    if len(source) > MAX_LENGTH:
+        raise ExpressionSyntaxError(f"Expression longer than {MAX_LENGTH} characters")
+    parser = _Parser(source)
+    evaluator = parser.parse()
+    return CompiledExpression(source, evaluator, parser.references)
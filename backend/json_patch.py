@@ -0,0 +1,160 @@
+"""
+JSON Patch (RFC 6902)
+Applies add/remove/replace/move/copy/test operations to JSON documents
+without mutating them: containers along each modified path are copied,
+everything else is shared with the original document
+"""
+
+from typing import Any, Dict, List, Tuple
+import copy
+
+OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+class JsonPatchError(ValueError):
+    """Malformed patch or operation that cannot be applied to the document"""
+
+class JsonPatchTestFailed(JsonPatchError):
+    """A 'test' operation did not match the document"""
+
+def parse_pointer(pointer: str) -> List[str]:
+    """
+    Split a JSON Pointer (RFC 6901) into its unescaped reference tokens
+
+    Args:
+        pointer: Pointer such as "/options/0/label/de"
+
+    Returns:
+        List of tokens, empty for the whole document
+    """
+    if not isinstance(pointer, str):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError(f"JSON pointer must start with '/': {pointer}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+def _array_index(container: list, token: str, allow_end: bool) -> int:
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise JsonPatchError(f"Invalid array index: {token}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {token}")
+    return index
+
+def _resolve(document: Any, tokens: List[str]) -> Any:
+    value = document
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_array_index(value, token, allow_end=False)]
+        else:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return value
+
+def _update(document: Any, tokens: List[str], action: str, value: Any = None) -> Tuple[Any, Any]:
+    """Return (new document, removed value) with action applied at tokens, copying the path"""
+    if not tokens:
+        # The whole document is replaced (remove leaves nothing behind)
+        return (None, document) if action == 'remove' else (value, document)
+
+    token, rest = tokens[0], tokens[1:]
+    if isinstance(document, dict):
+        container = dict(document)
+        if rest:
+            if token not in container:
+                raise JsonPatchError(f"Path not found: {token}")
+            container[token], removed = _update(container[token], rest, action, value)
+            return container, removed
+        if action != 'add' and token not in container:
+            raise JsonPatchError(f"Path not found: {token}")
+        removed = container.get(token)
+        if action == 'remove':
+            del container[token]
+        else:
+            container[token] = value
+        return container, removed
+
+    if isinstance(document, list):
+        container = list(document)
+        index = _array_index(container, token, allow_end=not rest and action == 'add')
+        if rest:
+            container[index], removed = _update(container[index], rest, action, value)
+            return container, removed
+        if action == 'add':
+            container.insert(index, value)
+            return container, None
+        removed = container[index]
+        if action == 'remove':
+            del container[index]
+        else:
+            container[index] = value
+        return container, removed
+
+    raise JsonPatchError(f"Cannot address '{token}' inside a {type(document).__name__}")
+
+def apply_operation(document: Any, operation: Dict[str, Any]) -> Any:
+    """
+    Apply a single patch operation
+
+    Args:
+        document: JSON document, left unchanged
+        operation: Operation with 'op', 'path' and 'value' or 'from'
+
+    Returns:
+        The patched document
+    """
+    if not isinstance(operation, dict):
+        raise JsonPatchError("Patch operations must be objects")
+    op = operation.get('op')
+    if op not in OPERATIONS:
+        raise JsonPatchError(f"Unknown patch operation: {op!r}")
+    if 'path' not in operation:
+        raise JsonPatchError(f"Operation '{op}' requires a path")
+    tokens = parse_pointer(operation['path'])
+    if op in ('add', 'replace', 'test') and 'value' not in operation:
+        raise JsonPatchError(f"Operation '{op}' requires a value")
+    if op in ('move', 'copy') and 'from' not in operation:
+        raise JsonPatchError(f"Operation '{op}' requires 'from'")
+
+    if op == 'test':
+        if _resolve(document, tokens) != operation['value']:
+            raise JsonPatchTestFailed(f"Test failed at {operation['path']}")
+        return document
+    if op == 'add':
+        return _update(document, tokens, 'add', copy.deepcopy(operation['value']))[0]
+    if op == 'remove':
+        return _update(document, tokens, 'remove')[0]
+    if op == 'replace':
+        return _update(document, tokens, 'replace', copy.deepcopy(operation['value']))[0]
+
+    from_tokens = parse_pointer(operation['from'])
+    if op == 'copy':
+        return _update(document, tokens, 'add', copy.deepcopy(_resolve(document, from_tokens)))[0]
+    # move
+    if tokens[:len(from_tokens)] == from_tokens and tokens != from_tokens:
+        raise JsonPatchError(f"Cannot move {operation['from']} into one of its children")
+    document, value = _update(document, from_tokens, 'remove')
+    return _update(document, tokens, 'add', value)[0]
+
+def apply_patch(document: Any, patch: List[Dict[str, Any]]) -> Any:
+    """
+    Apply a patch atomically
+
+    Args:
+        document: JSON document, left unchanged
+        patch: List of operations, applied in order
+
+    Returns:
+        The patched document; nothing is applied if any operation fails
+    """
+    if not isinstance(patch, list):
+        raise JsonPatchError("A JSON patch must be a list of operations")
+    for operation in patch:
+        document = apply_operation(document, operation)
+    return document
@@ -0,0 +1,330 @@
+"""
+Prometheus-style Metrics without external dependencies
+Per-route request counters, latency histograms, in-flight gauges,
+SQL statements per request, DB pool usage and cache hit rates
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy.engine import Engine
+from sql_instrumentation import current_stats
+import bisect
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """Base class for labelled metrics"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """Monotonically increasing value per label set"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+class Gauge(Metric):
+    """Value that can go up and down per label set"""
+
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+class Histogram(Metric):
+    """Cumulative bucket histogram per label set"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[labels] = (counts, total + value)
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = []
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                label_str = _format_labels(self.labelnames, labels, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors and renders the text exposition format"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]]) -> None:
+        """Register a callable producing freshly computed metrics on every scrape"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+class HttpMetrics:
+    """Request metrics of one application, registered in its registry"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self.requests_total = registry.counter(
+            'http_requests_total', 'Total HTTP requests', ('method', 'route', 'status')
+        )
+        self.request_duration_seconds = registry.histogram(
+            'http_request_duration_seconds', 'HTTP request latency in seconds', ('method', 'route')
+        )
+        # The route is only known once routing ran, so in-flight requests are tracked per method
+        self.requests_in_flight = registry.gauge(
+            'http_requests_in_flight', 'HTTP requests currently being served', ('method',)
+        )
+        self.request_sql_statements = registry.histogram(
+            'http_request_sql_statements', 'SQL statements executed per HTTP request', ('method', 'route'),
+            buckets=STATEMENT_BUCKETS
+        )
+
+def _route_label(scope) -> str:
+    route = scope.get('route')
+    return getattr(route, 'path', None) or '<unmatched>'
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route request metrics
+    
+    SQL statements per request are taken from sql_instrumentation, so
+    QueryStatsMiddleware has to wrap this middleware.
+    """
+
+    def __init__(self, app, http_metrics: HttpMetrics):
+        self.app = app
+        self.metrics = http_metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = {'code': 500}
+        http = self.metrics
+        http.requests_in_flight.inc(method)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http.requests_in_flight.dec(method)
+            route = _route_label(scope)
+            http.requests_total.inc(method, route, str(status['code']))
+            http.request_duration_seconds.observe(elapsed, method, route)
+            stats = current_stats()
+            if stats is not None:
+                http.request_sql_statements.observe(stats.count, method, route)
+
+def pool_collector(get_engine: Callable[[], Engine]) -> Callable[[], Iterable[Metric]]:
+    """Collector reporting connection pool usage of the engine returned by get_engine"""
+
+    def collect():
+        pool = get_engine().pool
+        checked_out = Gauge('db_pool_checked_out', 'Connections currently checked out of the pool')
+        size = Gauge('db_pool_size', 'Configured connection pool size')
+        overflow = Gauge('db_pool_overflow', 'Connections opened beyond the pool size')
+        metrics = []
+        for gauge, attribute in ((checked_out, 'checkedout'), (size, 'size'), (overflow, 'overflow')):
+            # Not every pool class (e.g. SQLite's) implements all counters
+            if hasattr(pool, attribute):
+                gauge.set(getattr(pool, attribute)())
+                metrics.append(gauge)
+        return metrics
+
+    return collect
+
+def cache_collector(caches: Callable[[], Iterable]) -> Callable[[], Iterable[Metric]]:
+    """Collector reporting hit/miss counters and hit ratio of in-process caches"""
+
+    def collect():
+        hits = Counter('cache_hits_total', 'Cache hits', ('cache',))
+        misses = Counter('cache_misses_total', 'Cache misses', ('cache',))
+        ratio = Gauge('cache_hit_ratio', 'Cache hit ratio since process start', ('cache',))
+        entries = Gauge('cache_entries', 'Entries currently held by the cache', ('cache',))
+        for cache in caches():
+            stats = cache.stats()
+            lookups = stats['hits'] + stats['misses']
+            hits.inc(stats['name'], amount=stats['hits'])
+            misses.inc(stats['name'], amount=stats['misses'])
+            ratio.set(stats['hits'] / lookups if lookups else 0.0, stats['name'])
+            entries.set(stats['entries'], stats['name'])
+        return [hits, misses, ratio, entries]
+
+    return collect
+
+def events_collector(get_broker: Callable[[], object]) -> Callable[[], Iterable[Metric]]:
+    """Collector reporting subscribers and fan-out of the change event broker"""
+
+    def collect():
+        broker = get_broker()
+        subscribers = Gauge('events_subscribers', 'Open change event streams')
+        published = Counter('events_published_total', 'Change events fanned out to the subscribers')
+        overflows = Counter('events_overflows_total', 'Subscriber queues that overflowed and were told to resync')
+        subscribers.set(len(broker.subscribers))
+        published.inc(amount=broker.published)
+        overflows.inc(amount=broker.overflows)
+        return [subscribers, published, overflows]
+
+    return collect
+
+def regex_collector(get_failures: Callable[[], Dict[str, int]]) -> Callable[[], Iterable[Metric]]:
+    """Collector reporting user-supplied patterns that were not run to completion"""
+
+    def collect():
+        failures = Counter('regex_failures_total', 'Pattern matches refused or aborted (unsafe, timeout, '
+                           'input_too_long)', ['reason'])
+        for reason, count in get_failures().items():
+            failures.inc(reason, amount=count)
+        return [failures]
+
+    return collect
+
+def offload_collector(get_executor: Callable[[], object]) -> Callable[[], Iterable[Metric]]:
+    """Collector reporting queue depth and throughput of the offload executor"""
+
+    def collect():
+        stats = get_executor().stats()
+        queued = Gauge('offload_queue_depth', 'Offloaded calls waiting for a thread')
+        running = Gauge('offload_running', 'Offloaded calls running')
+        workers = Gauge('offload_workers', 'Threads of the offload executor')
+        max_queued = Gauge('offload_queue_depth_max', 'Highest queue depth since process start')
+        completed = Counter('offload_completed_total', 'Offloaded calls finished')
+        rejected = Counter('offload_rejected_total', 'Offloaded calls rejected because the queue was full')
+        waited = Counter('offload_queue_wait_seconds_total', 'Time offloaded calls spent waiting for a thread')
+        queued.set(stats['queued'])
+        running.set(stats['running'])
+        workers.set(stats['workers'])
+        max_queued.set(stats['max_queued'])
+        completed.inc(amount=stats['completed'])
+        rejected.inc(amount=stats['rejected'])
+        waited.inc(amount=stats['wait_seconds'])
+        return [queued, running, workers, max_queued, completed, rejected, waited]
+
+    return collect
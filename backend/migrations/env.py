@@ -0,0 +1,49 @@
+"""
+Alembic environment
+Runs against the connection handed in by database.run_migrations() or,
+from the command line, against DATABASE_URL
+"""
+
+from logging.config import fileConfig
+import os
+
+from alembic import context
+from sqlalchemy import create_engine
+
+from database import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+if config.config_file_name is not None and config.attributes.get('connection') is None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+def database_url() -> str:
+    return (config.get_main_option('sqlalchemy.url')
+            or os.environ.get('DATABASE_URL')
+            or os.environ.get('SQL_SERVER_CONNECTION_STRING'))
+
+def run_migrations_offline():
+    context.configure(url=database_url(), target_metadata=target_metadata, literal_binds=True,
+                      render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    engine = create_engine(database_url())
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
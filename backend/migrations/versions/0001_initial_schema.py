@@ -0,0 +1,79 @@
+"""Initial schema as created by create_tables() before migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'multilanguage_texts',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('entity_type', sa.String(50), nullable=False),
+        sa.Column('entity_id', sa.String(36), nullable=False),
+        sa.Column('language_code', sa.String(2), nullable=False),
+        sa.Column('text_value', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_table(
+        'templates',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('role_config', sa.Text()),
+        sa.Column('customer_specific', sa.Boolean()),
+        sa.Column('visible_for_customers', sa.Text()),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.Column('created_by', sa.String(100)),
+        sa.Column('updated_by', sa.String(100)),
+    )
+    op.create_table(
+        'fields',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('type', sa.String(20), nullable=False),
+        sa.Column('visibility', sa.String(20)),
+        sa.Column('requirement', sa.String(20)),
+        sa.Column('validation', sa.Text()),
+        sa.Column('select_type', sa.String(20)),
+        sa.Column('options', sa.Text()),
+        sa.Column('document_mode', sa.String(50)),
+        sa.Column('document_constraints', sa.Text()),
+        sa.Column('role_config', sa.Text()),
+        sa.Column('customer_specific', sa.Boolean()),
+        sa.Column('visible_for_customers', sa.Text()),
+        sa.Column('dependencies', sa.Text()),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime()),
+    )
+    op.create_table(
+        'template_fields',
+        sa.Column('template_id', sa.String(36), sa.ForeignKey('templates.id'), primary_key=True),
+        sa.Column('field_id', sa.String(36), sa.ForeignKey('fields.id'), primary_key=True),
+    )
+    op.create_table(
+        'change_logs',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('entity_type', sa.String(20), nullable=False),
+        sa.Column('entity_id', sa.String(36), nullable=False),
+        sa.Column('action', sa.String(20), nullable=False),
+        sa.Column('changes', sa.Text()),
+        sa.Column('user_id', sa.String(100), nullable=False),
+        sa.Column('user_name', sa.String(200), nullable=False),
+        sa.Column('timestamp', sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table('change_logs')
+    op.drop_table('template_fields')
+    op.drop_table('fields')
+    op.drop_table('templates')
+    op.drop_table('multilanguage_texts')
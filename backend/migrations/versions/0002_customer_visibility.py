@@ -0,0 +1,62 @@
+"""Customer visibility association tables, migrated from the JSON columns
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+import json
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'field_customers',
+        sa.Column('field_id', sa.String(36), sa.ForeignKey('fields.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('customer_id', sa.String(100), primary_key=True),
+    )
+    op.create_index('ix_field_customers_customer', 'field_customers', ['customer_id', 'field_id'])
+    op.create_table(
+        'template_customers',
+        sa.Column('template_id', sa.String(36), sa.ForeignKey('templates.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('customer_id', sa.String(100), primary_key=True),
+    )
+    op.create_index('ix_template_customers_customer', 'template_customers', ['customer_id', 'template_id'])
+
+    # Move the legacy JSON lists into the association tables and clear them
+    bind = op.get_bind()
+    for table, link_table, key in (('fields', 'field_customers', 'field_id'),
+                                   ('templates', 'template_customers', 'template_id')):
+        rows = bind.execute(sa.text(
+            f"SELECT id, visible_for_customers FROM {table} WHERE visible_for_customers IS NOT NULL"
+        )).fetchall()
+        links = []
+        for entity_id, raw in rows:
+            for customer_id in dict.fromkeys(json.loads(raw) or []):
+                links.append({key: entity_id, 'customer_id': customer_id})
+        if links:
+            bind.execute(sa.text(f"INSERT INTO {link_table} ({key}, customer_id) VALUES (:{key}, :customer_id)"), links)
+        bind.execute(sa.text(f"UPDATE {table} SET visible_for_customers = NULL"))
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table, link_table, key in (('fields', 'field_customers', 'field_id'),
+                                   ('templates', 'template_customers', 'template_id')):
+        customers = {}
+        for entity_id, customer_id in bind.execute(sa.text(f"SELECT {key}, customer_id FROM {link_table}")):
+            customers.setdefault(entity_id, []).append(customer_id)
+        for entity_id, values in customers.items():
+            bind.execute(sa.text(f"UPDATE {table} SET visible_for_customers = :value WHERE id = :id"),
+                         {'value': json.dumps(values), 'id': entity_id})
+
+    op.drop_index('ix_template_customers_customer', 'template_customers')
+    op.drop_table('template_customers')
+    op.drop_index('ix_field_customers_customer', 'field_customers')
+    op.drop_table('field_customers')
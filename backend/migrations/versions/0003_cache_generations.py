@@ -0,0 +1,27 @@
+"""Cache generation counters for cross-process cache invalidation
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'cache_generations',
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('generation', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table('cache_generations')
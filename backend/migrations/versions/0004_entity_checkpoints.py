@@ -0,0 +1,32 @@
+"""Periodic entity checkpoints for point-in-time reconstruction
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'entity_checkpoints',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('entity_type', sa.String(20), nullable=False),
+        sa.Column('entity_id', sa.String(36), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('state', sa.Text()),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('ix_entity_checkpoints_entity_timestamp', 'entity_checkpoints', ['entity_id', 'timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_entity_checkpoints_entity_timestamp', table_name='entity_checkpoints')
+    op.drop_table('entity_checkpoints')
@@ -0,0 +1,41 @@
+"""Published template versions and their precomputed render artifacts
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'template_versions',
+        sa.Column('template_id', sa.String(36), primary_key=True),
+        sa.Column('version', sa.Integer(), primary_key=True),
+        sa.Column('snapshot', sa.Text(), nullable=False),
+        sa.Column('customers', sa.Text()),
+        sa.Column('published_at', sa.DateTime()),
+        sa.Column('published_by', sa.String(100)),
+    )
+    op.create_table(
+        'render_artifacts',
+        sa.Column('template_id', sa.String(36), primary_key=True),
+        sa.Column('version', sa.Integer(), primary_key=True),
+        sa.Column('role', sa.String(20), primary_key=True),
+        sa.Column('customer_id', sa.String(100), primary_key=True),
+        sa.Column('language', sa.String(2), primary_key=True),
+        sa.Column('body', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table('render_artifacts')
+    op.drop_table('template_versions')
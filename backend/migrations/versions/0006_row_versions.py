@@ -0,0 +1,49 @@
+"""Row versions and tombstones for delta syncs
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+SYNCED_TABLES = ('templates', 'fields', 'multilanguage_texts')
+
+
+def upgrade():
+    for table in SYNCED_TABLES:
+        op.add_column(table, sa.Column('row_version', sa.Integer()))
+        op.create_index(f'ix_{table}_row_version', table, ['row_version'])
+    op.create_table(
+        'sync_tombstones',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('entity_type', sa.String(20), nullable=False),
+        sa.Column('entity_id', sa.String(36), nullable=False),
+        sa.Column('row_version', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_sync_tombstones_row_version', 'sync_tombstones', ['row_version'])
+
+    # Existing rows form version 1, so a first sync (since=0) returns them
+    bind = op.get_bind()
+    for table in SYNCED_TABLES:
+        bind.execute(sa.text(f"UPDATE {table} SET row_version = 1"))
+    if not bind.execute(sa.text("SELECT 1 FROM cache_generations WHERE name = 'row_version'")).first():
+        bind.execute(sa.text("INSERT INTO cache_generations (name, generation, updated_at) "
+                             "VALUES ('row_version', 1, :now)"), {'now': datetime.utcnow()})
+
+
+def downgrade():
+    op.drop_index('ix_sync_tombstones_row_version', table_name='sync_tombstones')
+    op.drop_table('sync_tombstones')
+    for table in SYNCED_TABLES:
+        op.drop_index(f'ix_{table}_row_version', table_name=table)
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column('row_version')
+    op.execute("DELETE FROM cache_generations WHERE name = 'row_version'")
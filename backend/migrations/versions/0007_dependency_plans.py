@@ -0,0 +1,24 @@
+"""Analysed dependency plans of fields
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL: renders evaluate the authored dependencies until the field is analysed
+    op.add_column('fields', sa.Column('dependency_plan', sa.Text()))
+
+
+def downgrade():
+    with op.batch_alter_table('fields') as batch:
+        batch.drop_column('dependency_plan')
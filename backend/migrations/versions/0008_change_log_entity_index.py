@@ -0,0 +1,22 @@
+"""Index change-log entries by entity and time
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Checkpoint counts, state_as_of and replays read one entity's entries by time
+    op.create_index('ix_change_logs_entity_timestamp', 'change_logs', ['entity_id', 'timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_change_logs_entity_timestamp', table_name='change_logs')
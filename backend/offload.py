@@ -0,0 +1,105 @@
+"""
+Offloading of CPU- and DB-bound Work
+Render, simulate and bulk-validate requests do synchronous database and CPU
+work inside async handlers. That work runs on a bounded thread pool instead
+of the event loop, so a large render no longer holds up every other request
+of the worker: cheap requests are served while heavy ones run. When more
+than OFFLOAD_MAX_QUEUE calls are already waiting for a thread, new ones are
+rejected instead of queueing without bound.
+"""
+
+from typing import Any, Callable, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+OFFLOAD_WORKERS = int(os.environ.get('OFFLOAD_WORKERS', str(min(32, (os.cpu_count() or 1) + 4))))
+OFFLOAD_MAX_QUEUE = int(os.environ.get('OFFLOAD_MAX_QUEUE', '100'))
+
+class ExecutorSaturated(Exception):
+    """Raised when the executor's backlog is full"""
+
+class BoundedExecutor:
+    """Thread pool with a bounded backlog and queue-depth accounting"""
+
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None, name: str = 'offload'):
+        self.name = name
+        self.workers = OFFLOAD_WORKERS if workers is None else workers
+        self.max_queue = OFFLOAD_MAX_QUEUE if max_queue is None else max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        # Submitted calls waiting for a thread, and calls running
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    async def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run function(*args) on the pool and wait for its result
+
+        The call sees the caller's context variables (e.g. the request's SQL
+        statistics). Raises ExecutorSaturated if OFFLOAD_MAX_QUEUE calls are
+        already waiting.
+        """
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(f"{self.queued} calls waiting for the {self.name} pool")
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        submitted = time.perf_counter()
+        context = contextvars.copy_context()
+
+        def call():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.wait_seconds += time.perf_counter() - submitted
+            try:
+                return context.run(function, *args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        try:
+            future = self._executor.submit(call)
+        except RuntimeError:
+            # Shut down
+            with self._lock:
+                self.queued -= 1
+            raise ExecutorSaturated(f"The {self.name} pool is shut down")
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # The client went away; a call that did not start yet never will
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, running calls and totals"""
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "queued": self.queued,
+            "running": self.running,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds": self.wait_seconds
+        }
+
+    def shutdown(self) -> None:
+        """Stop the threads once running calls are done, dropping waiting ones"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,162 @@
+"""
+Template Publishing
+Freezes a template and its fields into an immutable, numbered version and
+precomputes the version's render responses per role, customer and language.
+Renders of a published version are then a key lookup, served from the
+memory-mapped artifact store when one is configured; drafts (the live
+rows) are still rendered dynamically.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import Template, TemplateVersion, RenderArtifact
+from dependency_engine import DependencyEngine
+from changelog import snapshot_field, snapshot_template
+from compression import PrecompressedPayload
+from artifact_store import ArtifactStore, StoredPayload, put_artifact
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Key values of the render without customer and of the render with all languages
+NO_CUSTOMER = ''
+ALL_LANGUAGES = ''
+
+def encode_render(templates: List[Dict[str, Any]]) -> bytes:
+    """Serialise rendered templates in the shape of the render endpoint's response"""
+    fields = [field for template in templates for field in template.get('fields', [])]
+    return json.dumps({"templates": templates, "fields": fields}, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8')
+
+def artifact_key(template_id: str, version: int, role: str, customer_id: str, language: str) -> str:
+    """Artifact store key of a render artifact"""
+    return json.dumps([template_id, version, role, customer_id, language], separators=(',', ':'))
+
+def artifact_customers(template: Template) -> List[str]:
+    """
+    Customers whose render differs from the render without customer
+
+    Only customer-specific fields depend on the customer, so every other
+    customer is served the NO_CUSTOMER artifact.
+    """
+    return sorted({customer_id for field in template.fields if field.customer_specific
+                   for customer_id in field.visible_for_customers})
+
+def publish_template(db: Session, template: Template, roles: Iterable[str], languages: Iterable[str],
+                     user_id: Optional[str] = None, store: Optional[ArtifactStore] = None) -> TemplateVersion:
+    """
+    Freeze a template into its next version and precompute its render artifacts
+
+    Artifacts are rendered for every role, for no customer plus each customer
+    of artifact_customers(), and for all languages plus each single language.
+
+    Args:
+        db: Database session, committed by this call
+        template: Template to publish
+        roles: Roles to render for
+        languages: Languages to render projected artifacts for
+        user_id: Publishing user
+        store: Artifact store to write the artifacts to right away
+
+    Returns:
+        The new version (IntegrityError if another publish took the same number)
+    """
+    roles, languages = list(roles), list(languages)
+    number = (db.query(func.max(TemplateVersion.version)).filter(
+        TemplateVersion.template_id == template.id
+    ).scalar() or 0) + 1
+    customers = artifact_customers(template)
+    snapshot = {
+        'template': snapshot_template(db, template),
+        'fields': {field.id: snapshot_field(db, field) for field in template.fields}
+    }
+
+    engine = DependencyEngine(db)
+    artifacts = []
+    for role in roles:
+        # Role overrides are applied to the loaded fields in place; start
+        # every role from the stored rows
+        db.expire_all()
+        for customer_id in [NO_CUSTOMER] + customers:
+            for language in [ALL_LANGUAGES] + languages:
+                rendered = engine.render_template_for_role(
+                    template=template,
+                    role=role,
+                    customer_id=customer_id or None,
+                    field_values={},
+                    language=language or None
+                )
+                artifacts.append(RenderArtifact(template_id=template.id, version=number, role=role,
+                                                customer_id=customer_id, language=language,
+                                                body=encode_render([rendered])))
+    # Never write the role overrides back
+    db.expire_all()
+
+    version = TemplateVersion(template_id=template.id, version=number, snapshot=snapshot, customers=customers,
+                              published_by=user_id)
+    db.add(version)
+    db.add_all(artifacts)
+    db.commit()
+    if store is not None:
+        for artifact in artifacts:
+            put_artifact(store, artifact_key(artifact.template_id, artifact.version, artifact.role,
+                                             artifact.customer_id, artifact.language), artifact.body)
+    logger.info(f"Published template {template.id} version {number} with {len(artifacts)} render artifacts")
+    return version
+
+def latest_versions(db: Session, template_ids: List[str]) -> Dict[str, int]:
+    """Latest published version number of each template (unpublished templates are missing)"""
+    rows = db.query(TemplateVersion.template_id, func.max(TemplateVersion.version)).filter(
+        TemplateVersion.template_id.in_(template_ids)
+    ).group_by(TemplateVersion.template_id).all()
+    return {template_id: version for template_id, version in rows}
+
+def find_artifact(db: Session, template_id: str, version: int, role: str, customer_id: Optional[str] = None,
+                  language: Optional[str] = None, store: Optional[ArtifactStore] = None
+                  ) -> Optional[PrecompressedPayload]:
+    """
+    Look up the precomputed render of a published version
+
+    With a store, artifacts are served from it and copied into it from the
+    database on first use; the database lookup is the fallback.
+
+    Returns:
+        The serialised render response, or None if the version does not exist
+    """
+    language = language or ALL_LANGUAGES
+    key = artifact_key(template_id, version, role, customer_id or NO_CUSTOMER, language)
+    if store is not None:
+        resolved = store.resolve(key)
+        body = store.get(resolved) if resolved is not None else None
+        if body is not None:
+            return StoredPayload(store, resolved, body)
+
+    customer_keys = [customer_id, NO_CUSTOMER] if customer_id else [NO_CUSTOMER]
+    rows = db.query(RenderArtifact.customer_id, RenderArtifact.body).filter(
+        RenderArtifact.template_id == template_id,
+        RenderArtifact.version == version,
+        RenderArtifact.role == role,
+        RenderArtifact.language == language,
+        RenderArtifact.customer_id.in_(customer_keys)
+    ).all()
+    bodies = {customer_key: body for customer_key, body in rows}
+    # Customers without own artifact see exactly the render without customer
+    resolved_customer = customer_id if customer_id in bodies else NO_CUSTOMER
+    body = bodies.get(resolved_customer)
+    if body is None:
+        return None
+    if store is None:
+        return PrecompressedPayload(body)
+
+    resolved = artifact_key(template_id, version, role, resolved_customer, language)
+    stored = put_artifact(store, resolved, body)
+    if not isinstance(stored, memoryview):
+        return PrecompressedPayload(body)
+    if resolved != key:
+        try:
+            store.alias(key, resolved)
+        except OSError as e:
+            logger.error(f"Cannot write render artifact alias {key}: {e}")
+    return StoredPayload(store, resolved, stored)
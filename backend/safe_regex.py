@@ -0,0 +1,340 @@
+"""
+Safe Regular Expressions
+Admin-authored patterns (validation patterns, regex_match conditions) run
+on user input. Patterns are vetted for constructs that backtrack
+exponentially - nested quantifiers whose iterations can split the same
+text, overlapping alternatives under a quantifier, and backreferences -
+and matched with a bounded engine: RE2 (linear time) if google-re2 is
+installed, else the regex module with a timeout, which also bounds
+polynomial backtracking (e.g. \w+\s*\w+). The vetting is a heuristic, so
+without either engine patterns are not run at all.
+"""
+
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+from functools import lru_cache
+import os
+import re
+import threading
+import logging
+
+try:  # Linear-time engine, optional
+    import re2
+except ImportError:  # pragma: no cover - depends on the environment
+    re2 = None
+
+try:  # Backtracking engine with a timeout, optional
+    import regex
+except ImportError:  # pragma: no cover - depends on the environment
+    regex = None
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # pragma: no cover - Python < 3.11
+    import sre_parse
+    import sre_constants
+
+logger = logging.getLogger(__name__)
+
+if re2 is None and regex is None:  # pragma: no cover - depends on the environment
+    logger.error("Neither google-re2 nor regex is installed, user-supplied patterns are not run")
+
+REGEX_TIMEOUT_SECONDS = float(os.environ.get('REGEX_TIMEOUT_SECONDS', '0.1'))
+REGEX_MAX_INPUT_LENGTH = int(os.environ.get('REGEX_MAX_INPUT_LENGTH', '10000'))
+MAX_PATTERN_LENGTH = 1000
+
+# Quantifiers allowing more repetitions than this count as unbounded
+WIDE_REPEAT = 50
+
+class RegexError(ValueError):
+    """A pattern could not be matched safely"""
+
+class UnsafePatternError(RegexError):
+    """The pattern is invalid or may backtrack super-linearly"""
+
+class RegexTimeout(RegexError):
+    """Matching exceeded REGEX_TIMEOUT_SECONDS"""
+
+class RegexInputTooLong(RegexError):
+    """The input is longer than REGEX_MAX_INPUT_LENGTH"""
+
+class RegexEngineUnavailable(RegexError):
+    """Neither google-re2 nor regex is installed"""
+
+# Failures by reason ('unsafe', 'timeout', 'input_too_long', 'no_engine'), reported by metrics.regex_collector
+failures: Dict[str, int] = {}
+# Counted from request threads and offload workers
+_failures_lock = threading.Lock()
+
+def _record(reason: str) -> None:
+    with _failures_lock:
+        failures[reason] = failures.get(reason, 0) + 1
+
+def failure_counts() -> Dict[str, int]:
+    """Snapshot of the failure counters by reason"""
+    with _failures_lock:
+        return dict(failures)
+
+# Sample alphabet standing in for all characters when comparing character sets:
+# Latin-1 plus a non-Latin letter, a CJK character and a Unicode space
+_ALPHABET = frozenset(chr(code) for code in range(256)) | {'ā', '一', ' '}
+_CATEGORIES = {
+    name: frozenset(char for char in _ALPHABET if re.match(expression, char))
+    for name, expression in (('CATEGORY_DIGIT', r'\d'), ('CATEGORY_NOT_DIGIT', r'\D'),
+                             ('CATEGORY_SPACE', r'\s'), ('CATEGORY_NOT_SPACE', r'\S'),
+                             ('CATEGORY_WORD', r'\w'), ('CATEGORY_NOT_WORD', r'\W'))
+}
+_EMPTY: FrozenSet[str] = frozenset()
+
+def _op(name: str) -> Any:
+    return getattr(sre_constants, name, None)
+
+LITERAL, NOT_LITERAL, ANY, IN, BRANCH, SUBPATTERN = (_op(name) for name in (
+    'LITERAL', 'NOT_LITERAL', 'ANY', 'IN', 'BRANCH', 'SUBPATTERN'))
+MAX_REPEAT, MIN_REPEAT, POSSESSIVE_REPEAT, ATOMIC_GROUP = (_op(name) for name in (
+    'MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT', 'ATOMIC_GROUP'))
+GROUPREF, GROUPREF_EXISTS, RANGE, NEGATE, CATEGORY = (_op(name) for name in (
+    'GROUPREF', 'GROUPREF_EXISTS', 'RANGE', 'NEGATE', 'CATEGORY'))
+GROUPREF_IGNORE = _op('GROUPREF_IGNORE')
+REPEATS = (MAX_REPEAT, MIN_REPEAT)
+
+def _class_chars(items) -> FrozenSet[str]:
+    chars = set()
+    negate = False
+    for op, av in items:
+        if op is NEGATE:
+            negate = True
+        elif op is LITERAL:
+            chars.add(chr(av))
+        elif op is RANGE:
+            chars.update(char for char in _ALPHABET if av[0] <= ord(char) <= av[1])
+            chars.update(chr(code) for code in (av[0], av[1]))
+        elif op is CATEGORY:
+            chars |= _CATEGORIES.get(str(av), _ALPHABET)
+        else:
+            chars |= _ALPHABET
+    return _ALPHABET - chars if negate else frozenset(chars)
+
+def _first(items, last: bool = False) -> Tuple[FrozenSet[str], bool]:
+    """Characters a sequence can start (with last: end) with, and whether it can match the empty string"""
+    first = set()
+    for item in (reversed(list(items)) if last else items):
+        chars, nullable = _item_first(item, last)
+        first |= chars
+        if not nullable:
+            return frozenset(first), False
+    return frozenset(first), True
+
+def _item_first(item, last: bool = False) -> Tuple[FrozenSet[str], bool]:
+    op, av = item
+    if op is LITERAL:
+        return frozenset(chr(av)), False
+    if op is NOT_LITERAL:
+        return _ALPHABET - {chr(av)}, False
+    if op is ANY:
+        return _ALPHABET, False
+    if op is IN:
+        return _class_chars(av), False
+    if op is BRANCH:
+        first, nullable = set(), False
+        for branch in av[1]:
+            chars, empty = _first(branch, last)
+            first |= chars
+            nullable = nullable or empty
+        return frozenset(first), nullable
+    if op is SUBPATTERN:
+        return _first(av[-1], last)
+    if op is ATOMIC_GROUP:
+        return _first(av, last)
+    if op in REPEATS or op is POSSESSIVE_REPEAT:
+        chars, nullable = _first(av[2], last)
+        return chars, nullable or av[0] == 0
+    if op in (GROUPREF, GROUPREF_IGNORE):
+        return _ALPHABET, True
+    if op is GROUPREF_EXISTS:
+        chars, _ = _first(av[1], last)
+        other, _ = _first(av[2], last) if av[2] else (_EMPTY, True)
+        return chars | other, True
+    # Anchors and lookarounds consume nothing
+    return _EMPTY, True
+
+def _chars(items) -> FrozenSet[str]:
+    """Every character a sequence can consume"""
+    chars = set()
+    for op, av in items:
+        if op is BRANCH:
+            for branch in av[1]:
+                chars |= _chars(branch)
+        elif op is SUBPATTERN:
+            chars |= _chars(av[-1])
+        elif op is ATOMIC_GROUP:
+            chars |= _chars(av)
+        elif op in REPEATS or op is POSSESSIVE_REPEAT:
+            chars |= _chars(av[2])
+        elif op is GROUPREF_EXISTS:
+            chars |= _chars(av[1]) | (_chars(av[2]) if av[2] else _EMPTY)
+        else:
+            chars |= _item_first((op, av))[0]
+    return frozenset(chars)
+
+def _is_wide(minimum: int, maximum: int, in_repeat: bool = False) -> bool:
+    # Of variable length and unbounded (or nearly); inside another repeat the
+    # counts multiply, so any variable length counts, e.g. (a{1,30}){1,30}
+    if minimum == maximum:
+        return False
+    return in_repeat or maximum > WIDE_REPEAT
+
+# Findings that only cost polynomial time: such patterns are accepted and
+# bounded by the engine (RE2 or the regex module's timeout)
+ADJACENT_QUANTIFIERS = "adjacent quantifiers over overlapping characters"
+POLYNOMIAL = frozenset({ADJACENT_QUANTIFIERS})
+
+def _scan(items, follow: FrozenSet[str], in_repeat: bool, problems: List[str]) -> None:
+    """
+    Collect super-linear constructs of a sequence
+
+    Args:
+        items: Parsed sequence
+        follow: Characters that can follow the sequence
+        in_repeat: The sequence is (part of) the body of a quantifier that can repeat it
+        problems: Findings, appended to
+    """
+    items = list(items)
+    for index, (op, av) in enumerate(items):
+        rest, rest_nullable = _first(items[index + 1:])
+        item_follow = rest | follow if rest_nullable else rest
+
+        if op in (GROUPREF, GROUPREF_IGNORE, GROUPREF_EXISTS):
+            problems.append("backreferences can take exponential time")
+        elif op in REPEATS:
+            minimum, maximum, body = av
+            if _is_wide(minimum, maximum, in_repeat):
+                consumed = _chars(body)
+                if in_repeat and consumed & item_follow:
+                    problems.append("nested quantifiers can split the same text in exponentially many ways")
+                # A later quantifier that can take over what this one ends with,
+                # across optional items only, e.g. \w+\s*\w+ (polynomial). A
+                # required item such as the @ or \. of an e-mail pattern pins
+                # where the first quantifier ends
+                ending, _ = _first(body, last=True)
+                for following in items[index + 1:]:
+                    if following[0] in REPEATS and _is_wide(following[1][0], following[1][1], in_repeat) \
+                            and ending & _first(following[1][2])[0]:
+                        problems.append(ADJACENT_QUANTIFIERS)
+                        break
+                    if not _item_first(following)[1]:
+                        break
+                body_first, _ = _first(body)
+                _scan(body, body_first | item_follow, True, problems)
+            elif maximum > 1:
+                # Fixed or small counts still repeat the body, e.g. (.*,){12}
+                body_first, _ = _first(body)
+                _scan(body, body_first | item_follow, True, problems)
+            else:
+                _scan(body, item_follow, in_repeat, problems)
+        elif op is BRANCH:
+            branches = av[1]
+            if in_repeat:
+                sets = [(_first(branch)[0], _chars(branch)) for branch in branches]
+                for position, (first, chars) in enumerate(sets):
+                    if any(first & other_first and chars & other_chars
+                           for other_first, other_chars in sets[position + 1:]):
+                        problems.append("alternatives under a quantifier overlap")
+                        break
+                # Alternatives of different lengths sharing a prefix are parsed
+                # as the prefix and an empty branch, e.g. (a|aa)+ as (a(?:|a))+:
+                # the body then matches the same text in different-length pieces
+                if any(not branch for branch in branches) and _chars(
+                        [item for branch in branches for item in branch]) & item_follow:
+                    problems.append("alternatives under a quantifier overlap")
+            for branch in branches:
+                _scan(branch, item_follow, in_repeat, problems)
+        elif op is SUBPATTERN:
+            _scan(av[-1], item_follow, in_repeat, problems)
+        # Possessive quantifiers and atomic groups never backtrack into their body
+
+def pattern_problems(pattern: str, polynomial: bool = False) -> List[str]:
+    """
+    Reasons why pattern is unsafe (empty if it is safe)
+
+    Args:
+        pattern: The pattern to check
+        polynomial: Include findings that only cost polynomial time, which
+            do not make a pattern unsafe
+    """
+    if not isinstance(pattern, str):
+        return ["pattern must be a string"]
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return [f"pattern longer than {MAX_PATTERN_LENGTH} characters"]
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, OverflowError, RecursionError) as e:
+        return [f"invalid pattern: {e}"]
+    problems: List[str] = []
+    _scan(parsed, _EMPTY, False, problems)
+    return [problem for problem in dict.fromkeys(problems) if polynomial or problem not in POLYNOMIAL]
+
+def vet_pattern(pattern: str) -> None:
+    """Raise UnsafePatternError if pattern is invalid or may backtrack exponentially"""
+    problems = pattern_problems(pattern)
+    if problems:
+        raise UnsafePatternError(f"Pattern {pattern!r} rejected: {'; '.join(problems)}")
+
+def _matcher(pattern: str) -> Optional[Callable[[str], bool]]:
+    if re2 is not None:
+        try:
+            compiled = re2.compile(pattern)
+            return lambda text: compiled.match(text) is not None
+        except Exception:
+            # Constructs RE2 does not support, e.g. lookarounds
+            pass
+    if regex is not None:
+        compiled = regex.compile(pattern)
+
+        def match(text):
+            try:
+                return compiled.match(text, timeout=REGEX_TIMEOUT_SECONDS) is not None
+            except TimeoutError:
+                _record('timeout')
+                raise RegexTimeout(f"Pattern {pattern!r} timed out after {REGEX_TIMEOUT_SECONDS}s")
+        return match
+    # The standard library has no time limit, vetting alone is not enough
+    return None
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern: str) -> Tuple[Optional[Callable[[str], bool]], Optional[str]]:
+    """Vetted matcher of a pattern, or (None, reason) for unsafe patterns (cached)"""
+    problems = pattern_problems(pattern)
+    if problems:
+        return None, f"Pattern {pattern!r} rejected: {'; '.join(problems)}"
+    polynomial = pattern_problems(pattern, polynomial=True)
+    if polynomial:
+        logger.info(f"Pattern {pattern!r} may backtrack polynomially ({'; '.join(polynomial)}), "
+                    f"bounded by the {engine_name()} engine")
+    # (None, None) if no bounded engine is installed
+    return _matcher(pattern), None
+
+def safe_match(pattern: str, text: str) -> bool:
+    """
+    re.match semantics with bounded running time
+
+    Raises:
+        UnsafePatternError: The pattern failed vetting and is not run
+        RegexInputTooLong: text exceeds REGEX_MAX_INPUT_LENGTH
+        RegexTimeout: Matching took longer than REGEX_TIMEOUT_SECONDS (regex module only)
+        RegexEngineUnavailable: Neither google-re2 nor regex is installed
+    """
+    matcher, reason = compile_pattern(pattern)
+    if matcher is None and reason is not None:
+        _record('unsafe')
+        raise UnsafePatternError(reason)
+    if matcher is None:
+        _record('no_engine')
+        raise RegexEngineUnavailable("No bounded regex engine installed (google-re2 or regex), pattern not run")
+    if len(text) > REGEX_MAX_INPUT_LENGTH:
+        _record('input_too_long')
+        raise RegexInputTooLong(f"Input longer than {REGEX_MAX_INPUT_LENGTH} characters")
+    return matcher(text)
+
+def engine_name() -> Optional[str]:
+    """Engine used for vetted patterns (None if patterns are not run)"""
+    return 're2' if re2 is not None else 'regex' if regex is not None else None
@@ -1,30 +1,52 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 import os
+import asyncio
+import json
 import logging
-from pathlib import Path
-from pydantic import BaseModel, Field, validator
-from typing import List, Dict, Optional, Union, Any
+import time
+from pydantic import BaseModel, ConfigDict, Field, validator
+from typing import Iterable, List, Dict, Optional, Union, Any
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 
 # Import database modules
 from database import (
-    get_db, create_tables, Template, Field, ChangeLogEntry, MultiLanguageText,
-    get_multilanguage_text, set_multilanguage_text, update_multilanguage_text
+    get_db, get_engine, SessionLocal, make_engine, ensure_schema, Template, Field, ChangeLogEntry, MultiLanguageText,
+    get_multilanguage_text, set_multilanguage_text, update_multilanguage_text, delete_multilanguage_texts,
+    query_fields_for_customer, query_templates_for_customer, with_field_payload, get_template_field_ids,
+    TemplateVersion, SyncTombstone, current_row_version
 )
 from dependency_engine import DependencyEngine
+from cache import GenerationCache, bump_generation
+import metrics
+from sql_instrumentation import QueryStatsMiddleware
 from advanced_validation import AdvancedValidator
+from expressions import ExpressionError
+from conditions import ConditionError, compile_dependencies
+import safe_regex
+from offload import BoundedExecutor, ExecutorSaturated
+from dependency_analysis import plan_dependencies, dependant_fields, template_scope
+from compression import CompressionMiddleware, PrecompressedPayload
+from changelog_archive import ChangeLogArchive, RETENTION_DAYS, run_compaction_loop
+from changelog import (snapshot_field, snapshot_template, snapshot_changes, diff_changes, expand_entries,
+                       maybe_checkpoint, state_as_of)
+from publishing import publish_template, latest_versions, find_artifact, encode_render
+from artifact_store import ArtifactStore
+from events import EventBroker, TooManySubscribers, event_stream, notify_committed
+from json_patch import JsonPatchError, JsonPatchTestFailed, apply_patch, parse_pointer
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# Create the main app
-app = FastAPI(title="Vorprozess Regelwerk API", version="1.0.0")
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -84,6 +106,9 @@ class SelectOption(BaseModel):
     value: str
 
 class FieldValidation(BaseModel):
+    # Rule groups of AdvancedValidator ('string', 'number', 'date', 'custom', ...) are kept as given
+    model_config = ConfigDict(extra='allow')
+
     min_length: Optional[int] = None
     max_length: Optional[int] = None
     pattern: Optional[str] = None
@@ -115,6 +140,18 @@ class TemplateRenderRequest(BaseModel):
     role: UserRole
     customer_id: Optional[str] = None
     language: Language = Language.DE
+    # Return texts and option labels only in `language` (with server-side fallback)
+    # instead of all languages
+    project_language: bool = False
+    # Serve the latest published version of each template instead of the draft
+    published: bool = False
+
+class SubmissionValidationRequest(BaseModel):
+    # Submitted values by field ID
+    values: Dict[str, Any]
+    # Validate every field of this template (missing values count as empty)
+    # instead of only the submitted ones
+    template_id: Optional[str] = None
 
 # Response Models
 class TemplateResponse(BaseModel):
@@ -129,6 +166,8 @@ class TemplateResponse(BaseModel):
     updated_at: datetime
     created_by: Optional[str]
     updated_by: Optional[str]
+    # Findings of the dependency analysis by field ID, returned by template updates
+    dependency_issues: Optional[Dict[str, List[Dict[str, Any]]]] = None
 
 class FieldResponse(BaseModel):
     id: str
@@ -147,6 +186,8 @@ class FieldResponse(BaseModel):
     dependencies: Optional[List[Dict[str, Any]]]
     created_at: datetime
     updated_at: datetime
+    # Findings of the dependency analysis, returned by field updates
+    dependency_issues: Optional[List[Dict[str, Any]]] = None
 
 class ChangeLogResponse(BaseModel):
     id: str
@@ -162,6 +203,34 @@ class TemplateRenderResponse(BaseModel):
     templates: List[Dict[str, Any]]
     fields: List[Dict[str, Any]]
 
+class SyncTextResponse(BaseModel):
+    id: str
+    entity_type: str
+    entity_id: str
+    language_code: str
+    text_value: str
+    row_version: int
+
+class SyncDeletionResponse(BaseModel):
+    entity_type: str
+    entity_id: str
+    row_version: int
+
+class SyncResponse(BaseModel):
+    version: int
+    templates: List[TemplateResponse]
+    fields: List[FieldResponse]
+    texts: List[SyncTextResponse]
+    deleted: List[SyncDeletionResponse]
+
+class TemplateVersionResponse(BaseModel):
+    template_id: str
+    version: int
+    customers: List[str]
+    published_at: datetime
+    published_by: Optional[str]
+    snapshot: Optional[Dict[str, Any]] = None
+
 # Helper Functions
 def db_template_to_response(db_template: Template, db: Session) -> TemplateResponse:
     """Convert database template to API response model"""
@@ -172,10 +241,10 @@ def db_template_to_response(db_template: Template, db: Session) -> TemplateRespo
         id=db_template.id,
         name=MultiLanguageTextModel(**name) if name else MultiLanguageTextModel(),
         description=MultiLanguageTextModel(**description) if description else None,
-        fields=[field.id for field in db_template.fields],
+        fields=get_template_field_ids(db, db_template.id),
         role_config=db_template.role_config or {},
         customer_specific=db_template.customer_specific,
-        visible_for_customers=db_template.visible_for_customers,
+        visible_for_customers=list(db_template.visible_for_customers),
         created_at=db_template.created_at,
         updated_at=db_template.updated_at,
         created_by=db_template.created_by,
@@ -199,25 +268,59 @@ def db_field_to_response(db_field: Field, db: Session) -> FieldResponse:
         document_constraints=db_field.document_constraints,
         role_config=db_field.role_config or {},
         customer_specific=db_field.customer_specific,
-        visible_for_customers=db_field.visible_for_customers,
+        visible_for_customers=list(db_field.visible_for_customers),
         dependencies=db_field.dependencies,
         created_at=db_field.created_at,
         updated_at=db_field.updated_at
     )
 
+def get_render_cache(request: Request) -> GenerationCache:
+    """Render cache of the application serving the request"""
+    return request.app.state.render_cache
+
+def get_artifact_store(request: Request) -> Optional[ArtifactStore]:
+    """Memory-mapped store of published renders, None if disabled"""
+    return request.app.state.artifact_store
+
+def get_session_factory(request: Request):
+    """Factory of sessions outside the request's own, e.g. for work shared between requests"""
+    return request.app.state.session_factory
+
+def get_offload_executor(request: Request) -> BoundedExecutor:
+    """Thread pool for the CPU- and DB-bound parts of renders and validations"""
+    return request.app.state.offload_executor
+
+async def run_offloaded(executor: BoundedExecutor, function, *args):
+    """Run function(*args) on the offload executor, answering 503 while its backlog is full"""
+    try:
+        return await executor.run(function, *args)
+    except ExecutorSaturated as e:
+        logger.warning(f"Offload executor saturated: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+
 async def log_change(db: Session, entity_type: str, entity_id: str, action: str, 
-                    changes: Dict[str, Any], user_id: str = "system", user_name: str = "System User"):
-    """Log changes to the change log table"""
+                    changes: Dict[str, Any], user_id: str = "system", user_name: str = "System User",
+                    state: Optional[Dict[str, Any]] = None):
+    """Log changes to the change log table; state (the entity after the change) feeds periodic checkpoints"""
     log_entry = ChangeLogEntry(
         entity_type=entity_type,
         entity_id=entity_id,
         action=action,
         changes=changes,
         user_id=user_id,
-        user_name=user_name
+        user_name=user_name,
+        timestamp=datetime.utcnow()
     )
     db.add(log_entry)
+    if state is not None or action == "deleted":
+        db.flush()
+        maybe_checkpoint(db, entity_type, entity_id, log_entry.timestamp, state)
     db.commit()
+    
+    # Every write goes through here, so this is where other workers' caches get invalidated
+    bump_generation(db)
+    # ... and where this worker's event stream subscribers are told right away
+    notify_committed()
 
 # API Routes
 @api_router.get("/")
@@ -242,7 +345,9 @@ async def create_template(template_data: TemplateCreate, user_id: str = "system"
         set_multilanguage_text(db, "template_description", db_template.id, template_data.description.dict())
     
     # Log change
-    await log_change(db, "template", db_template.id, "created", template_data.dict(), user_id, "System User")
+    state = snapshot_template(db, db_template)
+    await log_change(db, "template", db_template.id, "created", snapshot_changes(state), user_id, "System User",
+                     state=state)
     
     return db_template_to_response(db_template, db)
 
@@ -263,6 +368,7 @@ async def update_template(template_id: str, template_data: TemplateUpdate, user_
     template = db.query(Template).filter(Template.id == template_id).first()
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
+    before = snapshot_template(db, template)
     
     # Update basic fields
     template.updated_at = datetime.utcnow()
@@ -275,6 +381,8 @@ async def update_template(template_id: str, template_data: TemplateUpdate, user_
         # Add new field relationships
         fields = db.query(Field).filter(Field.id.in_(template_data.fields)).all()
         template.fields.extend(fields)
+        # Check the rules of the template's fields against its new composition
+        issues = plan_dependencies(db, fields, [field.id for field in fields])
     
     # Update multilanguage texts
     if template_data.name:
@@ -285,9 +393,14 @@ async def update_template(template_id: str, template_data: TemplateUpdate, user_
     db.commit()
     
     # Log change
-    await log_change(db, "template", template_id, "updated", template_data.dict(exclude_unset=True), user_id, "System User")
+    state = snapshot_template(db, template)
+    await log_change(db, "template", template_id, "updated", diff_changes(before, state), user_id, "System User",
+                     state=state)
     
-    return db_template_to_response(template, db)
+    response = db_template_to_response(template, db)
+    if template_data.fields is not None:
+        response.dependency_issues = issues
+    return response
 
 @api_router.delete("/templates/{template_id}")
 async def delete_template(template_id: str, user_id: str = "system", db: Session = Depends(get_db)):
@@ -296,10 +409,7 @@ async def delete_template(template_id: str, user_id: str = "system", db: Session
         raise HTTPException(status_code=404, detail="Template not found")
     
     # Delete multilanguage texts
-    db.query(MultiLanguageText).filter(
-        MultiLanguageText.entity_type.in_(["template_name", "template_description"]),
-        MultiLanguageText.entity_id == template_id
-    ).delete()
+    delete_multilanguage_texts(db, ["template_name", "template_description"], template_id)
     
     # Delete template
     db.delete(template)
@@ -310,9 +420,57 @@ async def delete_template(template_id: str, user_id: str = "system", db: Session
     
     return {"message": "Template deleted successfully"}
 
+def check_validation_config(db: Session, validation: Any) -> None:
+    """Reject validation configs with unsafe patterns or custom rules that do not compile or refer to unknown fields (422)"""
+    if validation is None:
+        return
+    if not isinstance(validation, dict):
+        raise HTTPException(status_code=422, detail="validation must be an object")
+    validator = AdvancedValidator()
+    try:
+        references = validator.custom_rule_references(validation)
+        known = {row[0] for row in db.query(Field.id).filter(Field.id.in_(references))} if references else set()
+        validator.check_custom_rules(validation, known)
+    except ExpressionError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid custom validation rule: {e}")
+    problems = validator.pattern_problems(validation)
+    if problems:
+        raise HTTPException(status_code=422, detail=f"Pattern rejected: {'; '.join(problems)}")
+
+def check_dependencies_config(dependencies: Any) -> None:
+    """Reject malformed dependency lists and condition groups (422)"""
+    if dependencies is None:
+        return
+    if not isinstance(dependencies, list):
+        raise HTTPException(status_code=422, detail="dependencies must be a list")
+    try:
+        compile_dependencies(dependencies)
+    except ConditionError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid dependencies: {e}")
+
+# Field properties the dependency plans of other fields are derived from
+PLANNED_FIELD_PROPERTIES = {'type', 'select_type', 'options'}
+
+def refresh_dependency_plans(db: Session, field: Field, changed: Iterable[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Re-analyse dependency rules affected by a field update (not committed)
+    
+    Returns:
+        The field's own issues if its dependencies changed, else None
+    """
+    changed = set(changed)
+    issues = None
+    if 'dependencies' in changed:
+        issues = plan_dependencies(db, [field], template_scope(db, field.id)).get(field.id, [])
+    if changed & PLANNED_FIELD_PROPERTIES:
+        plan_dependencies(db, dependant_fields(db, field.id))
+    return issues
+
 # Field endpoints
 @api_router.post("/fields", response_model=FieldResponse)
 async def create_field(field_data: FieldCreate, user_id: str = "system", db: Session = Depends(get_db)):
+    if field_data.validation:
+        check_validation_config(db, field_data.validation.dict())
     # Create field
     db_field = Field(
         type=field_data.type,
@@ -332,18 +490,20 @@ async def create_field(field_data: FieldCreate, user_id: str = "system", db: Ses
     set_multilanguage_text(db, "field_name", db_field.id, field_data.name.dict())
     
     # Log change
-    await log_change(db, "field", db_field.id, "created", field_data.dict(), user_id, "System User")
+    state = snapshot_field(db, db_field)
+    await log_change(db, "field", db_field.id, "created", snapshot_changes(state), user_id, "System User",
+                     state=state)
     
     return db_field_to_response(db_field, db)
 
 @api_router.get("/fields", response_model=List[FieldResponse])
 async def get_fields(db: Session = Depends(get_db)):
-    fields = db.query(Field).all()
+    fields = db.query(Field).options(with_field_payload()).all()
     return [db_field_to_response(field, db) for field in fields]
 
 @api_router.get("/fields/{field_id}", response_model=FieldResponse)
 async def get_field(field_id: str, db: Session = Depends(get_db)):
-    field = db.query(Field).filter(Field.id == field_id).first()
+    field = db.query(Field).options(with_field_payload()).filter(Field.id == field_id).first()
     if not field:
         raise HTTPException(status_code=404, detail="Field not found")
     return db_field_to_response(field, db)
@@ -351,9 +511,16 @@ async def get_field(field_id: str, db: Session = Depends(get_db)):
 # Update field endpoint with dependency support
 @api_router.put("/fields/{field_id}", response_model=FieldResponse)
 async def update_field(field_id: str, field_data: Dict[str, Any], user_id: str = "system", db: Session = Depends(get_db)):
-    field = db.query(Field).filter(Field.id == field_id).first()
+    # Loaded with the JSON payload so that assigning an unchanged value compares
+    # equal to the loaded one and is left out of the UPDATE (no re-encoding)
+    field = db.query(Field).options(with_field_payload()).filter(Field.id == field_id).first()
     if not field:
         raise HTTPException(status_code=404, detail="Field not found")
+    if 'validation' in field_data:
+        check_validation_config(db, field_data['validation'])
+    if 'dependencies' in field_data:
+        check_dependencies_config(field_data['dependencies'])
+    before = snapshot_field(db, field)
     
     # Update field properties
     if 'type' in field_data:
@@ -379,7 +546,8 @@ async def update_field(field_id: str, field_data: Dict[str, Any], user_id: str =
     if 'customer_specific' in field_data:
         field.customer_specific = field_data['customer_specific']
     if 'visible_for_customers' in field_data:
-        field.visible_for_customers = field_data['visible_for_customers']
+        # Deduplicate: customer IDs are part of the association table's primary key
+        field.visible_for_customers = list(dict.fromkeys(field_data['visible_for_customers'] or []))
     
     field.updated_at = datetime.utcnow()
     
@@ -387,12 +555,82 @@ async def update_field(field_id: str, field_data: Dict[str, Any], user_id: str =
     if 'name' in field_data:
         update_multilanguage_text(db, "field_name", field_id, field_data['name'])
     
+    issues = refresh_dependency_plans(db, field, field_data.keys())
     db.commit()
     
     # Log change
-    await log_change(db, "field", field_id, "updated", field_data, user_id, "System User")
+    state = snapshot_field(db, field)
+    await log_change(db, "field", field_id, "updated", diff_changes(before, state), user_id, "System User",
+                     state=state)
     
-    return db_field_to_response(field, db)
+    response = db_field_to_response(field, db)
+    response.dependency_issues = issues
+    return response
+
+# JSON columns that PATCH /fields/{id} may modify, with the type they must keep
+PATCHABLE_FIELD_COLUMNS = {
+    'validation': dict,
+    'options': list,
+    'document_constraints': dict,
+    'dependencies': list,
+    'role_config': dict
+}
+
+# Partial update of large JSON columns (RFC 6902 JSON Patch)
+@api_router.patch("/fields/{field_id}", response_model=FieldResponse)
+async def patch_field(field_id: str, patch: List[Dict[str, Any]], user_id: str = "system", db: Session = Depends(get_db)):
+    """
+    Apply JSON Patch operations to a field's JSON columns
+    
+    Paths start with the column name, e.g. {"op": "add", "path": "/options/-", "value": {...}}.
+    The operations are applied atomically; the change log records the resulting diff.
+    """
+    field = db.query(Field).options(with_field_payload()).filter(Field.id == field_id).first()
+    if not field:
+        raise HTTPException(status_code=404, detail="Field not found")
+    before = snapshot_field(db, field)
+    
+    try:
+        columns = set()
+        for operation in patch:
+            for key in ('path', 'from'):
+                tokens = parse_pointer(operation[key])[:1] if key in operation else None
+                if tokens is not None and (not tokens or tokens[0] not in PATCHABLE_FIELD_COLUMNS):
+                    raise JsonPatchError(
+                        f"Path {operation[key]!r} must start with one of: {', '.join(PATCHABLE_FIELD_COLUMNS)}"
+                    )
+                if tokens:
+                    columns.add(tokens[0])
+        # Only the addressed columns take part; untouched parts of them are shared, not copied
+        document = apply_patch({column: getattr(field, column) for column in columns}, patch)
+    except JsonPatchTestFailed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    for column in columns:
+        if not isinstance(document.get(column), PATCHABLE_FIELD_COLUMNS[column]):
+            expected = 'a list' if PATCHABLE_FIELD_COLUMNS[column] is list else 'an object'
+            raise HTTPException(status_code=422, detail=f"{column} must remain {expected}")
+    if 'validation' in columns:
+        check_validation_config(db, document['validation'])
+    if 'dependencies' in columns:
+        check_dependencies_config(document['dependencies'])
+    for column in columns:
+        setattr(field, column, document[column])
+    
+    field.updated_at = datetime.utcnow()
+    issues = refresh_dependency_plans(db, field, columns)
+    db.commit()
+    
+    # Log change
+    state = snapshot_field(db, field)
+    await log_change(db, "field", field_id, "updated", diff_changes(before, state), user_id, "System User",
+                     state=state)
+    
+    response = db_field_to_response(field, db)
+    response.dependency_issues = issues
+    return response
 
 @api_router.delete("/fields/{field_id}")
 async def delete_field(field_id: str, user_id: str = "system", db: Session = Depends(get_db)):
@@ -401,13 +639,14 @@ async def delete_field(field_id: str, user_id: str = "system", db: Session = Dep
         raise HTTPException(status_code=404, detail="Field not found")
     
     # Delete multilanguage texts
-    db.query(MultiLanguageText).filter(
-        MultiLanguageText.entity_type == "field_name",
-        MultiLanguageText.entity_id == field_id
-    ).delete()
+    delete_multilanguage_texts(db, ["field_name"], field_id)
     
     # Delete field
+    dependants = dependant_fields(db, field_id)
     db.delete(field)
+    db.flush()
+    # Conditions on the deleted field can no longer be met
+    plan_dependencies(db, [dependant for dependant in dependants if dependant.id != field_id])
     db.commit()
     
     # Log change
@@ -415,36 +654,150 @@ async def delete_field(field_id: str, user_id: str = "system", db: Session = Dep
     
     return {"message": "Field deleted successfully"}
 
+# Customer visibility endpoints
+@api_router.get("/customers/{customer_id}/templates", response_model=List[TemplateResponse])
+async def get_templates_for_customer(customer_id: str, db: Session = Depends(get_db)):
+    templates = query_templates_for_customer(db, customer_id).all()
+    return [db_template_to_response(template, db) for template in templates]
+
+@api_router.get("/customers/{customer_id}/fields", response_model=List[FieldResponse])
+async def get_fields_for_customer(customer_id: str, db: Session = Depends(get_db)):
+    fields = query_fields_for_customer(db, customer_id).options(with_field_payload()).all()
+    return [db_field_to_response(field, db) for field in fields]
+
 # Template rendering for roles with advanced dependency logic
 @api_router.post("/templates/render", response_model=TemplateRenderResponse)
-async def render_templates(render_request: TemplateRenderRequest, db: Session = Depends(get_db)):
-    # Initialize dependency engine
-    dep_engine = DependencyEngine(db)
+async def render_templates(render_request: TemplateRenderRequest, request: Request, db: Session = Depends(get_db),
+                           render_cache: GenerationCache = Depends(get_render_cache),
+                           artifact_store: Optional[ArtifactStore] = Depends(get_artifact_store),
+                           executor: BoundedExecutor = Depends(get_offload_executor),
+                           session_factory=Depends(get_session_factory)):
+    template_ids = list(dict.fromkeys(render_request.template_ids))
+    language = render_request.language.value if render_request.project_language else None
+    if render_request.published:
+        payload = render_published(db, template_ids, render_request.role.value, render_request.customer_id, language,
+                                   artifact_store)
+        return payload.response(request.headers.get('accept-encoding'))
+    cache_key = (tuple(template_ids), render_request.role.value, render_request.customer_id, language)
     
-    # Get templates with their fields
-    templates = db.query(Template).filter(Template.id.in_(render_request.template_ids)).all()
+    def render() -> PrecompressedPayload:
+        # Concurrent misses share this render, which may outlive the request
+        # that started it: it uses a session of its own
+        render_db = session_factory()
+        try:
+            return render_payload(render_db)
+        finally:
+            render_db.close()
     
-    # Process each template with advanced filtering
-    template_responses = []
-    for template in templates:
-        rendered_template = dep_engine.render_template_for_role(
-            template=template,
-            role=render_request.role,
-            customer_id=render_request.customer_id,
-            field_values={}  # In real usage, this would come from form data
+    def render_payload(render_db: Session) -> PrecompressedPayload:
+        # Initialize dependency engine
+        dep_engine = DependencyEngine(render_db)
+        
+        # Get templates with their fields, in requested order
+        templates = render_db.query(Template).filter(Template.id.in_(template_ids)).all()
+        templates.sort(key=lambda template: template_ids.index(template.id))
+        
+        # Process each template with advanced filtering
+        template_responses = []
+        for template in templates:
+            rendered_template = dep_engine.render_template_for_role(
+                template=template,
+                role=render_request.role,
+                customer_id=render_request.customer_id,
+                field_values={},  # In real usage, this would come from form data
+                language=language
+            )
+            template_responses.append(rendered_template)
+        
+        # Collect all fields for separate response (backward compatibility)
+        all_fields = []
+        for template_response in template_responses:
+            all_fields.extend(template_response.get('fields', []))
+        
+        # Cached serialised, so hot renders are neither re-encoded nor re-compressed
+        render_response = TemplateRenderResponse(
+            templates=template_responses,
+            fields=all_fields
         )
-        template_responses.append(rendered_template)
-    
-    # Collect all fields for separate response (backward compatibility)
-    all_fields = []
-    for template_response in template_responses:
-        all_fields.extend(template_response.get('fields', []))
+        return PrecompressedPayload(render_response.model_dump_json().encode())
     
-    return TemplateRenderResponse(
-        templates=template_responses,
-        fields=all_fields
+    # Hits are served on the event loop, misses rendered on the offload executor
+    payload = await render_cache.get_or_compute_async(db, cache_key, lambda: run_offloaded(executor, render))
+    return payload.response(request.headers.get('accept-encoding'))
+
+def render_published(db: Session, template_ids: List[str], role: str, customer_id: Optional[str],
+                     language: Optional[str], store: Optional[ArtifactStore] = None) -> PrecompressedPayload:
+    """Render response assembled from the precomputed artifacts of the latest published versions"""
+    versions = latest_versions(db, template_ids)
+    unpublished = [template_id for template_id in template_ids if template_id not in versions]
+    if unpublished:
+        raise HTTPException(status_code=404, detail=f"Templates not published: {', '.join(unpublished)}")
+    payloads = [find_artifact(db, template_id, versions[template_id], role, customer_id, language, store)
+                for template_id in template_ids]
+    if any(payload is None for payload in payloads):
+        raise HTTPException(status_code=404, detail="Render artifact not found")
+    if len(payloads) == 1:
+        return payloads[0]
+    templates = [template for payload in payloads for template in json.loads(bytes(payload.body))["templates"]]
+    return PrecompressedPayload(encode_render(templates))
+
+# Publishing: immutable template versions with precomputed renders
+def template_version_to_response(version: TemplateVersion, with_snapshot: bool = False) -> TemplateVersionResponse:
+    return TemplateVersionResponse(
+        template_id=version.template_id,
+        version=version.version,
+        customers=version.customers or [],
+        published_at=version.published_at,
+        published_by=version.published_by,
+        snapshot=version.snapshot if with_snapshot else None
     )
 
+@api_router.post("/templates/{template_id}/publish", response_model=TemplateVersionResponse)
+async def publish_template_version(template_id: str, user_id: str = "system", db: Session = Depends(get_db),
+                                   artifact_store: Optional[ArtifactStore] = Depends(get_artifact_store)):
+    template = db.query(Template).filter(Template.id == template_id).first()
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    try:
+        version = publish_template(db, template, roles=[role.value for role in UserRole],
+                                   languages=[language.value for language in Language], user_id=user_id,
+                                   store=artifact_store)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Template was published concurrently, retry")
+    
+    return template_version_to_response(version)
+
+@api_router.get("/templates/{template_id}/versions", response_model=List[TemplateVersionResponse])
+async def get_template_versions(template_id: str, db: Session = Depends(get_db)):
+    versions = db.query(TemplateVersion).filter(
+        TemplateVersion.template_id == template_id
+    ).order_by(TemplateVersion.version.desc()).all()
+    return [template_version_to_response(version) for version in versions]
+
+@api_router.get("/templates/{template_id}/versions/{version}", response_model=TemplateVersionResponse)
+async def get_template_version(template_id: str, version: int, db: Session = Depends(get_db)):
+    template_version = db.query(TemplateVersion).filter(
+        TemplateVersion.template_id == template_id,
+        TemplateVersion.version == version
+    ).first()
+    if not template_version:
+        raise HTTPException(status_code=404, detail="Template version not found")
+    return template_version_to_response(template_version, with_snapshot=True)
+
+@api_router.get("/templates/{template_id}/versions/{version}/render", response_model=TemplateRenderResponse)
+async def render_template_version(template_id: str, version: int, role: UserRole, request: Request,
+                                  customer_id: Optional[str] = None, language: Optional[Language] = None,
+                                  db: Session = Depends(get_db),
+                                  artifact_store: Optional[ArtifactStore] = Depends(get_artifact_store)):
+    """Precomputed render of a published version; language projects texts like project_language"""
+    payload = find_artifact(db, template_id, version, role.value, customer_id, language.value if language else None,
+                            artifact_store)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Template version not found")
+    return payload.response(request.headers.get('accept-encoding'))
+
 # Advanced validation endpoint
 @api_router.post("/validate-field")
 async def validate_field_value(
@@ -453,12 +806,13 @@ async def validate_field_value(
     db: Session = Depends(get_db)
 ):
     """Validate a field value using advanced validation rules"""
-    field = db.query(Field).filter(Field.id == field_id).first()
+    field = db.query(Field).options(with_field_payload()).filter(Field.id == field_id).first()
     if not field:
         raise HTTPException(status_code=404, detail="Field not found")
     
+    # Custom rules referring to other fields are not checked, their values are unknown
     validator = AdvancedValidator()
-    result = validator.validate_value(value, field.validation or {})
+    result = validator.validate_value(value, field.validation or {}, {field_id: value})
     
     return {
         "field_id": field_id,
@@ -467,6 +821,36 @@ async def validate_field_value(
         "errors": result["errors"]
     }
 
+# Validation of a whole submission (custom rules can compare fields)
+@api_router.post("/validate-fields")
+async def validate_submission(request: SubmissionValidationRequest, db: Session = Depends(get_db),
+                              executor: BoundedExecutor = Depends(get_offload_executor)):
+    """Validate submitted values; custom rules are evaluated against all values"""
+    
+    def validate() -> Dict[str, Dict[str, Any]]:
+        if request.template_id is not None:
+            if not db.query(Template.id).filter(Template.id == request.template_id).first():
+                raise HTTPException(status_code=404, detail="Template not found")
+            field_ids = get_template_field_ids(db, request.template_id)
+        else:
+            field_ids = list(request.values)
+        fields = db.query(Field).options(with_field_payload()).filter(Field.id.in_(field_ids)).all()
+        # Template fields left out of the submission are empty; custom rules
+        # referring to fields outside of it are not checked
+        values = {**dict.fromkeys(field_ids), **request.values}
+        
+        validator = AdvancedValidator()
+        return {
+            field.id: validator.validate_value(values.get(field.id), field.validation or {}, values)
+            for field in fields
+        }
+    
+    results = await run_offloaded(executor, validate)
+    return {
+        "valid": all(result["valid"] for result in results.values()),
+        "fields": results
+    }
+
 # Get validation schema for field type
 @api_router.get("/validation-schema/{field_type}")
 async def get_validation_schema(field_type: str):
@@ -486,20 +870,27 @@ async def simulate_template_with_values(
     role: UserRole,
     field_values: Dict[str, Any],
     customer_id: Optional[str] = None,
-    db: Session = Depends(get_db)
+    language: Optional[Language] = None,
+    db: Session = Depends(get_db),
+    executor: BoundedExecutor = Depends(get_offload_executor)
 ):
     """Simulate template rendering with specific field values for dependency testing"""
-    template = db.query(Template).filter(Template.id == template_id).first()
-    if not template:
-        raise HTTPException(status_code=404, detail="Template not found")
     
-    dep_engine = DependencyEngine(db)
-    rendered_template = dep_engine.render_template_for_role(
-        template=template,
-        role=role,
-        customer_id=customer_id,
-        field_values=field_values
-    )
+    def simulate() -> Dict[str, Any]:
+        template = db.query(Template).filter(Template.id == template_id).first()
+        if not template:
+            raise HTTPException(status_code=404, detail="Template not found")
+        
+        dep_engine = DependencyEngine(db)
+        return dep_engine.render_template_for_role(
+            template=template,
+            role=role,
+            customer_id=customer_id,
+            field_values=field_values,
+            language=language.value if language else None
+        )
+    
+    rendered_template = await run_offloaded(executor, simulate)
     
     return {
         "template": rendered_template,
@@ -511,66 +902,249 @@ async def simulate_template_with_values(
             "dependencies_processed": True
         }
     }
-@api_router.get("/changelog", response_model=List[ChangeLogResponse])
-async def get_changelog(limit: int = 100, entity_type: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(ChangeLogEntry)
-    
-    if entity_type:
-        query = query.filter(ChangeLogEntry.entity_type == entity_type)
-    
-    changelog = query.order_by(ChangeLogEntry.timestamp.desc()).limit(limit).all()
-    
+def get_changelog_archive(request: Request) -> ChangeLogArchive:
+    """Change-log archive of the application serving the request"""
+    return request.app.state.changelog_archive
+
+def changelog_to_response(db: Session, changelog: List[ChangeLogEntry], expand: bool,
+                          archive: ChangeLogArchive) -> List[ChangeLogResponse]:
+    """Convert change log entries; with expand, changes holds the full entity state after each entry"""
+    states = expand_entries(db, changelog, archive) if expand else {}
     return [ChangeLogResponse(
         id=entry.id,
         entity_type=entry.entity_type,
         entity_id=entry.entity_id,
         action=entry.action,
-        changes=entry.changes,
+        changes=(states.get(entry.id) or {}) if expand else entry.changes,
         user_id=entry.user_id,
         user_name=entry.user_name,
         timestamp=entry.timestamp
     ) for entry in changelog]
 
+@api_router.get("/changelog", response_model=List[ChangeLogResponse])
+async def get_changelog(limit: int = 100, entity_type: Optional[str] = None, expand: bool = False,
+                        include_archived: bool = False, db: Session = Depends(get_db),
+                        archive: ChangeLogArchive = Depends(get_changelog_archive)):
+    query = db.query(ChangeLogEntry)
+    
+    if entity_type:
+        query = query.filter(ChangeLogEntry.entity_type == entity_type)
+    
+    changelog = query.order_by(ChangeLogEntry.timestamp.desc()).limit(limit).all()
+    # Archived entries are older than every entry still in the table
+    if include_archived and len(changelog) < limit:
+        changelog += archive.read(entity_type=entity_type, limit=limit - len(changelog))
+    
+    return changelog_to_response(db, changelog, expand, archive)
+
 @api_router.get("/changelog/{entity_id}")
-async def get_entity_changelog(entity_id: str, db: Session = Depends(get_db)):
+async def get_entity_changelog(entity_id: str, expand: bool = False, include_archived: bool = False,
+                               db: Session = Depends(get_db),
+                               archive: ChangeLogArchive = Depends(get_changelog_archive)):
     changelog = db.query(ChangeLogEntry).filter(
         ChangeLogEntry.entity_id == entity_id
     ).order_by(ChangeLogEntry.timestamp.desc()).limit(100).all()
+    if include_archived and len(changelog) < 100:
+        changelog += archive.read(entity_id=entity_id, limit=100 - len(changelog))
     
-    return [ChangeLogResponse(
-        id=entry.id,
-        entity_type=entry.entity_type,
-        entity_id=entry.entity_id,
-        action=entry.action,
-        changes=entry.changes,
-        user_id=entry.user_id,
-        user_name=entry.user_name,
-        timestamp=entry.timestamp
-    ) for entry in changelog]
+    return changelog_to_response(db, changelog, expand, archive)
 
-# Include the router in the main app
-app.include_router(api_router)
+def entity_as_of(db: Session, entity_type: str, entity_id: str, at: datetime,
+                 archive: ChangeLogArchive) -> Dict[str, Any]:
+    """Point-in-time state of an entity, 404 if it did not exist at that time"""
+    if at.tzinfo is not None:
+        # Change-log timestamps are naive UTC
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    result = state_as_of(db, entity_type, entity_id, at, archive)
+    if result["state"] is None:
+        raise HTTPException(status_code=404, detail=f"{entity_type.capitalize()} did not exist at {at.isoformat()}")
+    return {"entity_type": entity_type, "entity_id": entity_id, "as_of": at, **result}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@api_router.get("/fields/{field_id}/as-of")
+async def get_field_as_of(field_id: str, at: datetime, db: Session = Depends(get_db),
+                          archive: ChangeLogArchive = Depends(get_changelog_archive)):
+    """Field as it was at the given time, reconstructed from the change log"""
+    return entity_as_of(db, "field", field_id, at, archive)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+@api_router.get("/templates/{template_id}/as-of")
+async def get_template_as_of(template_id: str, at: datetime, db: Session = Depends(get_db),
+                             archive: ChangeLogArchive = Depends(get_changelog_archive)):
+    """Template as it was at the given time, reconstructed from the change log"""
+    return entity_as_of(db, "template", template_id, at, archive)
+
+# Delta sync for client-side mirrors of the catalogue
+@api_router.get("/sync", response_model=SyncResponse)
+async def sync_catalogue(since: int = 0, db: Session = Depends(get_db)):
+    """
+    Templates, fields and texts changed after row version `since`, plus deletions
+    
+    Pass the returned `version` as `since` of the next call; since=0 returns
+    the whole catalogue. A version below `since` means the database was
+    reset and the client has to start over.
+    """
+    if since < 0:
+        raise HTTPException(status_code=422, detail="since must not be negative")
+    # Upper bound read first: rows committed meanwhile have higher versions
+    # and are returned by the next sync
+    version = current_row_version(db)
+    
+    templates = db.query(Template).filter(
+        Template.row_version > since, Template.row_version <= version
+    ).order_by(Template.row_version).all()
+    fields = db.query(Field).options(with_field_payload()).filter(
+        Field.row_version > since, Field.row_version <= version
+    ).order_by(Field.row_version).all()
+    texts = db.query(MultiLanguageText).filter(
+        MultiLanguageText.row_version > since, MultiLanguageText.row_version <= version
+    ).order_by(MultiLanguageText.row_version).all()
+    deleted = db.query(SyncTombstone).filter(
+        SyncTombstone.row_version > since, SyncTombstone.row_version <= version
+    ).order_by(SyncTombstone.row_version).all()
+    
+    return SyncResponse(
+        version=version,
+        templates=[db_template_to_response(template, db) for template in templates],
+        fields=[db_field_to_response(field, db) for field in fields],
+        texts=[SyncTextResponse(id=text.id, entity_type=text.entity_type, entity_id=text.entity_id,
+                                language_code=text.language_code, text_value=text.text_value,
+                                row_version=text.row_version) for text in texts],
+        deleted=[SyncDeletionResponse(entity_type=tombstone.entity_type, entity_id=tombstone.entity_id,
+                                      row_version=tombstone.row_version) for tombstone in deleted]
+    )
 
-@app.on_event("startup")
-async def startup_event():
-    create_tables()
-    logger.info("Database tables created successfully")
+# Server-sent events of committed catalogue changes
+@api_router.get("/events")
+async def stream_events(request: Request):
+    """
+    text/event-stream of template and field changes ({type, id, version, action})
+    
+    A 'resync' event means events were dropped for this client; it should
+    catch up with /api/sync?since=<last version it processed>.
+    """
+    broker: EventBroker = request.app.state.event_broker
+    try:
+        queue = await broker.subscribe()
+    except TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many event subscribers, poll /api/sync instead")
+    return StreamingResponse(event_stream(broker, queue), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Prometheus scrape endpoint (outside /api, scraped from inside the cluster)
+async def get_metrics(request: Request):
+    return Response(content=request.app.state.metrics_registry.render(), media_type=metrics.CONTENT_TYPE)
+
+def create_app(engine=None, database_url: Optional[str] = None, manage_schema: bool = True) -> FastAPI:
+    """
+    Create an application instance
+    
+    Args:
+        engine: Engine to serve from; defaults to the lazily created DATABASE_URL engine
+        database_url: Alternative to engine, e.g. "sqlite://" for an in-memory database
+        manage_schema: Run ensure_schema() on startup
+        
+    Returns:
+        FastAPI application with its own sessions, caches and metrics
+    """
+    app = FastAPI(title="Vorprozess Regelwerk API", version="1.0.0")
+    
+    if engine is None and database_url:
+        engine = make_engine(database_url)
+    session_factory = None
+    if engine is not None:
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        
+        def get_app_db():
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+        
+        app.dependency_overrides[get_db] = get_app_db
+    app.state.engine = engine
+    
+    def app_engine():
+        return app.state.engine or get_engine()
+    
+    def app_session() -> Session:
+        # Sessions outside requests (background jobs)
+        if session_factory is not None:
+            return session_factory()
+        get_engine()
+        return SessionLocal()
+    
+    # Render results per (templates, role, customer), invalidated by catalogue writes in any worker
+    app.state.render_cache = GenerationCache("render", max_entries=int(os.environ.get('RENDER_CACHE_SIZE', '512')))
+    
+    # Change-log entries moved out of the table by the retention job
+    app.state.changelog_archive = ChangeLogArchive()
+    
+    # Published renders, shared with the other workers through the page cache
+    app.state.artifact_store = None
+    if os.environ.get('RENDER_ARTIFACT_STORE_ENABLED', 'true').lower() != 'false':
+        app.state.artifact_store = ArtifactStore()
+    app.state.compaction_task = None
+    
+    # Renders, simulations and submission validations run off the event loop
+    app.state.offload_executor = BoundedExecutor()
+    app.state.session_factory = app_session
+    
+    # Change notifications for /api/events
+    app.state.event_broker = EventBroker(app_session)
+    
+    app.state.metrics_registry = metrics.MetricsRegistry()
+    http_metrics = metrics.HttpMetrics(app.state.metrics_registry)
+    app.state.metrics_registry.add_collector(metrics.pool_collector(app_engine))
+    app.state.metrics_registry.add_collector(metrics.cache_collector(
+        lambda: [cache for cache in (app.state.render_cache, app.state.artifact_store) if cache is not None]
+    ))
+    app.state.metrics_registry.add_collector(metrics.events_collector(lambda: app.state.event_broker))
+    app.state.metrics_registry.add_collector(metrics.regex_collector(safe_regex.failure_counts))
+    app.state.metrics_registry.add_collector(metrics.offload_collector(lambda: app.state.offload_executor))
+    app.add_api_route("/metrics", get_metrics, methods=["GET"], include_in_schema=False)
+    
+    # Include the router in the main app
+    app.include_router(api_router)
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Precompressed responses (cached renders) pass through untouched
+    if os.environ.get('COMPRESSION_ENABLED', 'true').lower() != 'false':
+        app.add_middleware(CompressionMiddleware)
+    
+    # Added last so they wrap everything else: metrics see the full request
+    # latency and read the SQL statistics tracked by the outermost middleware
+    if os.environ.get('METRICS_ENABLED', 'true').lower() != 'false':
+        app.add_middleware(metrics.MetricsMiddleware, http_metrics=http_metrics)
+    app.add_middleware(QueryStatsMiddleware)
+    
+    async def startup_event():
+        started = time.perf_counter()
+        if manage_schema and ensure_schema(app_engine()):
+            logger.info("Database schema migrated")
+        if RETENTION_DAYS > 0:
+            app.state.compaction_task = asyncio.create_task(
+                run_compaction_loop(app_session, app.state.changelog_archive)
+            )
+        logger.info(f"Startup completed in {(time.perf_counter() - started) * 1000:.1f} ms")
+    
+    async def shutdown_event():
+        if app.state.compaction_task is not None:
+            app.state.compaction_task.cancel()
+        app.state.event_broker.close()
+        app.state.offload_executor.shutdown()
+        logger.info("Application shutting down")
+    
+    app.add_event_handler("startup", startup_event)
+    app.add_event_handler("shutdown", shutdown_event)
+    
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Application shutting down")
\ No newline at end of file
+# Default application for `uvicorn server:app`
+app = create_app()
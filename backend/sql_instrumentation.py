@@ -0,0 +1,157 @@
+"""
+Per-request SQL Instrumentation
+Counts and times every statement executed through SQLAlchemy and attributes
+them to the HTTP request (or test block) that issued them
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Response headers with the request's SQL statistics are opt-in
+HEADERS_ENABLED = os.environ.get('SQL_STATS_HEADERS', 'false').lower() == 'true'
+# Requests above these limits are logged as warnings instead of debug lines
+WARN_STATEMENTS = int(os.environ.get('SQL_STATS_WARN_STATEMENTS', '50'))
+WARN_TIME_MS = float(os.environ.get('SQL_STATS_WARN_MS', '500'))
+
+MAX_STATEMENT_LENGTH = 200
+
+class QueryStats:
+    """Statement count, total DB time and slowest statement of one unit of work"""
+
+    def __init__(self, keep_statements: bool = False):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.statements: Optional[List[str]] = [] if keep_statements else None
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        if elapsed >= self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+        if self.statements is not None:
+            self.statements.append(statement)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "sql_statements": self.count,
+            "sql_time_ms": round(self.total_time * 1000, 3),
+            "sql_slowest_ms": round(self.slowest_time * 1000, 3),
+            "sql_slowest_statement": _shorten(self.slowest_statement)
+        }
+
+def _shorten(statement: Optional[str]) -> Optional[str]:
+    if statement is None:
+        return None
+    statement = ' '.join(statement.split())
+    if len(statement) > MAX_STATEMENT_LENGTH:
+        return statement[:MAX_STATEMENT_LENGTH] + '...'
+    return statement
+
+# Stats of the request currently being served (None outside requests)
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar('sql_query_stats', default=None)
+# Process-wide captures used by tests, independent of the request context
+_captures: List[QueryStats] = []
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start_time'].pop()
+    elapsed = time.perf_counter() - started
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    for capture in _captures:
+        capture.record(statement, elapsed)
+
+def current_stats() -> Optional[QueryStats]:
+    """Return the statistics of the request currently being served"""
+    return _current_stats.get()
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Attribute statements executed in the current context to a fresh QueryStats"""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+@contextmanager
+def capture_queries() -> Iterator[QueryStats]:
+    """Record every statement executed in this process, regardless of context"""
+    stats = QueryStats(keep_statements=True)
+    _captures.append(stats)
+    try:
+        yield stats
+    finally:
+        _captures.remove(stats)
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryStats]:
+    """
+    Test helper failing when the block executes more than limit statements
+
+    Usage:
+        with assert_max_queries(3):
+            client.get("/api/fields/...")
+    """
+    with capture_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        listing = '\n'.join(f"  {i + 1}. {_shorten(s)}" for i, s in enumerate(stats.statements))
+        raise AssertionError(f"Expected at most {limit} SQL statements, {stats.count} executed:\n{listing}")
+
+class QueryStatsMiddleware:
+    """ASGI middleware tracking SQL statistics per request"""
+
+    def __init__(self, app, headers_enabled: Optional[bool] = None):
+        self.app = app
+        self.headers_enabled = HEADERS_ENABLED if headers_enabled is None else headers_enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_wrapper(message):
+                if message['type'] == 'http.response.start' and self.headers_enabled:
+                    headers = list(message.get('headers', []))
+                    headers.extend([
+                        (b'x-sql-statements', str(stats.count).encode()),
+                        (b'x-sql-time-ms', f"{stats.total_time * 1000:.3f}".encode()),
+                        (b'x-sql-slowest-ms', f"{stats.slowest_time * 1000:.3f}".encode())
+                    ])
+                    message = {**message, 'headers': headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                _log_request(scope, stats)
+
+def _log_request(scope, stats: QueryStats) -> None:
+    route = getattr(scope.get('route'), 'path', None) or scope.get('path')
+    fields = {"method": scope.get('method'), "route": route, **stats.as_dict()}
+    slow = stats.count > WARN_STATEMENTS or stats.total_time * 1000 > WARN_TIME_MS
+    level = logging.WARNING if slow else logging.DEBUG
+    if logger.isEnabledFor(level):
+        message = ' '.join(f'{key}="{value}"' if isinstance(value, str) else f"{key}={value}"
+                           for key, value in fields.items())
+        logger.log(level, f"sql_stats {message}", extra=fields)
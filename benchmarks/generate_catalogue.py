@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Synthetic Catalogue Generator for Scale Testing
+Fills the database.py schema with a seeded, production-sized catalogue:
+templates, tri-lingual fields with select options, deep dependency chains,
+role configs, customer-specific visibility and change-log history.
+Rows are written with chunked bulk inserts.
+
+Usage:
+    python benchmarks/generate_catalogue.py --database-url sqlite:///scale.db --fields 5000
+    python benchmarks/generate_catalogue.py --templates 200 --customers 500 --changelog 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+
+LANGUAGES = ("de", "fr", "it")
+ROLES = ("anmelder", "klient", "admin")
+WORDS = {
+    "de": ["Angaben", "Firma", "Adresse", "Vertrag", "Nachweis", "Kontakt", "Bank", "Steuer", "Person", "Dokument"],
+    "fr": ["Données", "Société", "Adresse", "Contrat", "Preuve", "Contact", "Banque", "Impôt", "Personne", "Document"],
+    "it": ["Dati", "Ditta", "Indirizzo", "Contratto", "Prova", "Contatto", "Banca", "Imposta", "Persona", "Documento"],
+}
+CHUNK_SIZE = 5000
+
+class CatalogueConfig:
+    """Sizes and ratios of the generated catalogue"""
+
+    def __init__(self, templates: int = 50, fields: int = 2000, fields_per_template: int = 80,
+                 options_per_select: int = 12, select_ratio: float = 0.35, document_ratio: float = 0.1,
+                 dependency_ratio: float = 0.6, chain_ratio: float = 0.7, max_conditions: int = 3,
+                 role_config_ratio: float = 0.5, customers: int = 300, customer_specific_ratio: float = 0.15,
+                 customers_per_entity: int = 4, changelog: int = 20000, history_days: int = 730,
+                 seed: int = 1234):
+        self.templates = templates
+        self.fields = fields
+        self.fields_per_template = fields_per_template
+        self.options_per_select = options_per_select
+        self.select_ratio = select_ratio
+        self.document_ratio = document_ratio
+        self.dependency_ratio = dependency_ratio
+        self.chain_ratio = chain_ratio
+        self.max_conditions = max_conditions
+        self.role_config_ratio = role_config_ratio
+        self.customers = customers
+        self.customer_specific_ratio = customer_specific_ratio
+        self.customers_per_entity = customers_per_entity
+        self.changelog = changelog
+        self.history_days = history_days
+        self.seed = seed
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def _texts(rng: random.Random, prefix: str, index: int) -> Dict[str, str]:
+    words = [rng.randrange(len(WORDS["de"])) for _ in range(rng.randint(1, 3))]
+    return {lang: f"{' '.join(WORDS[lang][w] for w in words)} {prefix}{index}" for lang in LANGUAGES}
+
+def _role_config(rng: random.Random) -> Dict[str, Any]:
+    config = {}
+    for role in rng.sample(ROLES, k=rng.randint(1, 3)):
+        config[role] = {
+            "visible": rng.random() < 0.85,
+            "visibility": rng.choice(["visible", "editable"]),
+            "requirement": rng.choice(["optional", "required"]),
+        }
+    return config
+
+def _bulk_insert(db, model_or_table, rows: List[Dict[str, Any]]) -> None:
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.execute(insert(model_or_table), rows[start:start + CHUNK_SIZE])
+
+def _condition(rng: random.Random, controller: Dict[str, Any]) -> Dict[str, Any]:
+    if controller["type"] == "select" and controller["options"]:
+        values = [opt["value"] for opt in controller["options"]]
+        if rng.random() < 0.3:
+            return {"field_id": controller["id"], "operator": "in",
+                    "condition_value": rng.sample(values, k=min(len(values), rng.randint(2, 4)))}
+        return {"field_id": controller["id"], "operator": rng.choice(["equals", "not_equals"]),
+                "condition_value": rng.choice(values)}
+    return {"field_id": controller["id"], "operator": rng.choice(["is_not_empty", "contains", "is_empty"]),
+            "condition_value": rng.choice(WORDS["de"]).lower()}
+
+def generate_catalogue(db, config: CatalogueConfig) -> Dict[str, Any]:
+    """
+    Generate a synthetic catalogue into the session's database
+
+    Args:
+        db: Database session, committed by this call
+        config: Catalogue sizes and seed
+
+    Returns:
+        Row counts per table and generated template/field IDs
+    """
+    from database import (Template, Field, MultiLanguageText, ChangeLogEntry, FieldCustomer,
+                          TemplateCustomer, template_fields, next_row_version)
+
+    rng = random.Random(config.seed)
+    now = datetime.utcnow()
+    customers = [f"customer-{i:05d}" for i in range(config.customers)]
+
+    fields: List[Dict[str, Any]] = []
+    for i in range(config.fields):
+        roll = rng.random()
+        field_type = "select" if roll < config.select_ratio else \
+            "document" if roll < config.select_ratio + config.document_ratio else "text"
+        options = []
+        if field_type == "select":
+            for o in range(rng.randint(2, config.options_per_select)):
+                options.append({"id": _uuid(rng), "value": f"opt_{o}", "label": _texts(rng, "Option ", o)})
+        fields.append({
+            "id": _uuid(rng),
+            "type": field_type,
+            "visibility": rng.choice(["visible", "editable", "editable"]),
+            "requirement": rng.choice(["optional", "optional", "required"]),
+            "validation": {"string": {"min_length": 1, "max_length": rng.choice([50, 120, 500])}}
+            if field_type == "text" else {},
+            "select_type": rng.choice(["radio", "multiple"]) if field_type == "select" else None,
+            "options": options,
+            "document_mode": rng.choice(["download", "upload", "download_upload"]) if field_type == "document" else None,
+            "document_constraints": {"max_size_mb": rng.choice([5, 10, 20]), "allowed_formats": ["pdf", "docx"]}
+            if field_type == "document" else {},
+            "role_config": _role_config(rng) if rng.random() < config.role_config_ratio else {},
+            "customer_specific": rng.random() < config.customer_specific_ratio,
+            "dependencies": [],
+            "created_at": now - timedelta(days=rng.randrange(config.history_days)),
+            "updated_at": now,
+        })
+
+    templates: List[Dict[str, Any]] = []
+    links: List[Dict[str, str]] = []
+    for t in range(config.templates):
+        template_id = _uuid(rng)
+        templates.append({
+            "id": template_id,
+            "role_config": _role_config(rng) if rng.random() < config.role_config_ratio else {},
+            "customer_specific": rng.random() < config.customer_specific_ratio,
+            "created_at": now - timedelta(days=rng.randrange(config.history_days)),
+            "updated_at": now,
+            "created_by": "generator",
+            "updated_by": "generator",
+        })
+        members = rng.sample(fields, k=min(config.fields_per_template, len(fields)))
+        for position, field in enumerate(members):
+            links.append({"template_id": template_id, "field_id": field["id"]})
+            # Dependencies only point at fields earlier in the same template;
+            # chaining to the direct predecessor builds deep chains
+            if position and rng.random() < config.dependency_ratio and not field["dependencies"]:
+                for _ in range(rng.randint(1, config.max_conditions)):
+                    controller = members[position - 1] if rng.random() < config.chain_ratio \
+                        else members[rng.randrange(position)]
+                    field["dependencies"].append(_condition(rng, controller))
+
+    texts: List[Dict[str, Any]] = []
+    for entity_type, rows, prefix in (("field_name", fields, "Feld "), ("template_name", templates, "Vorlage "),
+                                      ("template_description", templates, "Beschreibung ")):
+        for index, row in enumerate(rows):
+            for lang, value in _texts(rng, prefix, index).items():
+                texts.append({"id": _uuid(rng), "entity_type": entity_type, "entity_id": row["id"],
+                              "language_code": lang, "text_value": value, "created_at": row["created_at"]})
+
+    field_customers = []
+    template_customers = []
+    if customers:
+        for field in fields:
+            if field["customer_specific"]:
+                for customer in rng.sample(customers, k=min(config.customers_per_entity, len(customers))):
+                    field_customers.append({"field_id": field["id"], "customer_id": customer})
+        for template in templates:
+            if template["customer_specific"]:
+                for customer in rng.sample(customers, k=min(config.customers_per_entity, len(customers))):
+                    template_customers.append({"template_id": template["id"], "customer_id": customer})
+
+    changelog = []
+    entities = [("field", f["id"]) for f in fields] + [("template", t["id"]) for t in templates]
+    for _ in range(config.changelog if entities else 0):
+        entity_type, entity_id = rng.choice(entities)
+        changelog.append({
+            "id": _uuid(rng),
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "action": rng.choice(["created", "updated", "updated", "updated", "deleted"]),
+            "changes": {"name": _texts(rng, "", 0)} if rng.random() < 0.5 else {"requirement": "required"},
+            "user_id": f"user-{rng.randrange(50)}",
+            "user_name": "Generator",
+            "timestamp": now - timedelta(seconds=rng.randrange(config.history_days * 86400)),
+        })
+
+    # Core inserts bypass the before_flush hook that stamps row versions; the
+    # generated rows share one version, so delta syncs (since=0) return them
+    version = next_row_version(db)
+    for row in fields + templates + texts:
+        row["row_version"] = version
+
+    _bulk_insert(db, Field, fields)
+    _bulk_insert(db, Template, templates)
+    _bulk_insert(db, template_fields, links)
+    _bulk_insert(db, MultiLanguageText, texts)
+    _bulk_insert(db, FieldCustomer, field_customers)
+    _bulk_insert(db, TemplateCustomer, template_customers)
+    _bulk_insert(db, ChangeLogEntry, changelog)
+    db.commit()
+
+    return {
+        "counts": {
+            "templates": len(templates),
+            "fields": len(fields),
+            "template_fields": len(links),
+            "options": sum(len(f["options"]) for f in fields),
+            "dependencies": sum(len(f["dependencies"]) for f in fields),
+            "multilanguage_texts": len(texts),
+            "field_customers": len(field_customers),
+            "template_customers": len(template_customers),
+            "change_logs": len(changelog),
+        },
+        "template_ids": [t["id"] for t in templates],
+        "field_ids": [f["id"] for f in fields],
+        "select_values": {f["id"]: [o["value"] for o in f["options"]] for f in fields if f["type"] == "select"},
+        "customers": customers,
+    }
+
+def main() -> None:
+    defaults = CatalogueConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Target database (default: DATABASE_URL)")
+    for name, value in vars(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    if not os.environ.get("DATABASE_URL"):
+        raise SystemExit("Set DATABASE_URL or pass --database-url")
+
+    import database
+
+    database.engine.echo = False
+    database.create_tables()
+    config = CatalogueConfig(**{name: getattr(args, name) for name in vars(defaults)})
+    db = database.SessionLocal()
+    started = time.perf_counter()
+    try:
+        result = generate_catalogue(db, config)
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - started
+
+    for table, count in result["counts"].items():
+        print(f"{table:<22}{count:>10}")
+    print(f"\nGenerated in {elapsed:.2f}s (seed {config.seed})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Load-Test Harness for the Regelwerk API
+Replays a weighted mix of render, simulate, validate, list and write calls
+at a target concurrency, either against the FastAPI app in-process (default)
+or against a running server, and reports latency percentiles and throughput
+per endpoint.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 32 --requests 5000
+    python benchmarks/load_test.py --base-url http://localhost:8001 --duration 30
+    python benchmarks/load_test.py --mix render=50,list=30,write=20 --output load.json
+    python benchmarks/load_test.py --generate --templates 50 --fields 80 --catalogue-fields 2000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+
+DEFAULT_MIX = "render=35,simulate=20,validate=15,list=25,write=5"
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'. Available: {', '.join(SCENARIOS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class Catalogue:
+    """IDs of the entities created for the run"""
+
+    def __init__(self):
+        self.template_ids: List[str] = []
+        self.field_ids: List[str] = []
+        self.select_values: Dict[str, List[str]] = {}
+
+async def seed(client: httpx.AsyncClient, templates: int, fields_per_template: int, rng: random.Random) -> Catalogue:
+    """Create templates with select and text fields chained by dependencies through the API"""
+    catalogue = Catalogue()
+    for t in range(templates):
+        field_ids = []
+        for f in range(fields_per_template):
+            is_select = f % 3 == 0
+            payload = {"name": {"de": f"Feld {t}.{f}", "fr": f"Champ {t}.{f}", "it": f"Campo {t}.{f}"},
+                       "type": "select" if is_select else "text"}
+            if is_select:
+                payload["select_type"] = "radio"
+                payload["options"] = [{"id": f"o{i}", "value": f"v{i}", "label": {"de": f"Wert {i}"}} for i in range(8)]
+            response = await client.post("/api/fields", json=payload)
+            response.raise_for_status()
+            field_id = response.json()["id"]
+            if is_select:
+                catalogue.select_values[field_id] = [f"v{i}" for i in range(8)]
+            elif field_ids:
+                controller = rng.choice([fid for fid in field_ids if fid in catalogue.select_values] or field_ids)
+                await client.put(f"/api/fields/{field_id}", json={
+                    "dependencies": [{"field_id": controller, "operator": "equals", "condition_value": "v1"}],
+                    "validation": {"string": {"min_length": 2, "max_length": 80}},
+                })
+            field_ids.append(field_id)
+        response = await client.post("/api/templates", json={"name": {"de": f"Template {t}"}})
+        response.raise_for_status()
+        template_id = response.json()["id"]
+        await client.put(f"/api/templates/{template_id}", json={"fields": field_ids})
+        catalogue.template_ids.append(template_id)
+        catalogue.field_ids.extend(field_ids)
+    return catalogue
+
+async def scenario_render(client, catalogue, rng):
+    ids = rng.sample(catalogue.template_ids, k=min(2, len(catalogue.template_ids)))
+    return await client.post("/api/templates/render", json={
+        "template_ids": ids, "role": rng.choice(["anmelder", "klient", "admin"]), "language": "de"
+    })
+
+async def scenario_simulate(client, catalogue, rng):
+    values = {fid: rng.choice(opts) for fid, opts in catalogue.select_values.items() if rng.random() < 0.5}
+    return await client.post("/api/templates/simulate", params={
+        "template_id": rng.choice(catalogue.template_ids), "role": "klient"
+    }, json=values)
+
+async def scenario_validate(client, catalogue, rng):
+    return await client.post("/api/validate-field", params={
+        "field_id": rng.choice(catalogue.field_ids), "value": rng.choice(["x", "Muster AG", "v1"])
+    })
+
+async def scenario_list(client, catalogue, rng):
+    return await client.get(rng.choice(["/api/templates", "/api/fields"]))
+
+async def scenario_write(client, catalogue, rng):
+    field_id = rng.choice(catalogue.field_ids)
+    return await client.put(f"/api/fields/{field_id}", json={
+        "name": {"de": f"Feld {rng.randrange(10**6)}"}
+    })
+
+SCENARIOS = {
+    "render": scenario_render,
+    "simulate": scenario_simulate,
+    "validate": scenario_validate,
+    "list": scenario_list,
+    "write": scenario_write,
+}
+
+async def run_load(client: httpx.AsyncClient, catalogue: Catalogue, weights: Dict[str, float],
+                   concurrency: int, total_requests: Optional[int], duration: Optional[float],
+                   rng: random.Random) -> Tuple[Dict[str, List[float]], Dict[str, int], float]:
+    latencies: Dict[str, List[float]] = {name: [] for name in weights}
+    errors: Dict[str, int] = {name: 0 for name in weights}
+    names, cumulative = list(weights), list(weights.values())
+    remaining = [total_requests] if total_requests else None
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker(worker_rng: random.Random):
+        while True:
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            name = worker_rng.choices(names, weights=cumulative)[0]
+            started = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](client, catalogue, worker_rng)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append(time.perf_counter() - started)
+            if failed:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(random.Random(rng.random())) for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+def summarise(latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    endpoints = {}
+    all_latencies = []
+    for name, values in latencies.items():
+        values = sorted(values)
+        all_latencies.extend(values)
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "throughput_rps": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": (values[-1] if values else 0.0) * 1000,
+        }
+    all_latencies.sort()
+    return {
+        "elapsed_s": elapsed,
+        "total": {
+            "requests": len(all_latencies),
+            "errors": sum(errors.values()),
+            "throughput_rps": len(all_latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(all_latencies, 50) * 1000,
+            "p95_ms": percentile(all_latencies, 95) * 1000,
+            "p99_ms": percentile(all_latencies, 99) * 1000,
+        },
+        "endpoints": endpoints,
+    }
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{'endpoint':<12}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for name, row in rows:
+        print(f"{name:<12}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>10.1f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+def generate(args, rng: random.Random) -> Catalogue:
+    """Bulk-generate a large catalogue directly into the in-process database"""
+    import database
+    from generate_catalogue import CatalogueConfig, generate_catalogue
+
+    config = CatalogueConfig(templates=args.templates, fields=args.catalogue_fields,
+                             fields_per_template=args.fields, changelog=0, seed=rng.randrange(2**32))
+    db = database.SessionLocal()
+    try:
+        result = generate_catalogue(db, config)
+    finally:
+        db.close()
+    catalogue = Catalogue()
+    catalogue.template_ids = result["template_ids"]
+    catalogue.field_ids = result["field_ids"]
+    catalogue.select_values = result["select_values"]
+    return catalogue
+
+def in_process_client() -> httpx.AsyncClient:
+    """Client calling the FastAPI app directly through ASGI, backed by a throwaway database"""
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='regelwerk-load-')}/load.db"
+    import database
+    from server import app
+
+    database.engine.echo = False
+    database.create_tables()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Report unhandled app exceptions as 500s like a real server instead of aborting the run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://loadtest")
+
+async def main_async(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    weights = parse_mix(args.mix)
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        client = in_process_client()
+
+    async with client:
+        print(f"Seeding {args.templates} templates x {args.fields} fields ...")
+        if args.generate:
+            catalogue = generate(args, rng)
+        else:
+            catalogue = await seed(client, args.templates, args.fields, rng)
+        print(f"Running mix {weights} at concurrency {args.concurrency} ...")
+        latencies, errors, elapsed = await run_load(
+            client, catalogue, weights, args.concurrency,
+            None if args.duration else args.requests, args.duration, rng
+        )
+
+    report = summarise(latencies, errors, elapsed)
+    report["config"] = {
+        "target": args.base_url or "in-process",
+        "mix": weights,
+        "concurrency": args.concurrency,
+        "templates": args.templates,
+        "fields_per_template": args.fields,
+        "generated": args.generate,
+        "seed": args.seed,
+    }
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted scenario mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent virtual clients")
+    parser.add_argument("--requests", type=int, default=2000, help="Total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of a request count")
+    parser.add_argument("--templates", type=int, default=10, help="Templates to seed")
+    parser.add_argument("--fields", type=int, default=30, help="Fields per seeded template")
+    parser.add_argument("--generate", action="store_true",
+                        help="Bulk-generate the catalogue in-process instead of seeding through the API")
+    parser.add_argument("--catalogue-fields", type=int, default=2000, help="Distinct fields with --generate")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout against a live server")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+    if args.generate and args.base_url:
+        parser.error("--generate writes to the in-process database and cannot be combined with --base-url")
+
+    # One INFO line per request would dominate the run
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
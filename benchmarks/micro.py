@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the Dependency Engine and Validators
+Runs in-process against a throwaway SQLite database and writes
+machine-readable results that can be compared across commits.
+
+Usage:
+    python benchmarks/micro.py --output bench-results.json
+    python benchmarks/micro.py --quick --compare bench-results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='regelwerk-bench-')}/bench.db"
+
+import database  # noqa: E402
+from database import Field, Template, FieldCustomer, set_multilanguage_text  # noqa: E402
+from dependency_engine import DependencyEngine  # noqa: E402
+from advanced_validation import AdvancedValidator  # noqa: E402
+
+OPERATORS = {
+    "equals": ("a", "a"),
+    "not_equals": ("a", "b"),
+    "in": ("b", ["a", "b", "c"]),
+    "not_in": ("d", ["a", "b", "c"]),
+    "contains": ("Hello World", "world"),
+    "greater_than": ("42", "10"),
+    "less_than": ("3", "10"),
+    "regex_match": ("CHE-123.456.789", r"^CHE-\d{3}\.\d{3}\.\d{3}$"),
+    "is_empty": ("", None),
+    "is_not_empty": ("x", None),
+}
+
+VALIDATION_CASES = {
+    "string": ("info@example.ch", {"string": {"min_length": 3, "max_length": 120, "format": "email"}}),
+    "string_pattern": ("CHE-123.456.789", {"string": {"pattern": r"^CHE-\d{3}\.\d{3}\.\d{3}$"}}),
+    "number": ("1234.56", {"number": {"min_value": 0, "max_value": 10000, "max_decimal_places": 2}}),
+    "date": ("2024-02-29", {"date": {"min_date": "2000-01-01", "max_date": "2100-12-31"}}),
+    "file": (None, {"file": {"max_size_mb": 10, "allowed_extensions": ["pdf", "docx"]}}),
+    "custom": ("x", {"custom": {}}),
+}
+
+class _Upload:
+    """Stand-in for an uploaded file"""
+
+    filename = "vertrag.pdf"
+    size = 2 * 1024 * 1024
+    content_type = "application/pdf"
+
+def build_fields(count: int, dependencies_per_field: int, rng: random.Random) -> List[Field]:
+    """Create transient fields with role configs, customer flags and dependency chains"""
+    fields = []
+    for i in range(count):
+        field = Field(
+            id=f"field-{i:05d}",
+            type=rng.choice(["text", "select", "document"]),
+            visibility="editable",
+            requirement="optional",
+            validation={},
+            options=[{"id": f"o{j}", "value": f"v{j}", "label": {"de": f"Option {j}"}} for j in range(5)],
+            role_config=rng.choice([
+                {},
+                {"klient": {"visible": True, "requirement": "required"}},
+                {"anmelder": {"visible": False}},
+            ]),
+            customer_specific=rng.random() < 0.2,
+            dependencies=[],
+        )
+        for _ in range(dependencies_per_field if i else 0):
+            target = rng.randrange(i)
+            operator = rng.choice(["equals", "in", "not_equals", "is_not_empty"])
+            value = ["v1", "v2"] if operator == "in" else "v1"
+            field.dependencies.append({"field_id": f"field-{target:05d}", "operator": operator, "condition_value": value})
+        fields.append(field)
+    return fields
+
+def seed_template(db, fields: List[Field], customers: int, rng: random.Random) -> Template:
+    """Persist fields into a template so render_template_for_role can run against the DB"""
+    template = Template(id="bench-template", role_config={}, customer_specific=False)
+    template.fields.extend(fields)
+    db.add(template)
+    db.flush()
+    for field in fields:
+        if field.customer_specific:
+            for c in rng.sample(range(customers), k=min(3, customers)):
+                db.add(FieldCustomer(field_id=field.id, customer_id=f"customer-{c}"))
+    db.commit()
+    set_multilanguage_text(db, "template_name", template.id, {"de": "Benchmark", "fr": "Benchmark", "it": "Benchmark"})
+    for field in fields:
+        set_multilanguage_text(db, "field_name", field.id, {"de": f"Feld {field.id}", "fr": "Champ", "it": "Campo"})
+    return template
+
+def measure(name: str, func: Callable[[], Any], repeat: int, params: Optional[Dict[str, Any]] = None,
+            min_time: float = 0.2) -> Dict[str, Any]:
+    """Time func with timeit: calibrate a loop count, then take repeat samples"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    median = statistics.median(samples)
+    result = {
+        "name": name,
+        "params": params or {},
+        "loops": number,
+        "repeat": repeat,
+        "median_s": median,
+        "min_s": min(samples),
+        "stdev_s": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "ops_per_s": 1 / median if median else None,
+    }
+    print(f"{name:<55} {median * 1e6:>12.2f} us/op  ({number} loops x {repeat})")
+    return result
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    database.engine.echo = False
+    database.create_tables()
+    db = database.SessionLocal()
+    engine = DependencyEngine(db)
+    validator = AdvancedValidator()
+    results = []
+
+    # evaluate_condition per operator
+    for operator, (current, expected) in OPERATORS.items():
+        condition = {"field_id": "f", "operator": operator, "condition_value": expected}
+        values = {"f": current}
+        results.append(measure(f"evaluate_condition[{operator}]",
+                               lambda c=condition, v=values: engine.evaluate_condition(c, v), args.repeat))
+
+    fields = build_fields(args.fields, args.dependencies, rng)
+    field_values = {f.id: rng.choice(["v1", "v2", "v3", ""]) for f in fields}
+    params = {"fields": args.fields, "dependencies_per_field": args.dependencies}
+
+    deep_field = fields[-1]
+    results.append(measure("should_show_field", lambda: engine.should_show_field(deep_field, field_values),
+                           args.repeat, params))
+    results.append(measure("filter_fields_by_dependencies",
+                           lambda: engine.filter_fields_by_dependencies(fields, field_values), args.repeat, params))
+    results.append(measure("filter_fields_by_role",
+                           lambda: engine.filter_fields_by_role(fields, "klient"), args.repeat, params))
+    results.append(measure("filter_fields_by_customer[none]",
+                           lambda: engine.filter_fields_by_customer(fields, None), args.repeat, params))
+
+    template = seed_template(db, fields, args.customers, rng)
+    results.append(measure("filter_fields_by_customer[customer]",
+                           lambda: engine.filter_fields_by_customer(fields, "customer-1"), args.repeat,
+                           {**params, "customers": args.customers}))
+    results.append(measure("render_template_for_role",
+                           lambda: engine.render_template_for_role(template, "klient", "customer-1", field_values),
+                           args.repeat, {**params, "customers": args.customers}, min_time=args.render_min_time))
+
+    # AdvancedValidator.validate_value per rule type
+    for rule_type, (value, config) in VALIDATION_CASES.items():
+        if rule_type == "file":
+            value = _Upload()
+        results.append(measure(f"validate_value[{rule_type}]",
+                               lambda v=value, c=config: validator.validate_value(v, c), args.repeat))
+
+    db.close()
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "database": database.engine.url.get_backend_name(),
+        },
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    """Print the change of every benchmark's median against a previous results file"""
+    baseline = {r["name"]: r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    print(f"\nComparison with {baseline_path}:")
+    for result in current["results"]:
+        previous = baseline.get(result["name"])
+        if not previous:
+            continue
+        ratio = result["median_s"] / previous["median_s"]
+        print(f"{result['name']:<55} {ratio:>7.2f}x {'(slower)' if ratio > 1.1 else '(faster)' if ratio < 0.9 else ''}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fields", type=int, default=2000, help="Fields in the benchmark template")
+    parser.add_argument("--dependencies", type=int, default=3, help="Dependencies per field")
+    parser.add_argument("--customers", type=int, default=200, help="Distinct customers for customer-specific fields")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing samples per benchmark")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed for the synthetic catalogue")
+    parser.add_argument("--render-min-time", type=float, default=0.2, help="Minimum seconds per render sample")
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a fast smoke run")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Compare against a previous JSON results file")
+    args = parser.parse_args()
+    if args.quick:
+        args.fields, args.customers, args.repeat = 200, 20, 3
+
+    results = run(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Every test gets its own in-memory database through create_app(engine=...);
+# nothing may fall back to a configured DATABASE_URL
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("SQL_SERVER_CONNECTION_STRING", None)
+# Tests that use the render artifact store point it at a temporary directory
+os.environ["RENDER_ARTIFACT_STORE_ENABLED"] = "false"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import create_tables, make_engine  # noqa: E402
+from server import create_app  # noqa: E402
+
+
+@pytest.fixture
+def engine():
+    engine = make_engine("sqlite://")
+    create_tables(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def app(engine):
+    return create_app(engine=engine, manage_schema=False)
+
+
+@pytest.fixture
+def client(app):
+    with TestClient(app) as test_client:
+        yield test_client
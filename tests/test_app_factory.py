@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+
+import database
+from database import create_tables, make_engine
+from server import create_app
+
+BACKEND_DIR = os.path.dirname(database.__file__)
+
+
+def test_import_needs_no_database():
+    env = {k: v for k, v in os.environ.items() if k not in ("DATABASE_URL", "SQL_SERVER_CONNECTION_STRING")}
+    subprocess.run([sys.executable, "-c", "import server, dependency_engine"], cwd=BACKEND_DIR, env=env, check=True)
+
+
+def test_apps_are_isolated():
+    first, second = make_engine("sqlite://"), make_engine("sqlite://")
+    create_tables(first)
+    create_tables(second)
+    with TestClient(create_app(engine=first, manage_schema=False)) as a, \
+            TestClient(create_app(engine=second, manage_schema=False)) as b:
+        a.post("/api/templates", json={"name": {"de": "Nur in A"}})
+        assert len(a.get("/api/templates").json()) == 1
+        assert b.get("/api/templates").json() == []
+        assert 'method="POST",route="/api/templates"' in a.get("/metrics").text
+        assert 'method="POST",route="/api/templates"' not in b.get("/metrics").text
+
+
+def test_database_url_with_managed_schema():
+    with TestClient(create_app(database_url="sqlite://")) as client:
+        assert client.get("/api/fields").json() == []
+        assert "alembic_version" in inspect(client.app.state.engine).get_table_names()
@@ -0,0 +1,91 @@
+import gzip
+import mmap
+
+import pytest
+
+from artifact_store import ArtifactStore
+from sql_instrumentation import capture_queries
+
+
+def test_put_and_get_are_zero_copy(tmp_path):
+    store = ArtifactStore(tmp_path)
+    view = store.put("a", b'{"a":1}')
+    store.put("b", b"second")
+    assert bytes(view) == b'{"a":1}'
+    assert isinstance(store.get("b").obj, mmap.mmap)
+    assert bytes(store.get("b")) == b"second"
+    assert store.get("missing") is None
+    # Stored keys are never rewritten
+    store.put("a", b"other")
+    assert bytes(store.get("a")) == b'{"a":1}'
+
+
+def test_entries_are_shared_between_workers_and_survive_restarts(tmp_path):
+    first, second = ArtifactStore(tmp_path), ArtifactStore(tmp_path)
+    first.put("k", b"value")
+    second.alias("alias", "k")
+    assert bytes(second.get("k")) == b"value"
+    assert bytes(first.get("alias")) == b"value"
+    assert first.resolve("alias") == "k"
+    assert bytes(ArtifactStore(tmp_path).get("alias")) == b"value"
+
+
+def test_torn_index_line_is_ignored_and_repaired(tmp_path):
+    store = ArtifactStore(tmp_path)
+    store.put("k", b"value")
+    with open(store.index_path, "ab") as handle:
+        handle.write(b'["torn",')
+    restarted = ArtifactStore(tmp_path)
+    assert restarted.get("torn") is None
+    restarted.put("next", b"more")
+    assert bytes(ArtifactStore(tmp_path).get("next")) == b"more"
+    assert store.index_path.read_bytes().count(b"\n") == 2
+
+
+@pytest.fixture
+def store(app, tmp_path):
+    store = ArtifactStore(tmp_path / "artifacts")
+    app.state.artifact_store = store
+    return store
+
+
+@pytest.fixture
+def template(client):
+    fields = [client.post("/api/fields", json={"name": {"de": f"Feld {i}"}, "type": "text"}).json()["id"]
+              for i in range(20)]
+    template = client.post("/api/templates", json={"name": {"de": "Antrag"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": fields})
+    return template
+
+
+def test_published_renders_are_served_from_the_store(client, store, template):
+    client.post(f"/api/templates/{template['id']}/publish")
+    request = {"template_ids": [template["id"]], "role": "klient", "customer_id": "c9", "published": True}
+    # The first request of a customer without own artifact resolves it in the database
+    first = client.post("/api/templates/render", json=request, headers={"Accept-Encoding": "identity"})
+    with capture_queries() as stats:
+        second = client.post("/api/templates/render", json=request, headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200 and first.content == second.content
+    assert len(first.json()["fields"]) == 20
+    assert not any("render_artifacts" in statement for statement in stats.statements)
+    assert not any(key.endswith("#gzip") for key in store._offsets)
+
+    compressed = client.post("/api/templates/render", json=request, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    # The compressed variant is stored once next to the artifact
+    assert sum(key.endswith("#gzip") for key in store._offsets) == 1
+    assert gzip.decompress(bytes(store.get(next(key for key in store._offsets if key.endswith("#gzip"))))) \
+        == first.content
+
+
+def test_store_is_filled_from_the_database(client, app, tmp_path, template):
+    client.post(f"/api/templates/{template['id']}/publish")
+    store = ArtifactStore(tmp_path / "artifacts")
+    app.state.artifact_store = store
+    url = f"/api/templates/{template['id']}/versions/1/render"
+    response = client.get(url, params={"role": "admin", "customer_id": "c1"})
+    assert response.status_code == 200
+    assert len([key for key in store._offsets if "#" not in key]) == 1 and len(store._aliases) == 1
+    with capture_queries() as stats:
+        assert client.get(url, params={"role": "admin", "customer_id": "c1"}).content == response.content
+    assert not stats.statements
@@ -0,0 +1,77 @@
+import asyncio
+
+from cache import GenerationCache, bump_generation, read_generation
+from database import CacheGeneration
+
+
+def test_generation_bump_from_other_process_invalidates(db, session_factory):
+    cache = GenerationCache("test", scope="test-scope", poll_interval=0)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_compute(db, "k", compute) == 1
+    assert cache.get_or_compute(db, "k", compute) == 1
+
+    # Simulate another worker: bump the counter without touching this cache
+    other = session_factory()
+    try:
+        other.query(CacheGeneration).filter(CacheGeneration.name == "test-scope").delete()
+        other.add(CacheGeneration(name="test-scope", generation=41))
+        other.commit()
+    finally:
+        other.close()
+
+    assert cache.get_or_compute(db, "k", compute) == 2
+    assert cache.hits == 1 and cache.misses == 2
+
+
+def test_poll_interval_bounds_generation_reads(db):
+    cache = GenerationCache("test", scope="test-scope", poll_interval=3600)
+    assert cache.current_generation(db) == 0
+    bump_generation(db, "other-scope")
+    db.add(CacheGeneration(name="test-scope", generation=5))
+    db.commit()
+    # Still within the poll interval: the stale generation is served
+    assert cache.current_generation(db) == 0
+    # Local bumps invalidate immediately
+    bump_generation(db, "test-scope")
+    assert cache.current_generation(db) == read_generation(db, "test-scope") == 6
+
+
+def test_concurrent_misses_share_one_computation(db):
+    cache = GenerationCache("test", scope="test-scope", poll_interval=3600)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError("busy")
+        return len(calls)
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_or_compute_async(db, "k", compute) for _ in range(5)),
+                                    return_exceptions=True)
+
+    # A failure reaches every waiter and is not cached
+    assert [type(result) for result in asyncio.run(burst())] == [RuntimeError] * 5
+    assert asyncio.run(burst()) == [2] * 5
+    assert calls == [1, 1]
+    assert cache.get(db, "k") == (True, 2)
+
+
+def test_render_reflects_writes(client):
+    field = client.post("/api/fields", json={"name": {"de": "Alt"}, "type": "text"}).json()
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": [field["id"]]})
+    request = {"template_ids": [template["id"]], "role": "klient"}
+
+    first = client.post("/api/templates/render", json=request).json()
+    assert first["fields"][0]["name"]["de"] == "Alt"
+
+    client.put(f"/api/fields/{field['id']}", json={"name": {"de": "Neu"}})
+    second = client.post("/api/templates/render", json=request).json()
+    assert second["fields"][0]["name"]["de"] == "Neu"
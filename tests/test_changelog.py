@@ -0,0 +1,91 @@
+import json
+from datetime import datetime, timedelta
+
+from changelog import apply_changes, diff_values
+from database import ChangeLogEntry
+from json_patch import apply_patch
+
+
+def test_diff_of_list_insert_is_one_operation():
+    old = [{"value": f"v{i}"} for i in range(1000)]
+    new = old[:500] + [{"value": "neu"}] + old[500:]
+    assert diff_values(old, new) == [{"op": "add", "path": "/500", "value": {"value": "neu"}}]
+    assert diff_values(new, old) == [{"op": "remove", "path": "/500", "old": {"value": "neu"}}]
+
+
+def test_diff_round_trips():
+    old = {"a": 1, "b": [1, 2, 3, 4], "c": {"x": {"y": "z"}}, "d~/": "k", "gone": True}
+    new = {"a": 2, "b": [1, 9, 4, 5, 6], "c": {"x": {"y": "w"}, "n": None}, "d~/": "l"}
+    assert apply_patch(old, diff_values(old, new)) == new
+    assert diff_values(new, new) == []
+
+
+def test_updates_store_only_changed_attributes(client):
+    options = [{"id": f"o{i}", "value": f"v{i}", "label": {"de": f"Wert {i}"}} for i in range(500)]
+    field = client.post("/api/fields", json={"name": {"de": "Auswahl"}, "type": "select", "select_type": "radio",
+                                             "options": options}).json()
+    client.put(f"/api/fields/{field['id']}", json={"name": {"fr": "Choix"}, "options": field["options"],
+                                                   "requirement": "required"})
+
+    updated, created = client.get(f"/api/changelog/{field['id']}").json()
+    assert created["changes"]["format"] == "diff"
+    assert len(created["changes"]["snapshot"]["options"]) == 500
+    assert updated["changes"] == {"format": "diff", "diff": [
+        {"op": "replace", "path": "/requirement", "value": "required", "old": "optional"},
+        {"op": "add", "path": "/name/fr", "value": "Choix"},
+    ]}
+    assert len(json.dumps(updated["changes"])) < 200
+
+
+def test_expand_reconstructs_full_states(client):
+    field = client.post("/api/fields", json={"name": {"de": "Feld"}, "type": "text"}).json()
+    client.put(f"/api/fields/{field['id']}", json={"requirement": "required"})
+    client.patch(f"/api/fields/{field['id']}", json=[{"op": "add", "path": "/role_config/klient",
+                                                      "value": {"visible": False}}])
+    client.delete(f"/api/fields/{field['id']}")
+
+    deleted, patched, updated, created = client.get(f"/api/changelog/{field['id']}", params={"expand": True}).json()
+    assert created["changes"]["requirement"] == "optional"
+    assert updated["changes"]["requirement"] == "required"
+    assert updated["changes"]["name"] == {"de": "Feld"}
+    assert patched["changes"]["role_config"] == {"klient": {"visible": False}}
+    assert patched["changes"]["requirement"] == "required"
+    assert deleted["changes"] == {}
+
+
+def test_template_diffs_track_field_membership(client):
+    first = client.post("/api/fields", json={"name": {"de": "A"}, "type": "text"}).json()
+    second = client.post("/api/fields", json={"name": {"de": "B"}, "type": "text"}).json()
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": [first["id"], second["id"]]})
+    client.put(f"/api/templates/{template['id']}", json={"fields": [second["id"]]})
+
+    expanded = client.get(f"/api/changelog/{template['id']}", params={"expand": True}).json()
+    assert expanded[0]["changes"]["fields"] == [second["id"]]
+    assert sorted(expanded[1]["changes"]["fields"]) == sorted([first["id"], second["id"]])
+    latest = client.get(f"/api/changelog/{template['id']}").json()[0]
+    assert [op["op"] for op in latest["changes"]["diff"]] == ["remove"]
+
+
+def test_legacy_entries_stay_readable(client, db):
+    entity_id = "legacy-field"
+    now = datetime.utcnow()
+    db.add_all([
+        ChangeLogEntry(entity_type="field", entity_id=entity_id, action="created", user_id="u", user_name="U",
+                       changes={"name": {"de": "Alt"}, "type": "text", "requirement": "optional"},
+                       timestamp=now - timedelta(minutes=2)),
+        ChangeLogEntry(entity_type="field", entity_id=entity_id, action="updated", user_id="u", user_name="U",
+                       changes={"name": {"fr": "Vieux"}, "requirement": "required"},
+                       timestamp=now - timedelta(minutes=1)),
+    ])
+    db.commit()
+
+    raw = client.get(f"/api/changelog/{entity_id}").json()
+    assert raw[0]["changes"] == {"name": {"fr": "Vieux"}, "requirement": "required"}
+    expanded = client.get(f"/api/changelog/{entity_id}", params={"expand": True}).json()
+    assert expanded[0]["changes"] == {"name": {"de": "Alt", "fr": "Vieux"}, "type": "text", "requirement": "required"}
+
+
+def test_diff_against_unknown_state_is_not_guessed():
+    assert apply_changes(None, "updated", {"format": "diff", "diff": [{"op": "add", "path": "/a", "value": 1}]}) is None
+    assert apply_changes({"a": 1}, "updated", {"format": "diff", "diff": [{"op": "remove", "path": "/b"}]}) is None
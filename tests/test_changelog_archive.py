@@ -0,0 +1,118 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from changelog_archive import ChangeLogArchive, compact_changelog
+from database import ChangeLogEntry
+
+NOW = datetime(2024, 6, 15, 12, 0, 0)
+
+
+def _add_entries(db, count, start, step=timedelta(days=3), entity_id="e1", entity_type="field"):
+    for i in range(count):
+        db.add(ChangeLogEntry(entity_type=entity_type, entity_id=entity_id, action="updated", user_id="u",
+                              user_name="U", changes={"n": i}, timestamp=start + i * step))
+    db.commit()
+
+
+@pytest.fixture
+def archive(tmp_path, app):
+    archive = ChangeLogArchive(tmp_path / "archive")
+    app.state.changelog_archive = archive
+    return archive
+
+
+def test_compaction_moves_old_entries_into_monthly_segments(db, archive):
+    _add_entries(db, 40, NOW - timedelta(days=120))
+    moved = compact_changelog(db, archive, retention_days=30, batch_size=7, now=NOW)
+
+    remaining = db.query(ChangeLogEntry).all()
+    assert moved + len(remaining) == 40
+    assert all(entry.timestamp >= NOW - timedelta(days=30) for entry in remaining)
+    segments = archive.load_index()["segments"]
+    assert sorted(segments) == ["2024-02", "2024-03", "2024-04", "2024-05"]
+    assert sum(segment["count"] for segment in segments.values()) == moved
+    assert all((archive.directory / segment["file"]).exists() for segment in segments.values())
+
+    archived = archive.read()
+    assert len(archived) == moved
+    assert archived == sorted(archived, key=lambda entry: entry.timestamp, reverse=True)
+    assert compact_changelog(db, archive, retention_days=30, now=NOW) == 0
+
+
+def test_changelog_endpoints_include_archived(client, db, archive):
+    _add_entries(db, 10, NOW - timedelta(days=100), entity_id="old")
+    _add_entries(db, 5, NOW - timedelta(days=100), entity_id="other", entity_type="template")
+    _add_entries(db, 3, datetime.utcnow() - timedelta(minutes=10), step=timedelta(minutes=1), entity_id="old")
+    compact_changelog(db, archive, retention_days=30)
+
+    assert len(client.get("/api/changelog/old").json()) == 3
+    entries = client.get("/api/changelog/old", params={"include_archived": True}).json()
+    assert len(entries) == 13
+    assert [entry["changes"]["n"] for entry in entries] == [2, 1, 0] + list(range(9, -1, -1))
+
+    limited = client.get("/api/changelog", params={"include_archived": True, "limit": 5,
+                                                   "entity_type": "template"}).json()
+    assert len(limited) == 5 and {entry["entity_id"] for entry in limited} == {"other"}
+
+
+def test_expand_replays_archived_history(client, db, archive):
+    field = client.post("/api/fields", json={"name": {"de": "Feld"}, "type": "text"}).json()
+    db.query(ChangeLogEntry).filter(ChangeLogEntry.entity_id == field["id"]).update(
+        {ChangeLogEntry.timestamp: datetime.utcnow() - timedelta(days=60)}
+    )
+    db.commit()
+    compact_changelog(db, archive, retention_days=30)
+    client.put(f"/api/fields/{field['id']}", json={"requirement": "required"})
+
+    latest = client.get(f"/api/changelog/{field['id']}", params={"expand": True}).json()
+    assert len(latest) == 1
+    assert latest[0]["changes"]["name"] == {"de": "Feld"}
+    assert latest[0]["changes"]["requirement"] == "required"
+
+
+def test_interrupted_append_and_duplicates_are_tolerated(db, archive):
+    _add_entries(db, 3, NOW - timedelta(days=100), step=timedelta(hours=1))
+    entries = db.query(ChangeLogEntry).all()
+    with archive.lock():
+        archive.append(entries)
+        segment = archive.load_index()["segments"]["2024-03"]
+        # A crash after writing part of the next member leaves trailing garbage
+        with open(archive.directory / segment["file"], "ab") as handle:
+            handle.write(b"\x1f\x8b partial")
+        # ... and a crash before the rows were deleted archives them again
+        archive.append(entries)
+    assert len(archive.read()) == 3
+
+
+def test_concurrent_compaction_is_skipped(db, archive):
+    _add_entries(db, 3, NOW - timedelta(days=100))
+    with archive.lock() as acquired:
+        assert acquired
+        assert compact_changelog(db, archive, retention_days=30, now=NOW) == -1
+    assert db.query(ChangeLogEntry).count() == 3
+
+
+def test_entity_ids_live_in_cached_sidecar_files(db, archive):
+    _add_entries(db, 3, NOW - timedelta(days=100), entity_id="a")
+    _add_entries(db, 3, NOW - timedelta(days=70), entity_id="b")
+    compact_changelog(db, archive, retention_days=30, now=NOW)
+
+    index = archive.load_index()
+    assert archive.load_index() is index
+    assert not any("entity_ids" in segment for segment in index["segments"].values())
+    assert archive.segment_entity_ids(index["segments"]["2024-03"]) == {"a"}
+    assert [entry.entity_id for entry in archive.entity_history("b")] == ["b"] * 3
+
+    # Indexes written before the sidecar files are read and converted on the next append
+    legacy = json.loads(archive.index_path.read_text())
+    legacy["segments"]["2024-03"]["entity_ids"] = ["a"]
+    del legacy["segments"]["2024-03"]["ids_file"]
+    (archive.directory / "2024-03.ids").unlink()
+    archive.index_path.write_text(json.dumps(legacy))
+    assert len(archive.entity_history("a")) == 3
+    _add_entries(db, 1, datetime(2024, 3, 30), entity_id="c")
+    compact_changelog(db, archive, retention_days=30, now=NOW)
+    segment = archive.load_index()["segments"]["2024-03"]
+    assert "entity_ids" not in segment and archive.segment_entity_ids(segment) == {"a", "c"}
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+
+import changelog
+from changelog import expand_entries, state_as_of
+from changelog_archive import ChangeLogArchive, compact_changelog
+from database import ChangeLogEntry, EntityCheckpoint
+
+
+@pytest.fixture
+def small_interval(monkeypatch):
+    monkeypatch.setattr(changelog, "CHECKPOINT_INTERVAL", 5)
+
+
+def _timestamps(db, entity_id):
+    return [entry.timestamp for entry in db.query(ChangeLogEntry).filter(
+        ChangeLogEntry.entity_id == entity_id).order_by(ChangeLogEntry.timestamp.asc())]
+
+
+def test_checkpoints_bound_the_replay(client, db, small_interval):
+    field = client.post("/api/fields", json={"name": {"de": "Feld"}, "type": "text"}).json()
+    for i in range(12):
+        client.put(f"/api/fields/{field['id']}", json={"name": {"de": f"Feld {i}"}})
+
+    checkpoints = db.query(EntityCheckpoint).filter(EntityCheckpoint.entity_id == field["id"]).all()
+    assert len(checkpoints) == 2
+    timestamps = _timestamps(db, field["id"])
+
+    for index, at in enumerate(timestamps):
+        result = state_as_of(db, "field", field["id"], at)
+        expected = "Feld" if index == 0 else f"Feld {index - 1}"
+        assert result["state"]["name"] == {"de": expected}
+        assert result["replayed_entries"] <= 5
+
+    latest = client.get(f"/api/fields/{field['id']}/as-of", params={"at": timestamps[-1].isoformat()}).json()
+    assert latest["state"]["name"] == {"de": "Feld 11"}
+    assert latest["checkpoint"] is not None and latest["replayed_entries"] == 3
+
+
+def test_expansion_starts_at_a_checkpoint(client, db, small_interval):
+    field = client.post("/api/fields", json={"name": {"de": "Feld"}, "type": "text"}).json()
+    for i in range(12):
+        client.put(f"/api/fields/{field['id']}", json={"name": {"de": f"Feld {i}"}})
+    entries = db.query(ChangeLogEntry).filter(ChangeLogEntry.entity_id == field["id"]).order_by(
+        ChangeLogEntry.timestamp.asc()).all()
+    expected = {entry.id: state_as_of(db, "field", field["id"], entry.timestamp)["state"] for entry in entries}
+
+    # History before the checkpoints is never read
+    checkpoint = min(c.timestamp for c in db.query(EntityCheckpoint).filter(EntityCheckpoint.entity_id == field["id"]))
+    for entry in entries:
+        if entry.timestamp < checkpoint:
+            db.delete(entry)
+    db.commit()
+    recent = [entry for entry in entries if entry.timestamp >= checkpoint]
+    states = expand_entries(db, recent)
+    assert states == {entry.id: expected[entry.id] for entry in recent}
+    assert states[recent[-1].id]["name"] == {"de": "Feld 11"}
+
+
+def test_as_of_outside_lifetime_is_404(client, db):
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.delete(f"/api/templates/{template['id']}")
+    created, deleted = _timestamps(db, template["id"])
+
+    url = f"/api/templates/{template['id']}/as-of"
+    assert client.get(url, params={"at": (created - timedelta(seconds=1)).isoformat()}).status_code == 404
+    assert client.get(url, params={"at": deleted.isoformat()}).status_code == 404
+    response = client.get(url, params={"at": created.replace(tzinfo=timezone.utc).isoformat()})
+    assert response.status_code == 200
+    assert response.json()["state"]["name"] == {"de": "T"}
+
+
+def test_compaction_checkpoints_the_archive_boundary(client, db, app, tmp_path):
+    archive = ChangeLogArchive(tmp_path / "archive")
+    app.state.changelog_archive = archive
+    field = client.post("/api/fields", json={"name": {"de": "Alt"}, "type": "text"}).json()
+    client.put(f"/api/fields/{field['id']}", json={"requirement": "required"})
+    old = datetime.utcnow() - timedelta(days=60)
+    for offset, entry in enumerate(db.query(ChangeLogEntry).order_by(ChangeLogEntry.timestamp.asc())):
+        entry.timestamp = old + timedelta(minutes=offset)
+    db.commit()
+
+    compact_changelog(db, archive, retention_days=30)
+    client.put(f"/api/fields/{field['id']}", json={"name": {"de": "Neu"}})
+
+    now = client.get(f"/api/fields/{field['id']}/as-of", params={"at": datetime.utcnow().isoformat()}).json()
+    assert now["state"]["name"] == {"de": "Neu"} and now["state"]["requirement"] == "required"
+    assert now["replayed_entries"] == 1
+    # Before the boundary the archived history is replayed
+    then = client.get(f"/api/fields/{field['id']}/as-of", params={"at": old.isoformat()}).json()
+    assert then["checkpoint"] is None and then["state"]["requirement"] == "optional"
+
+
+def test_entity_history_reads_use_the_index(db):
+    query = db.query(ChangeLogEntry).filter(ChangeLogEntry.entity_id == "e1",
+                                            ChangeLogEntry.timestamp > datetime(2024, 1, 1))
+    statement = query.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True})
+    plan = " ".join(str(row) for row in db.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+    assert "ix_change_logs_entity_timestamp" in plan
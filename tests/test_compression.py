@@ -0,0 +1,75 @@
+import gzip
+
+import pytest
+
+import compression
+from compression import PrecompressedPayload, choose_encoding
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("*", compression.supported_encodings()[0]),
+    ("identity", None),
+    ("br", "br" if compression.brotli is not None else None),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def _create_fields(client, count):
+    for i in range(count):
+        client.post("/api/fields", json={"name": {"de": f"Feld {i}", "fr": f"Champ {i}", "it": f"Campo {i}"},
+                                         "type": "text"})
+
+
+def test_large_responses_are_gzipped(client):
+    _create_fields(client, 20)
+    response = client.get("/api/fields", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()) == 20
+
+
+def test_small_and_identity_responses_are_not_compressed(client):
+    assert "content-encoding" not in client.get("/api/", headers={"Accept-Encoding": "gzip"}).headers
+    _create_fields(client, 20)
+    assert "content-encoding" not in client.get("/api/fields", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_cached_render_is_compressed_once(client, monkeypatch):
+    _create_fields(client, 20)
+    field_ids = [f["id"] for f in client.get("/api/fields").json()]
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": field_ids})
+
+    calls = []
+    original = compression.compress
+    monkeypatch.setattr(compression, "compress", lambda body, encoding: calls.append(encoding) or original(body, encoding))
+
+    request = {"template_ids": [template["id"]], "role": "klient"}
+    bodies = []
+    for _ in range(3):
+        response = client.post("/api/templates/render", json=request, headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.json()["fields"]) == 20
+        bodies.append(response.content)
+    assert calls == ["gzip"]
+    assert bodies[0] == bodies[1] == bodies[2]
+
+    plain = client.post("/api/templates/render", json=request, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == response.json()
+
+
+def test_precompressed_payload_threshold():
+    body = b'{"a":"' + b"x" * 2000 + b'"}'
+    payload = PrecompressedPayload(body, minimum_size=100)
+    response = payload.response("gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(response.body) == body
+    assert "content-encoding" not in PrecompressedPayload(body, minimum_size=10_000).response("gzip").headers
@@ -0,0 +1,93 @@
+import pytest
+
+from conditions import ConditionError, compile_dependencies, normalise
+from database import Field
+from dependency_engine import DependencyEngine
+
+
+class CountingValues(dict):
+    """Field values counting how often a condition looks a field up"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookups = 0
+
+    def __contains__(self, key):
+        self.lookups += 1
+        return super().__contains__(key)
+
+
+def eq(field_id, value):
+    return {"field_id": field_id, "operator": "equals", "condition_value": value}
+
+
+@pytest.mark.parametrize("values, expected", [
+    ({"a": "1", "b": "x"}, True),
+    ({"a": "2", "b": "x"}, True),
+    ({"a": "3", "b": "x"}, False),
+    ({"a": "1", "b": "y"}, False),
+    ({"a": "1", "b": "x", "c": "1"}, False),
+])
+def test_nested_groups(values, expected):
+    dependencies = [
+        {"any": [eq("a", "1"), eq("a", "2")]},
+        eq("b", "x"),
+        {"not": eq("c", "1")},
+    ]
+    assert compile_dependencies(dependencies)(values, {}) is expected
+
+
+def test_flat_list_keeps_and_semantics():
+    predicate = compile_dependencies([eq("a", "1"), eq("b", "2")])
+    assert predicate({"a": "1", "b": "2"}, {})
+    assert not predicate({"a": "1"}, {})
+
+
+def test_short_circuit():
+    values = CountingValues({"a": "1"})
+    assert compile_dependencies([{"any": [eq("a", "1"), eq("b", "2"), eq("c", "3")]}])(values, {})
+    assert values.lookups == 1
+
+
+def test_normalisation():
+    assert normalise([]) == ("const", True)
+    assert normalise({"any": []}) == ("const", False)
+    assert normalise({"not": {"not": eq("a", "1")}}) == normalise(eq("a", "1"))
+    assert normalise({"all": [{"all": [eq("a", "1")]}, eq("b", "2"), eq("a", "1")]}) == \
+        ("all", (("cond", "a", "equals", "1"), ("cond", "b", "equals", "2")))
+    assert normalise({"any": [eq("a", "1"), {"all": []}]}) == ("const", True)
+
+
+@pytest.mark.parametrize("dependencies", [
+    ["a"], [{"any": eq("a", "1")}], [{"all": [], "any": []}], [{"operator": "equals"}],
+    [{"field_id": "a", "not": eq("a", "1")}],
+])
+def test_malformed_dependencies(dependencies):
+    with pytest.raises(ConditionError):
+        compile_dependencies(dependencies)
+
+
+def test_shared_sub_expressions_are_evaluated_once_per_render(db):
+    shared = {"any": [eq("land", "CH"), eq("land", "LI")]}
+    fields = [Field(id=f"f{i}", type="text", dependencies=[shared, {"not": eq("typ", str(i))}])
+              for i in range(10)]
+    values = CountingValues({"land": "DE", "typ": "3"})
+    visible = DependencyEngine(db).filter_fields_by_dependencies(fields, values)
+    assert visible == []
+    # Two lookups for the shared group, none for the per-field conditions it short-circuits
+    assert values.lookups == 2
+
+    values = CountingValues({"land": "LI", "typ": "3"})
+    visible = DependencyEngine(db).filter_fields_by_dependencies(fields, values)
+    assert [field.id for field in visible] == [f"f{i}" for i in range(10) if i != 3]
+    assert values.lookups == 2 + 10
+
+
+def test_dependencies_are_checked_on_save(client):
+    field = client.post("/api/fields", json={"name": {"de": "Feld"}, "type": "text"}).json()
+    url = f"/api/fields/{field['id']}"
+    assert client.put(url, json={"dependencies": [{"any": "x"}]}).status_code == 422
+    groups = [{"any": [eq("a", "1"), {"not": eq("b", "2")}]}]
+    assert client.put(url, json={"dependencies": groups}).json()["dependencies"] == groups
+    patch = [{"op": "add", "path": "/dependencies/-", "value": {"all": [1]}}]
+    assert client.patch(url, json=patch).status_code == 422
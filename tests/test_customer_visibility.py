@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine, text
+
+from database import Template, ensure_schema, run_migrations
+from dependency_engine import DependencyEngine
+
+
+def _create_field(client, name, **updates):
+    field = client.post("/api/fields", json={"name": {"de": name}, "type": "text"}).json()
+    if updates:
+        field = client.put(f"/api/fields/{field['id']}", json=updates).json()
+    return field
+
+
+def test_fields_for_customer_uses_association_table(client):
+    shared = _create_field(client, "Shared")
+    own = _create_field(client, "Own", customer_specific=True, visible_for_customers=["c1", "c1", "c2"])
+    other = _create_field(client, "Other", customer_specific=True, visible_for_customers=["c3"])
+
+    assert own["visible_for_customers"] == ["c1", "c2"]
+
+    ids = {f["id"] for f in client.get("/api/customers/c1/fields").json()}
+    assert ids == {shared["id"], own["id"]}
+
+    client.put(f"/api/fields/{own['id']}", json={"visible_for_customers": ["c3"]})
+    ids = {f["id"] for f in client.get("/api/customers/c3/fields").json()}
+    assert ids == {shared["id"], own["id"], other["id"]}
+    assert {f["id"] for f in client.get("/api/customers/c1/fields").json()} == {shared["id"]}
+
+
+def test_render_filters_by_customer(client, db):
+    shared = _create_field(client, "Shared")
+    own = _create_field(client, "Own", customer_specific=True, visible_for_customers=["c1"])
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": [shared["id"], own["id"]]})
+
+    db_template = db.get(Template, template["id"])
+    engine = DependencyEngine(db)
+    assert len(engine.render_template_for_role(db_template, "klient", "c1")["fields"]) == 2
+    assert len(engine.render_template_for_role(db_template, "klient", "c2")["fields"]) == 1
+    assert len(engine.render_template_for_role(db_template, "klient", None)["fields"]) == 1
+
+
+def test_migration_moves_legacy_json_column(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    run_migrations(engine, "0001")
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO fields (id, type, customer_specific, visible_for_customers) VALUES (:id, 'text', 1, :v)"),
+            [{"id": "f1", "v": '["c1", "c2", "c1"]'}, {"id": "f2", "v": "[]"}]
+        )
+        conn.execute(
+            text("INSERT INTO templates (id, customer_specific, visible_for_customers) VALUES ('t1', 1, :v)"),
+            {"v": '["c9"]'}
+        )
+
+    assert ensure_schema(engine) is True
+    assert ensure_schema(engine) is False
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT field_id, customer_id FROM field_customers ORDER BY customer_id")).fetchall() \
+            == [("f1", "c1"), ("f1", "c2")]
+        assert conn.execute(text("SELECT template_id, customer_id FROM template_customers")).fetchall() == [("t1", "c9")]
+        assert conn.execute(text("SELECT COUNT(*) FROM fields WHERE visible_for_customers IS NOT NULL")).scalar() == 0
@@ -0,0 +1,123 @@
+import pytest
+
+from database import Field
+from dependency_analysis import analyse_dependencies, dependant_fields
+from dependency_engine import DependencyEngine
+from sql_instrumentation import capture_queries
+
+
+def eq(field_id, value, operator="equals"):
+    return {"field_id": field_id, "operator": operator, "condition_value": value}
+
+
+@pytest.fixture
+def fields():
+    return {
+        "land": Field(id="land", type="select", select_type="radio",
+                      options=[{"value": "CH"}, {"value": "LI"}]),
+        "tags": Field(id="tags", type="select", select_type="multiple", options=[{"value": "a"}]),
+        "alter": Field(id="alter", type="text"),
+    }
+
+
+@pytest.mark.parametrize("dependencies, code, path", [
+    ([eq("land", "DE")], "not_an_option", "/dependencies/0"),
+    ([eq("land", ["DE", "AT"], "in")], "not_an_option", "/dependencies/0"),
+    ([eq("gone", "x")], "unknown_field", "/dependencies/0"),
+    ([eq("alter", "x", "between")], "unknown_operator", "/dependencies/0"),
+    ([eq("alter", "(", "regex_match")], "invalid_pattern", "/dependencies/0"),
+    ([eq("alter", "viel", "greater_than")], "not_a_number", "/dependencies/0"),
+    ([eq("land", "CH"), eq("land", "LI")], "contradiction", "/dependencies"),
+    ([{"any": [eq("alter", "1"), {"all": [eq("alter", "60", "greater_than"), eq("alter", "18", "less_than")]}]}],
+     "contradiction", "/dependencies/0/any/1"),
+    ([{"all": [eq("alter", "", "is_empty"), eq("alter", "", "is_not_empty")]}], "contradiction", "/dependencies/0"),
+])
+def test_unsatisfiable_conditions(fields, dependencies, code, path):
+    plan, issues = analyse_dependencies(dependencies, fields)
+    assert {"path": path, "code": code, "severity": "error"}.items() <= issues[0].items()
+    assert issues[-1]["code"] in ("never_met", code)
+
+
+def test_never_met_rules_are_folded(fields):
+    plan, issues = analyse_dependencies([eq("land", "DE")], fields)
+    assert plan == [{"any": []}]
+    assert [issue["code"] for issue in issues] == ["not_an_option", "never_met"]
+
+
+def test_pruning_keeps_what_can_hold(fields):
+    dependencies = [{"any": [eq("land", "DE"), eq("land", "CH")]}, eq("tags", "b")]
+    plan, issues = analyse_dependencies(dependencies, fields)
+    # Multiple selections are not checked against the options
+    assert plan == [{"all": [eq("land", "CH"), eq("tags", "b")]}]
+    assert [(issue["path"], issue["code"]) for issue in issues] == [("/dependencies/0/any/0", "not_an_option")]
+
+
+def test_always_met_rules(fields):
+    plan, issues = analyse_dependencies([{"any": [eq("alter", "1"), {"not": eq("alter", "1")}]}], fields)
+    assert plan == []
+    assert [issue["code"] for issue in issues] == ["tautology", "always_met"]
+    plan, _ = analyse_dependencies([{"not": eq("land", "DE")}], fields)
+    assert plan == []
+
+
+def test_references_outside_the_template_are_warnings(fields):
+    plan, issues = analyse_dependencies([eq("alter", "1")], fields, template_field_ids=["land"])
+    assert plan == [eq("alter", "1")]
+    assert issues[0]["code"] == "outside_template" and issues[0]["severity"] == "warning"
+
+
+def _select(client, *values):
+    return client.post("/api/fields", json={
+        "name": {"de": "Land"}, "type": "select", "select_type": "radio",
+        "options": [{"label": {"de": value}, "value": value} for value in values]}).json()["id"]
+
+
+def test_field_update_reports_issues_and_stores_the_plan(client, db):
+    land = _select(client, "CH", "LI")
+    field = client.post("/api/fields", json={"name": {"de": "Kanton"}, "type": "text"}).json()["id"]
+    response = client.put(f"/api/fields/{field}", json={"dependencies": [
+        {"any": [eq(land, "DE"), eq(land, "CH")]}]}).json()
+    assert [(issue["path"], issue["code"]) for issue in response["dependency_issues"]] == \
+        [("/dependencies/0/any/0", "not_an_option")]
+    # Authored rules are kept, renders evaluate the plan
+    assert response["dependencies"] == [{"any": [eq(land, "DE"), eq(land, "CH")]}]
+    assert db.get(Field, field).dependency_plan == [eq(land, "CH")]
+
+    # Adding the option makes the pruned condition count again
+    client.put(f"/api/fields/{land}", json={"options": [{"label": {"de": v}, "value": v} for v in ("CH", "DE")]})
+    db.expire_all()
+    assert db.get(Field, field).dependency_plan == [{"any": [eq(land, "DE"), eq(land, "CH")]}]
+
+    client.delete(f"/api/fields/{land}")
+    db.expire_all()
+    assert db.get(Field, field).dependency_plan == [{"any": []}]
+
+
+def test_template_update_reports_fields_outside_the_template(client):
+    land = _select(client, "CH")
+    field = client.post("/api/fields", json={"name": {"de": "Kanton"}, "type": "text"}).json()["id"]
+    client.put(f"/api/fields/{field}", json={"dependencies": [eq(land, "CH")]})
+    template = client.post("/api/templates", json={"name": {"de": "Antrag"}}).json()["id"]
+    response = client.put(f"/api/templates/{template}", json={"fields": [field]}).json()
+    assert [issue["code"] for issue in response["dependency_issues"][field]] == ["outside_template"]
+    response = client.put(f"/api/templates/{template}", json={"fields": [field, land]}).json()
+    assert response["dependency_issues"] == {}
+
+
+def test_render_skips_never_met_conditions(db):
+    fields = [Field(id=f"f{i}", type="text", dependencies=[eq("land", "DE")], dependency_plan=[{"any": []}])
+              for i in range(3)]
+    values = {"land": "DE"}
+    assert DependencyEngine(db).filter_fields_by_dependencies(fields, values) == []
+    # Without a plan the authored rules are evaluated
+    fields[0].dependency_plan = None
+    assert DependencyEngine(db).filter_fields_by_dependencies(fields, values) == [fields[0]]
+
+
+def test_dependants_are_found_by_reference(db):
+    db.add_all([Field(id="a", type="text"), Field(id="b", type="text", dependencies=[{"not": eq("a", "1")}]),
+                Field(id="c", type="text", dependencies=[eq("ab", "1")])])
+    db.commit()
+    with capture_queries() as stats:
+        assert [field.id for field in dependant_fields(db, "a")] == ["b"]
+    assert len(stats.statements) == 1
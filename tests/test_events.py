@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from database import Field, MultiLanguageText
+from events import EventBroker, event_stream, format_event, notify_committed, read_changes
+
+
+def _add_field(session_factory, name="Feld"):
+    db = session_factory()
+    try:
+        field = Field(type="text")
+        db.add(field)
+        db.flush()
+        db.add(MultiLanguageText(entity_type="field_name", entity_id=field.id, language_code="de", text_value=name))
+        db.commit()
+        return field.id
+    finally:
+        db.close()
+
+
+def test_read_changes_reports_one_event_per_entity(db, session_factory):
+    field_id = _add_field(session_factory)
+    version, events, truncated = read_changes(db, 0)
+    assert events == [{"type": "field", "id": field_id, "version": version, "action": "updated"}]
+    assert not truncated
+    _add_field(session_factory, "Zwei")
+    _add_field(session_factory, "Drei")
+    assert read_changes(db, version, limit=1)[2]
+    assert read_changes(db, read_changes(db, version)[0])[1] == []
+
+
+def test_overflowing_subscriber_gets_resync_only():
+    async def scenario():
+        broker = EventBroker(lambda: None)
+        slow, fast = asyncio.Queue(maxsize=2), asyncio.Queue(maxsize=10)
+        broker.subscribers.update({slow, fast})
+        for version in range(1, 6):
+            broker.publish({"type": "field", "id": "f", "version": version, "action": "updated"})
+        return broker, [slow.get_nowait() for _ in range(slow.qsize())], fast.qsize()
+
+    broker, slow, fast = asyncio.run(scenario())
+    # The slow subscriber never blocks the others, its backlog is replaced
+    assert slow == [{"type": "resync", "version": 5}]
+    assert fast == 5
+    assert broker.overflows == 2
+
+
+def test_committed_writes_are_pushed_to_subscribers(session_factory):
+    async def scenario():
+        broker = EventBroker(session_factory, poll_interval=30)
+        queue = await broker.subscribe()
+        stream = event_stream(broker, queue, heartbeat=30)
+        ready = await stream.__anext__()
+        assert ready.startswith(b"event: ready")
+
+        loop = asyncio.get_running_loop()
+        field_id = await loop.run_in_executor(None, _add_field, session_factory)
+        # A write handled by this worker wakes the poller before the interval
+        notify_committed()
+        chunk = await asyncio.wait_for(stream.__anext__(), 5)
+        await stream.aclose()
+        assert not broker.subscribers
+        broker.close()
+        return field_id, chunk
+
+    field_id, chunk = asyncio.run(scenario())
+    lines = chunk.decode().strip().split("\n")
+    assert lines[1] == "event: change"
+    assert json.loads(lines[2][len("data: "):])["id"] == field_id
+
+
+def test_format_event():
+    assert format_event({"type": "resync", "version": 7}) == b'id: 7\nevent: resync\ndata: {"type":"resync","version":7}\n\n'
+
+
+def test_subscriber_limit(client, app):
+    app.state.event_broker.max_subscribers = 0
+    assert client.get("/api/events").status_code == 503
+    assert "events_subscribers 0" in client.get("/metrics").text
@@ -0,0 +1,133 @@
+import pytest
+
+from advanced_validation import AdvancedValidator
+from expressions import (ExpressionBudgetExceeded, ExpressionEvaluationError, ExpressionSyntaxError,
+                         compile_expression)
+
+
+@pytest.mark.parametrize("source, values, expected", [
+    ("1 + 2 * 3", {}, 7),
+    ("(1 + 2) * 3 % 4", {}, 1),
+    ("-a + 10", {"a": 4}, 6),
+    ("sum([{share-a}, {share-b}]) == 100", {"share-a": 60, "share-b": 40}, True),
+    ("date(end) > date(start)", {"start": "2024-01-31", "end": "2024-02-01"}, True),
+    ("date(end) - date(start)", {"start": "2024-01-31", "end": "2024-03-01"}, 30),
+    ("a == 1 or b / 0", {"a": 1}, True),
+    ("not (a and b)", {"a": True, "b": False}, True),
+    ("x in ['a', 'b'] && !(x not in 'abc')", {"x": "a"}, True),
+    ("len(trim(name)) >= 2 and upper(trim(name))[0] == 'A'", {"name": " anna "}, True),
+    ("empty(missing) or max(1, 5, 3) == 5", {}, True),
+    ("round(number('3.14159'), 2) == 3.14 and abs(-2) == 2", {}, True),
+    ("'it\\'s' + \" ok\"", {}, "it's ok"),
+])
+def test_evaluation(source, values, expected):
+    assert compile_expression(source).evaluate(values) == expected
+
+
+def test_value_and_references():
+    expression = compile_expression("value <= limit and value > {lower bound}")
+    assert expression.references == {"limit", "lower bound"}
+    assert expression.evaluate({"limit": 5, "lower bound": 1}, value=3) is True
+    assert compile_expression("value <= limit and value > {lower bound}") is expression
+
+
+@pytest.mark.parametrize("source", [
+    "", "1 +", "(1", "a.b", "__import__('os')", "f(1)", "a ** 2", "len(1, 2)", "1 2", "a;b",
+    "(" * 60 + "1" + ")" * 60,
+])
+def test_syntax_errors(source):
+    with pytest.raises(ExpressionSyntaxError):
+        compile_expression(source)
+
+
+@pytest.mark.parametrize("source, values", [
+    ("a < 'text'", {"a": 1}),
+    ("date(a)", {"a": "31.01.2024"}),
+    ("a / b", {"a": 1, "b": 0}),
+    ("sum(a)", {"a": ["x"]}),
+    ("a[5]", {"a": [1]}),
+])
+def test_evaluation_errors(source, values):
+    with pytest.raises(ExpressionEvaluationError):
+        compile_expression(source).evaluate(values)
+
+
+def test_step_budget():
+    big = list(range(100000))
+    with pytest.raises(ExpressionBudgetExceeded):
+        compile_expression("sum(a) > 0").evaluate({"a": big}, max_steps=1000)
+    with pytest.raises(ExpressionBudgetExceeded):
+        compile_expression("a + a + a + a").evaluate({"a": "x" * 5000}, max_steps=10000)
+    assert compile_expression("1 + 1").evaluate({}, max_steps=3) == 2
+    with pytest.raises(ExpressionBudgetExceeded):
+        compile_expression("1 + 1").evaluate({}, max_steps=2)
+
+
+def test_custom_rule_in_validator():
+    validator = AdvancedValidator()
+    config = {"custom": [{"expression": "date(value) > date({start})", "message": "Ende vor Beginn"},
+                         {"expression": "value != '2024-12-24'"}]}
+    assert validator.validate_value("2024-02-01", config, {"start": "2024-01-01"})["valid"]
+    assert validator.validate_value("2023-12-01", config, {"start": "2024-01-01"})["errors"] == ["Ende vor Beginn"]
+    # A start that is no date fails the rule instead of raising
+    assert not validator.validate_value("2024-02-01", config, {"start": "bald"})["valid"]
+    assert validator.validate_value("2024-12-24", config, {"start": "2024-01-01"})["errors"] == \
+        ["Condition not met: value != '2024-12-24'"]
+    # Rules referring to values that were not submitted are not checked
+    assert validator.validate_value("2023-12-01", config, {})["valid"]
+    assert not validator.validate_value("2024-12-24", config)["valid"]
+
+
+def test_custom_rules_are_checked_on_save(client):
+    field = client.post("/api/fields", json={"name": {"de": "Ende"}, "type": "text",
+                                             "validation": {"custom": {"expression": "value >"}}})
+    assert field.status_code == 422
+    # References must be IDs of existing fields, names are not resolved
+    for expression in ("value > {start}", "date(end_date) > date(start_date)"):
+        field = client.post("/api/fields", json={"name": {"de": "Ende"}, "type": "text",
+                                                 "validation": {"custom": {"expression": expression}}})
+        assert field.status_code == 422 and "Unknown field" in field.json()["detail"]
+    start = client.post("/api/fields", json={"name": {"de": "Beginn"}, "type": "text"}).json()["id"]
+    field = client.post("/api/fields", json={"name": {"de": "Ende"}, "type": "text",
+                                             "validation": {"custom": {"expression": f"value > {{{start}}}"}}})
+    assert field.status_code == 200
+    field_id = field.json()["id"]
+    assert client.put(f"/api/fields/{field_id}", json={"validation": {"custom": {"expression": "os.system()"}}}
+                      ).status_code == 422
+    patch = [{"op": "replace", "path": "/validation/custom/expression", "value": "value >> 1"}]
+    assert client.patch(f"/api/fields/{field_id}", json=patch).status_code == 422
+    assert client.get(f"/api/fields/{field_id}").json()["validation"]["custom"] == \
+        {"expression": f"value > {{{start}}}"}
+
+
+def test_submission_validation(client):
+    start = client.post("/api/fields", json={"name": {"de": "Beginn"}, "type": "text"}).json()["id"]
+    rule = {"expression": f"empty(value) or date(value) > date({{{start}}})", "message": "Ende vor Beginn"}
+    end = client.post("/api/fields", json={"name": {"de": "Ende"}, "type": "text",
+                                           "validation": {"custom": rule}}).json()["id"]
+    template = client.post("/api/templates", json={"name": {"de": "Antrag"}}).json()["id"]
+    client.put(f"/api/templates/{template}", json={"fields": [start, end]})
+
+    result = client.post("/api/validate-fields", json={"values": {start: "2024-05-01", end: "2024-04-01"}}).json()
+    assert not result["valid"]
+    assert result["fields"][end] == {"valid": False, "errors": ["Ende vor Beginn"]}
+    assert result["fields"][start]["valid"]
+
+    result = client.post("/api/validate-fields", json={"values": {start: "2024-05-01"}, "template_id": template})
+    assert result.json()["valid"] and set(result.json()["fields"]) == {start, end}
+    # Template fields left out are empty
+    result = client.post("/api/validate-fields", json={"values": {end: "2024-04-01"}, "template_id": template})
+    assert result.json()["fields"][end] == {"valid": False, "errors": ["Ende vor Beginn"]}
+    assert client.post("/api/validate-fields", json={"values": {}, "template_id": "missing"}).status_code == 404
+
+
+def test_single_field_validation_skips_cross_field_rules(client):
+    start = client.post("/api/fields", json={"name": {"de": "Beginn"}, "type": "text"}).json()["id"]
+    rules = [{"expression": f"date(value) > date({{{start}}})", "message": "Ende vor Beginn"},
+             {"expression": "date(value) > date('2000-01-01')", "message": "Zu früh"}]
+    end = client.post("/api/fields", json={"name": {"de": "Ende"}, "type": "text",
+                                           "validation": {"custom": rules}}).json()["id"]
+    result = client.post(f"/api/validate-field?field_id={end}&value=2030-01-01").json()
+    assert result["valid"] and result["errors"] == []
+    result = client.post(f"/api/validate-field?field_id={end}&value=1999-01-01").json()
+    assert result["errors"] == ["Zu früh"]
@@ -0,0 +1,89 @@
+import pytest
+
+import database
+from database import Field, JSONType, register_json_codec, set_json_codec
+from sql_instrumentation import capture_queries
+
+
+@pytest.fixture
+def restore_codec():
+    name = database.json_codec_name
+    yield
+    set_json_codec(name)
+
+
+def test_empty_values_skip_the_codec(restore_codec):
+    calls = []
+    register_json_codec("counting", lambda value: calls.append("dumps") or "{}",
+                        lambda value: calls.append("loads") or {})
+    set_json_codec("counting")
+    column_type = JSONType()
+
+    assert column_type.process_bind_param({}, None) == "{}"
+    assert column_type.process_bind_param([], None) == "[]"
+    first = column_type.process_result_value("[]", None)
+    first.append(1)
+    # Decoded empty values are fresh objects, never shared between rows
+    assert column_type.process_result_value("[]", None) == []
+    assert column_type.process_result_value("null", None) is None
+    assert calls == []
+
+    column_type.process_bind_param({"a": 1}, None)
+    column_type.process_result_value('{"a":1}', None)
+    assert calls == ["dumps", "loads"]
+
+
+@pytest.mark.parametrize("name", sorted(database._json_codecs))
+def test_codecs_round_trip(name, restore_codec):
+    set_json_codec(name)
+    column_type = JSONType()
+    value = {"label": {"de": "Grösse", "fr": "Taille"}, "values": [1, 2.5, None, True], "big": 2 ** 70}
+    assert column_type.process_result_value(column_type.process_bind_param(value, None), None) == value
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        set_json_codec("yaml")
+
+
+def test_unchanged_json_is_not_rewritten(client):
+    options = [{"id": f"o{i}", "value": f"v{i}", "label": {"de": f"Wert {i}"}} for i in range(50)]
+    field = client.post("/api/fields", json={"name": {"de": "Auswahl"}, "type": "select", "select_type": "radio",
+                                             "options": options}).json()
+
+    with capture_queries() as stats:
+        response = client.put(f"/api/fields/{field['id']}", json={"options": field["options"], "requirement": "required"})
+    assert response.status_code == 200
+    updates = [s for s in stats.statements if s.startswith("UPDATE fields")]
+    assert len(updates) == 1
+    assert "requirement" in updates[0] and "options" not in updates[0]
+
+
+def test_payload_loaded_only_for_rendered_fields(client):
+    hidden = client.post("/api/fields", json={"name": {"de": "Versteckt"}, "type": "text"}).json()
+    shown = client.post("/api/fields", json={"name": {"de": "Sichtbar"}, "type": "text",
+                                             "validation": {"max_length": 20}}).json()
+    client.put(f"/api/fields/{hidden['id']}", json={"role_config": {"klient": {"visible": False}}})
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": [hidden["id"], shown["id"]]})
+
+    with capture_queries() as stats:
+        rendered = client.post("/api/templates/render",
+                               json={"template_ids": [template["id"]], "role": "klient"}).json()
+    assert [f["id"] for f in rendered["fields"]] == [shown["id"]]
+    assert rendered["fields"][0]["validation"] == {"max_length": 20, "min_length": None, "pattern": None,
+                                                   "date_format": None}
+    payload_queries = [s for s in stats.statements if "fields.options" in s]
+    assert len(payload_queries) == 1 and "IN (?)" in payload_queries[0]
+
+
+def test_template_responses_do_not_load_fields(client, db):
+    field = client.post("/api/fields", json={"name": {"de": "F"}, "type": "text"}).json()
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": [field["id"]]})
+
+    with capture_queries() as stats:
+        listed = client.get("/api/templates").json()
+    assert listed[0]["fields"] == [field["id"]]
+    assert not any("FROM fields" in s for s in stats.statements)
+    assert db.get(Field, field["id"]) is not None
@@ -0,0 +1,104 @@
+import pytest
+
+from json_patch import JsonPatchError, JsonPatchTestFailed, apply_patch
+from sql_instrumentation import capture_queries
+
+
+@pytest.mark.parametrize("document, patch, expected", [
+    ({"foo": "bar"}, [{"op": "add", "path": "/baz", "value": "qux"}], {"foo": "bar", "baz": "qux"}),
+    ({"foo": ["bar", "baz"]}, [{"op": "add", "path": "/foo/1", "value": "qux"}], {"foo": ["bar", "qux", "baz"]}),
+    ({"foo": ["bar"]}, [{"op": "add", "path": "/foo/-", "value": "qux"}], {"foo": ["bar", "qux"]}),
+    ({"foo": ["bar", "qux", "baz"]}, [{"op": "remove", "path": "/foo/1"}], {"foo": ["bar", "baz"]}),
+    ({"baz": "qux", "foo": "bar"}, [{"op": "replace", "path": "/baz", "value": "boo"}], {"baz": "boo", "foo": "bar"}),
+    ({"foo": {"bar": "baz", "waldo": "fred"}, "qux": {"corge": "grault"}},
+     [{"op": "move", "from": "/foo/waldo", "path": "/qux/thud"}],
+     {"foo": {"bar": "baz"}, "qux": {"corge": "grault", "thud": "fred"}}),
+    ({"foo": ["all", "grass", "cows", "eat"]}, [{"op": "move", "from": "/foo/1", "path": "/foo/3"}],
+     {"foo": ["all", "cows", "eat", "grass"]}),
+    ({"foo": {"a": 1}}, [{"op": "copy", "from": "/foo", "path": "/bar"}], {"foo": {"a": 1}, "bar": {"a": 1}}),
+    ({"a/b": 1, "m~n": 2}, [{"op": "replace", "path": "/a~1b", "value": 3}, {"op": "remove", "path": "/m~0n"}],
+     {"a/b": 3}),
+    ({"foo": 1}, [{"op": "test", "path": "/foo", "value": 1}], {"foo": 1}),
+])
+def test_rfc6902_operations(document, patch, expected):
+    assert apply_patch(document, patch) == expected
+
+
+@pytest.mark.parametrize("patch", [
+    [{"op": "add", "path": "/foo/bar/baz", "value": 1}],
+    [{"op": "remove", "path": "/missing"}],
+    [{"op": "replace", "path": "/list/5", "value": 1}],
+    [{"op": "add", "path": "/list/01", "value": 1}],
+    [{"op": "move", "from": "/foo", "path": "/foo/child"}],
+    [{"op": "add", "path": "foo", "value": 1}],
+    [{"op": "merge", "path": "/foo", "value": 1}],
+    [{"op": "add", "path": "/foo"}],
+])
+def test_invalid_operations_are_rejected(patch):
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": {}, "list": [1]}, patch)
+
+
+def test_patch_is_atomic_and_does_not_mutate():
+    document = {"options": [{"value": "a"}], "other": {"x": 1}}
+    with pytest.raises(JsonPatchTestFailed):
+        apply_patch(document, [{"op": "add", "path": "/options/-", "value": {"value": "b"}},
+                               {"op": "test", "path": "/options/0/value", "value": "z"}])
+    patched = apply_patch(document, [{"op": "replace", "path": "/options/0/value", "value": "b"}])
+    assert document == {"options": [{"value": "a"}], "other": {"x": 1}}
+    assert patched["options"][0]["value"] == "b"
+    # Untouched branches are shared rather than copied
+    assert patched["other"] is document["other"]
+
+
+@pytest.fixture
+def select_field(client):
+    options = [{"id": f"o{i}", "value": f"v{i}", "label": {"de": f"Wert {i}"}} for i in range(3000)]
+    return client.post("/api/fields", json={"name": {"de": "Gross"}, "type": "select", "select_type": "radio",
+                                            "options": options}).json()
+
+
+def test_patch_field_appends_option_and_logs_delta(client, select_field):
+    patch = [
+        {"op": "test", "path": "/options/0/value", "value": "v0"},
+        {"op": "add", "path": "/options/-", "value": {"id": "new", "value": "neu", "label": {"de": "Neu"}}},
+        {"op": "add", "path": "/dependencies/-", "value": {"field_id": "x", "operator": "equals", "condition_value": "1"}},
+    ]
+    response = client.patch(f"/api/fields/{select_field['id']}", json=patch,
+                            headers={"Content-Type": "application/json-patch+json"})
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body["options"]) == 3001 and body["options"][-1]["value"] == "neu"
+    assert body["dependencies"] == [{"field_id": "x", "operator": "equals", "condition_value": "1"}]
+    assert client.get(f"/api/fields/{select_field['id']}").json()["options"][-1]["value"] == "neu"
+
+    latest = client.get(f"/api/changelog/{select_field['id']}").json()[0]
+    assert latest["changes"] == {"format": "diff", "diff": [
+        {"op": "add", "path": "/options/3000", "value": patch[1]["value"]},
+        {"op": "add", "path": "/dependencies/0", "value": patch[2]["value"]},
+    ]}
+
+
+def test_patch_field_only_writes_addressed_columns(client, select_field):
+    with capture_queries() as stats:
+        client.patch(f"/api/fields/{select_field['id']}",
+                     json=[{"op": "replace", "path": "/role_config", "value": {"klient": {"visible": False}}}])
+    update = next(s for s in stats.statements if s.startswith("UPDATE fields"))
+    assert "role_config" in update and "options" not in update
+
+
+@pytest.mark.parametrize("patch, status", [
+    ([{"op": "test", "path": "/options/0/value", "value": "nope"}], 409),
+    ([{"op": "replace", "path": "/type", "value": "text"}], 422),
+    ([{"op": "remove", "path": "/options"}], 422),
+    ([{"op": "replace", "path": "/options", "value": {"not": "a list"}}], 422),
+    ([{"op": "remove", "path": "/options/5000"}], 422),
+])
+def test_patch_field_rejections_leave_field_unchanged(client, select_field, patch, status):
+    response = client.patch(f"/api/fields/{select_field['id']}", json=patch)
+    assert response.status_code == status
+    assert len(client.get(f"/api/fields/{select_field['id']}").json()["options"]) == 3000
+
+
+def test_patch_unknown_field(client):
+    assert client.patch("/api/fields/missing", json=[]).status_code == 404
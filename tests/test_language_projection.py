@@ -0,0 +1,69 @@
+import pytest
+
+import dependency_engine
+from sql_instrumentation import capture_queries
+
+
+@pytest.fixture
+def template(client):
+    select = client.post("/api/fields", json={
+        "name": {"de": "Grösse", "fr": "Taille", "it": "Dimensione"}, "type": "select", "select_type": "radio",
+        "options": [{"id": "s", "value": "small", "label": {"de": "Klein", "fr": "Petite", "it": ""}},
+                    {"id": "m", "value": "medium", "label": {"de": "Mittel", "fr": "", "it": ""}}],
+    }).json()
+    german_only = client.post("/api/fields", json={"name": {"de": "Nur Deutsch"}, "type": "text"}).json()
+    template = client.post("/api/templates", json={
+        "name": {"de": "Antrag", "fr": "Demande"}, "description": {"de": "Beschreibung"}
+    }).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": [select["id"], german_only["id"]]})
+    return template
+
+
+def _select_field(rendered):
+    return next(field for field in rendered["fields"] if field["type"] == "select")
+
+
+def _render(client, template, **request):
+    response = client.post("/api/templates/render", json={"template_ids": [template["id"]], "role": "klient", **request})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_projected_render_resolves_fallback(client, template):
+    rendered = _render(client, template, language="fr", project_language=True)["templates"][0]
+    assert rendered["language"] == "fr"
+    assert rendered["name"] == "Demande"
+    assert rendered["description"] == "Beschreibung"
+    assert sorted(field["name"] for field in rendered["fields"]) == ["Nur Deutsch", "Taille"]
+    assert [option["label"] for option in _select_field(rendered)["options"]] == ["Petite", "Mittel"]
+
+
+def test_fallback_chain_is_configurable(client, template, monkeypatch):
+    monkeypatch.setattr(dependency_engine, "LANGUAGE_FALLBACK", ["fr", "de"])
+    rendered = _render(client, template, language="it", project_language=True)["templates"][0]
+    assert rendered["name"] == "Demande"
+    assert [option["label"] for option in _select_field(rendered)["options"]] == ["Petite", "Mittel"]
+
+
+def test_default_render_keeps_all_languages(client, template):
+    projected = _render(client, template, language="de", project_language=True)
+    rendered = _render(client, template, language="de")["templates"][0]
+    assert rendered["name"] == {"de": "Antrag", "fr": "Demande"}
+    assert _select_field(rendered)["name"] == {"de": "Grösse", "fr": "Taille", "it": "Dimensione"}
+    # Projection must not leak into the stored options or the full-language cache entry
+    assert _select_field(rendered)["options"][0]["label"] == {"de": "Klein", "fr": "Petite", "it": ""}
+    assert _select_field(projected["templates"][0])["options"][0]["label"] == "Klein"
+    assert "language" not in rendered
+
+
+def test_text_queries_do_not_grow_with_field_count(client, template):
+    for i in range(20):
+        field = client.post("/api/fields", json={"name": {"de": f"Feld {i}"}, "type": "text"}).json()
+        template_fields = client.get(f"/api/templates/{template['id']}").json()["fields"]
+        client.put(f"/api/templates/{template['id']}", json={"fields": template_fields + [field["id"]]})
+
+    with capture_queries() as stats:
+        rendered = _render(client, template, language="de", project_language=True)
+    assert len(rendered["fields"]) == 22
+    text_queries = [s for s in stats.statements if "FROM multilanguage_texts" in s]
+    assert len(text_queries) == 3
@@ -0,0 +1,33 @@
+import metrics
+
+
+def test_histogram_exposition():
+    histogram = metrics.Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+    lines = histogram.samples()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+
+
+def test_metrics_endpoint_reports_routes_sql_and_caches(client):
+    field = client.post("/api/fields", json={"name": {"de": "A"}, "type": "text"}).json()
+    client.get(f"/api/fields/{field['id']}")
+    client.get(f"/api/fields/{field['id']}")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/fields/{field_id}",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/fields/{field_id}",le="+Inf"}' in body
+    assert 'http_requests_in_flight{method="GET"} 1' in body
+    assert 'http_request_sql_statements_count{method="POST",route="/api/fields"}' in body
+    assert 'cache_hit_ratio{cache="render"}' in body
+
+    sql_sum = [line for line in body.splitlines()
+               if line.startswith('http_request_sql_statements_sum{method="POST",route="/api/fields"}')]
+    assert float(sql_sum[0].split()[-1]) > 0
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect
+
+import database
+from database import Base, SCHEMA_REVISION, current_schema_revision, ensure_schema
+
+BACKEND_DIR = Path(database.__file__).parent
+
+# Import plus startup of an up-to-date worker must stay below this budget
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", "3.0"))
+
+
+def test_schema_revision_matches_alembic_head():
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    assert ScriptDirectory.from_config(config).get_current_head() == SCHEMA_REVISION
+
+
+def test_migrations_match_models(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/migrated.db")
+    assert ensure_schema(engine) is True
+    assert current_schema_revision(engine) == SCHEMA_REVISION
+    with engine.connect() as conn:
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+
+
+def test_pre_migration_database_is_stamped(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    Base.metadata.create_all(engine)
+    assert current_schema_revision(engine) is None
+    ensure_schema(engine)
+    assert current_schema_revision(engine) == SCHEMA_REVISION
+    assert "alembic_version" in inspect(engine).get_table_names()
+
+
+def test_startup_within_budget_without_heavy_imports(tmp_path):
+    script = textwrap.dedent("""
+        import sys, time
+        started = time.perf_counter()
+        import server
+        from fastapi.testclient import TestClient
+        with TestClient(server.app):
+            pass
+        elapsed = time.perf_counter() - started
+        heavy = [m for m in ("alembic", "pandas", "numpy") if m in sys.modules]
+        print(f"{elapsed} {','.join(heavy)}")
+    """)
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path}/startup.db"}
+
+    def boot():
+        result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+        elapsed, _, heavy = result.stdout.strip().splitlines()[-1].partition(" ")
+        return float(elapsed), heavy
+
+    # First boot migrates the empty database and needs Alembic
+    _, heavy = boot()
+    assert "alembic" in heavy
+    # Later boots only compare the revision
+    elapsed, heavy = boot()
+    assert heavy == ""
+    assert elapsed < STARTUP_BUDGET_SECONDS, f"Startup took {elapsed:.2f}s (budget {STARTUP_BUDGET_SECONDS}s)"
@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from offload import BoundedExecutor, ExecutorSaturated
+
+
+def test_queue_depth_and_rejection():
+    executor = BoundedExecutor(workers=1, max_queue=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+        return "heavy"
+
+    async def scenario():
+        heavy = asyncio.ensure_future(executor.run(block))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        waiting = asyncio.ensure_future(executor.run(lambda: "queued"))
+        await asyncio.sleep(0)
+        depth = executor.stats()["queued"], executor.stats()["running"]
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(lambda: "rejected")
+        release.set()
+        return depth, await heavy, await waiting
+
+    (depth, heavy, waiting) = asyncio.run(scenario())
+    executor.shutdown()
+    assert depth == (1, 1)
+    assert (heavy, waiting) == ("heavy", "queued")
+    stats = executor.stats()
+    assert stats["queued"] == 0 and stats["running"] == 0
+    assert (stats["completed"], stats["rejected"], stats["max_queued"]) == (2, 1, 1)
+
+
+def test_event_loop_stays_responsive():
+    executor = BoundedExecutor(workers=2, max_queue=10)
+    release = threading.Event()
+    served = []
+
+    async def cheap():
+        await asyncio.sleep(0.01)
+        served.append(release.is_set())
+
+    async def scenario():
+        heavy = asyncio.ensure_future(executor.run(release.wait, 5))
+        await cheap()
+        release.set()
+        await heavy
+
+    asyncio.run(scenario())
+    executor.shutdown()
+    # The cheap request finished while the heavy one was still running
+    assert served == [False]
+
+
+def test_calls_see_the_callers_context():
+    request_id = contextvars.ContextVar("request_id", default=None)
+    executor = BoundedExecutor(workers=1, max_queue=1)
+
+    async def scenario():
+        request_id.set("r1")
+        return await executor.run(request_id.get)
+
+    assert asyncio.run(scenario()) == "r1"
+    executor.shutdown()
+
+
+def test_offloaded_endpoints(client, app):
+    field = client.post("/api/fields", json={"name": {"de": "PLZ"}, "type": "text",
+                                             "validation": {"custom": {"expression": "len(value) == 4",
+                                                                        "message": "Vier Ziffern"}}}).json()["id"]
+    template = client.post("/api/templates", json={"name": {"de": "Antrag"}}).json()["id"]
+    client.put(f"/api/templates/{template}", json={"fields": [field]})
+
+    response = client.post("/api/validate-fields", json={"values": {field: "80"}, "template_id": template})
+    assert response.json()["fields"][field]["valid"] is False
+    assert client.post("/api/validate-fields", json={"values": {}, "template_id": "gone"}).status_code == 404
+    render = client.post("/api/templates/render", json={"template_ids": [template], "role": "admin"})
+    assert [f["id"] for f in render.json()["fields"]] == [field]
+    simulated = client.post(f"/api/templates/simulate?template_id={template}&role=admin", json={})
+    assert simulated.json()["visible_field_count"] == 1
+
+    metrics = client.get("/metrics").text
+    assert "offload_completed_total 4" in metrics and "offload_queue_depth 0" in metrics
+
+    # A full backlog is answered with 503 instead of queueing
+    app.state.offload_executor.max_queue = 0
+    response = client.post("/api/templates/simulate?template_id=gone&role=admin", json={})
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+
+
+def test_render_uses_its_own_session(client, app):
+    template = client.post("/api/templates", json={"name": {"de": "Antrag"}}).json()["id"]
+    opened = []
+    factory = app.state.session_factory
+
+    def tracked():
+        session = factory()
+        opened.append(session)
+        return session
+
+    app.state.session_factory = tracked
+    body = {"template_ids": [template], "role": "admin"}
+    assert client.post("/api/templates/render", json=body).status_code == 200
+    assert client.post("/api/templates/render", json=body).status_code == 200
+    # Only the miss rendered, and its session was closed afterwards
+    assert len(opened) == 1
+    assert not opened[0].in_transaction()
@@ -0,0 +1,88 @@
+import pytest
+
+from database import RenderArtifact
+from sql_instrumentation import capture_queries
+
+
+@pytest.fixture
+def template(client):
+    public = client.post("/api/fields", json={
+        "name": {"de": "Name", "fr": "Nom"}, "type": "text",
+        "role_config": {"admin": {"visible": True, "requirement": "required"}},
+    }).json()
+    specific = client.post("/api/fields", json={"name": {"de": "Nur Kunde"}, "type": "text"}).json()
+    client.put(f"/api/fields/{specific['id']}", json={"customer_specific": True, "visible_for_customers": ["c1"]})
+    hidden = client.post("/api/fields", json={
+        "name": {"de": "Intern"}, "type": "text", "role_config": {"klient": {"visible": False}},
+    }).json()
+    template = client.post("/api/templates", json={"name": {"de": "Antrag", "fr": "Demande"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": [public["id"], specific["id"], hidden["id"]]})
+    template["field_ids"] = {"public": public["id"], "specific": specific["id"], "hidden": hidden["id"]}
+    return template
+
+
+def _render(client, template, **request):
+    response = client.post("/api/templates/render", json={"template_ids": [template["id"]], **request})
+    assert response.status_code == 200
+    return response.json()
+
+
+def _sorted(rendered):
+    for entry in rendered["templates"]:
+        entry["fields"].sort(key=lambda field: field["id"])
+    rendered["fields"].sort(key=lambda field: field["id"])
+    return rendered
+
+
+@pytest.mark.parametrize("request_", [
+    {"role": "klient"},
+    {"role": "admin"},
+    {"role": "anmelder", "customer_id": "c1"},
+    {"role": "klient", "customer_id": "unknown"},
+    {"role": "admin", "customer_id": "c1", "language": "fr", "project_language": True},
+])
+def test_published_render_matches_draft_at_publish_time(client, template, request_):
+    published = client.post(f"/api/templates/{template['id']}/publish").json()
+    assert published["version"] == 1 and published["customers"] == ["c1"]
+    assert _sorted(_render(client, template, published=True, **request_)) == _sorted(_render(client, template, **request_))
+
+
+def test_published_version_is_frozen(client, db, template):
+    client.post(f"/api/templates/{template['id']}/publish")
+    public_id = template["field_ids"]["public"]
+    client.put(f"/api/fields/{public_id}", json={"name": {"de": "Neuer Name"}})
+
+    draft = _render(client, template, role="klient")
+    published = _render(client, template, role="klient", published=True)
+    names = {field["id"]: field["name"] for field in published["fields"]}
+    assert names[public_id] == {"de": "Name", "fr": "Nom"}
+    assert {field["id"]: field["name"] for field in draft["fields"]}[public_id]["de"] == "Neuer Name"
+    # Role overrides applied while publishing were not written back
+    assert client.get(f"/api/fields/{public_id}").json()["requirement"] == "optional"
+
+    second = client.post(f"/api/templates/{template['id']}/publish").json()
+    assert second["version"] == 2
+    assert [version["version"] for version in client.get(f"/api/templates/{template['id']}/versions").json()] == [2, 1]
+    snapshot = client.get(f"/api/templates/{template['id']}/versions/1").json()["snapshot"]
+    assert snapshot["fields"][public_id]["name"] == {"de": "Name", "fr": "Nom"}
+    old = client.get(f"/api/templates/{template['id']}/versions/1/render", params={"role": "klient"}).json()
+    assert {field["id"]: field["name"] for field in old["fields"]}[public_id]["de"] == "Name"
+    # 3 roles x (no customer + c1) x (all languages + de, fr, it) per version
+    assert db.query(RenderArtifact).count() == 2 * 3 * 2 * 4
+
+
+def test_published_render_is_one_lookup(client, template):
+    client.post(f"/api/templates/{template['id']}/publish")
+    with capture_queries() as stats:
+        _render(client, template, role="klient", customer_id="c1", published=True)
+    selects = [statement for statement in stats.statements if statement.startswith("SELECT")]
+    assert len(selects) == 2
+    assert "render_artifacts" in selects[-1]
+
+
+def test_unpublished_templates_are_404(client, template):
+    response = client.post("/api/templates/render", json={"template_ids": [template["id"]], "role": "klient",
+                                                          "published": True})
+    assert response.status_code == 404
+    assert client.post("/api/templates/missing/publish").status_code == 404
+    assert client.get(f"/api/templates/{template['id']}/versions/1/render", params={"role": "klient"}).status_code == 404
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+import safe_regex
+from advanced_validation import StringValidationRule
+from conditions import evaluate_condition
+from safe_regex import (RegexEngineUnavailable, RegexInputTooLong, RegexTimeout, UnsafePatternError,
+                        pattern_problems, safe_match, vet_pattern)
+
+
+@pytest.mark.parametrize("pattern", [
+    r"^(a+)+$",
+    r"(\w+\s?)+$",
+    r"(.*,)*x",
+    r"^(x+x+)+y",
+    r"(a)\1",
+    r"(a|aa)+$",
+    r"^(a{1,30}){1,30}$",
+    r"(.*,){12}x",
+    r"^(a?){25}a{25}$",
+    r"[",
+    "a" * 2000,
+])
+def test_unsafe_patterns_are_rejected(pattern):
+    assert pattern_problems(pattern)
+    with pytest.raises(UnsafePatternError):
+        vet_pattern(pattern)
+
+
+@pytest.mark.parametrize("pattern", [
+    r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+$",
+    r"^([a-z]+\.)*[a-z]+$",
+    r"^(\d+-)*\d+$",
+    r"^\d{4}-\d{2}-\d{2}$",
+    r"^CH\d{2}(?: ?[0-9A-Z]{4}){4}[0-9A-Z]$",
+    r"^.*\.pdf$",
+    r"^\s*\S+\s*$",
+    r"^(?>a+)+$",
+    r"^(?:a++)+$",
+    r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$",
+    r"^[^@\s]+@[^@\s]+\.[a-z]{2,}$",
+    r"^\w+([.-]\w+)*@\w+([.-]\w+)*\.\w{2,}$",
+    r"^\+?\d+(?:[ -]\d+)*$",
+])
+def test_linear_patterns_pass(pattern):
+    assert pattern_problems(pattern, polynomial=True) == []
+
+
+@pytest.mark.parametrize("pattern", [r"\d+\d+x", r"^\w+\s*\w+$"])
+def test_polynomial_patterns_run_with_a_time_limit(pattern):
+    assert pattern_problems(pattern) == []
+    assert pattern_problems(pattern, polynomial=True) == ["adjacent quantifiers over overlapping characters"]
+    safe_match(pattern, "a" * 1000)
+
+
+def test_builtin_email_pattern_validates():
+    email = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
+    rule = StringValidationRule("string", {"pattern": email})
+    assert rule.validate("info@example.ch") == {"valid": True, "errors": []}
+    assert not rule.validate("info@example")["valid"]
+
+
+def test_safe_match_refuses_unsafe_patterns_quickly():
+    started = time.perf_counter()
+    with pytest.raises(UnsafePatternError):
+        safe_match(r"^(a+)+$", "a" * 40 + "!")
+    assert time.perf_counter() - started < 0.5
+    assert safe_regex.failure_counts()["unsafe"] >= 1
+    assert safe_match(r"^\d{4}$", "2024") and not safe_match(r"^\d{4}$", "24")
+
+
+def test_failure_counts_are_thread_safe():
+    before = safe_regex.failure_counts().get("input_too_long", 0)
+
+    def record():
+        for _ in range(2000):
+            safe_regex._record("input_too_long")
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert safe_regex.failure_counts()["input_too_long"] - before == 16000
+
+
+def test_input_length_is_capped(monkeypatch):
+    monkeypatch.setattr(safe_regex, "REGEX_MAX_INPUT_LENGTH", 10)
+    with pytest.raises(RegexInputTooLong):
+        safe_match(r"^a*$", "a" * 11)
+
+
+def test_matching_is_time_limited():
+    # Bypasses the vetting, which is a heuristic
+    matcher = safe_regex._matcher(r"^(a|aa)+$")
+    started = time.perf_counter()
+    with pytest.raises(RegexTimeout):
+        matcher("a" * 40 + "!")
+    assert time.perf_counter() - started < 1
+
+
+def test_patterns_are_not_run_without_a_bounded_engine(monkeypatch):
+    monkeypatch.setattr(safe_regex, "re2", None)
+    monkeypatch.setattr(safe_regex, "regex", None)
+    safe_regex.compile_pattern.cache_clear()
+    try:
+        with pytest.raises(RegexEngineUnavailable):
+            safe_match(r"^\d{4}$", "2024")
+        result = StringValidationRule("string", {"pattern": r"^\d{4}$"}).validate("2024")
+        assert not result["valid"]
+        assert safe_regex.engine_name() is None
+    finally:
+        safe_regex.compile_pattern.cache_clear()
+
+
+def test_runtime_callers_report_failures():
+    condition = {"field_id": "f", "operator": "regex_match", "condition_value": r"^(a+)+$"}
+    assert evaluate_condition(condition, {"f": "a" * 40 + "!"}) is False
+    result = StringValidationRule("string", {"pattern": r"(\w+\s?)+$"}).validate("a b c")
+    assert result == {"valid": False, "errors": ["Invalid pattern configuration"]}
+    assert StringValidationRule("string", {"pattern": r"^\d+$"}).validate("12")["valid"]
+
+
+def test_patterns_are_vetted_on_save(client):
+    field = client.post("/api/fields", json={"name": {"de": "Code"}, "type": "text",
+                                             "validation": {"pattern": r"^(a+)+$"}})
+    assert field.status_code == 422 and "nested quantifiers" in field.json()["detail"]
+    field = client.post("/api/fields", json={"name": {"de": "Code"}, "type": "text",
+                                             "validation": {"pattern": r"^[A-Z]{3}$"}}).json()
+    response = client.put(f"/api/fields/{field['id']}", json={"validation": {"string": {"pattern": r"(.*,)*x"}}})
+    assert response.status_code == 422
+
+    other = client.post("/api/fields", json={"name": {"de": "Name"}, "type": "text"}).json()
+    response = client.put(f"/api/fields/{other['id']}", json={"dependencies": [
+        {"field_id": field["id"], "operator": "regex_match", "condition_value": r"(a|aa)+x"}]}).json()
+    assert [issue["code"] for issue in response["dependency_issues"]] == ["invalid_pattern", "never_met"]
+    assert 'regex_failures_total' in client.get("/metrics").text
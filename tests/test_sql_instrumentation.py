@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+from sql_instrumentation import QueryStatsMiddleware, assert_max_queries, capture_queries
+
+
+def _template_with_fields(client, count):
+    field_ids = [
+        client.post("/api/fields", json={"name": {"de": f"F{i}"}, "type": "text"}).json()["id"]
+        for i in range(count)
+    ]
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": field_ids})
+    return template["id"], field_ids
+
+
+def test_assert_max_queries_reports_statements(client):
+    with pytest.raises(AssertionError, match="Expected at most 0 SQL statements"):
+        with assert_max_queries(0):
+            client.get("/api/fields")
+
+
+def test_get_field_query_budget(client):
+    _, field_ids = _template_with_fields(client, 1)
+    with assert_max_queries(4):
+        assert client.get(f"/api/fields/{field_ids[0]}").status_code == 200
+
+
+def test_capture_records_timing(client):
+    with capture_queries() as stats:
+        client.get("/api/templates")
+    assert stats.count >= 1
+    assert stats.total_time >= stats.slowest_time > 0
+    assert stats.slowest_statement.lstrip().upper().startswith("SELECT")
+
+
+def test_headers_are_opt_in(client):
+    assert "x-sql-statements" not in client.get("/api/fields").headers
+
+    middleware = client.app.middleware_stack
+    while not isinstance(middleware, QueryStatsMiddleware):
+        middleware = middleware.app
+    middleware.headers_enabled = True
+    try:
+        response = client.get("/api/fields")
+    finally:
+        middleware.headers_enabled = False
+    assert int(response.headers["x-sql-statements"]) >= 1
+    assert float(response.headers["x-sql-time-ms"]) >= 0
+
+
+def test_slow_requests_are_logged(client, caplog, monkeypatch):
+    monkeypatch.setattr("sql_instrumentation.WARN_STATEMENTS", 0)
+    with caplog.at_level(logging.WARNING, logger="sql_instrumentation"):
+        client.get("/api/fields")
+    record = next(r for r in caplog.records if r.message.startswith("sql_stats"))
+    assert record.route == "/api/fields"
+    assert record.sql_statements >= 1
@@ -0,0 +1,66 @@
+from database import Field, MultiLanguageText, current_row_version
+
+
+def _sync(client, since):
+    response = client.get("/api/sync", params={"since": since})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_sync_returns_only_changes(client):
+    field = client.post("/api/fields", json={"name": {"de": "Feld"}, "type": "text"}).json()
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    full = _sync(client, 0)
+    assert [f["id"] for f in full["fields"]] == [field["id"]]
+    assert [t["id"] for t in full["templates"]] == [template["id"]]
+    assert {text["text_value"] for text in full["texts"]} == {"Feld", "T"}
+
+    assert _sync(client, full["version"]) == {"version": full["version"], "templates": [], "fields": [],
+                                              "texts": [], "deleted": []}
+
+    client.put(f"/api/fields/{field['id']}", json={"requirement": "required"})
+    delta = _sync(client, full["version"])
+    assert [f["requirement"] for f in delta["fields"]] == ["required"]
+    assert delta["templates"] == [] and delta["texts"] == []
+    assert delta["version"] > full["version"]
+
+
+def test_text_edits_and_membership_changes_are_versioned(client):
+    field = client.post("/api/fields", json={"name": {"de": "Feld"}, "type": "text"}).json()
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    since = _sync(client, 0)["version"]
+
+    client.put(f"/api/templates/{template['id']}", json={"fields": [field["id"]]})
+    client.put(f"/api/fields/{field['id']}", json={"name": {"fr": "Champ"}})
+    delta = _sync(client, since)
+    assert [t["fields"] for t in delta["templates"]] == [[field["id"]]]
+    assert [(text["entity_id"], text["language_code"], text["text_value"]) for text in delta["texts"]] == [
+        (field["id"], "fr", "Champ")
+    ]
+
+
+def test_deletes_leave_tombstones(client, db):
+    field = client.post("/api/fields", json={"name": {"de": "Feld", "fr": "Champ"}, "type": "text"}).json()
+    template = client.post("/api/templates", json={"name": {"de": "T"}}).json()
+    client.put(f"/api/templates/{template['id']}", json={"fields": [field["id"]]})
+    since = _sync(client, 0)["version"]
+    text_ids = {text.id for text in db.query(MultiLanguageText).filter(MultiLanguageText.entity_id == field["id"])}
+
+    client.delete(f"/api/fields/{field['id']}")
+    delta = _sync(client, since)
+    deleted = {(entry["entity_type"], entry["entity_id"]) for entry in delta["deleted"]}
+    assert deleted == {("field", field["id"])} | {("text", text_id) for text_id in text_ids}
+    # The template lost the field, so it is sent again
+    assert [t["fields"] for t in delta["templates"]] == [[]]
+    assert delta["fields"] == []
+
+
+def test_versions_increase_monotonically(client, db):
+    versions = []
+    for i in range(3):
+        client.post("/api/fields", json={"name": {"de": f"F{i}"}, "type": "text"})
+        versions.append(current_row_version(db))
+        db.rollback()
+    assert versions == sorted(set(versions))
+    assert all(field.row_version for field in db.query(Field))
+    assert client.get("/api/sync", params={"since": -1}).status_code == 422